@@ -0,0 +1,130 @@
+"""LLM 客户端连接池模块.
+
+按 (API Key, 基础URL) 复用 openai.AsyncOpenAI 客户端及其 HTTP 连接池，避免每次调用都重新建立 TLS 连接；
+同时缓存 API Key 对应的数据库记录ID，避免每次创建客户端都查询数据库.
+
+httpx 的连接池绑定在创建它的事件循环上，Web 进程和流水线工作器线程各自运行事件循环，因此客户端按事件循环分别缓存.
+"""
+
+import asyncio
+import importlib.util
+import logging
+import threading
+import time
+import weakref
+from typing import Dict, Optional, Tuple
+
+import httpx
+import openai
+
+from database import ApiKey, get_db
+
+logger = logging.getLogger(__name__)
+
+# 安装 h2 时启用 HTTP/2，多个并发请求复用同一条连接
+HTTP2_ENABLED = importlib.util.find_spec("h2") is not None
+
+MAX_CONNECTIONS = 100  # 每个客户端的最大连接数
+MAX_KEEPALIVE_CONNECTIONS = 20  # 每个客户端保持的空闲连接数
+KEEPALIVE_EXPIRY = 120.0  # 空闲连接保持时长（秒）
+API_KEY_CACHE_TTL = 300.0  # API Key 记录缓存时长（秒）
+
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Tuple[str, str], openai.AsyncOpenAI]]" = (
+    weakref.WeakKeyDictionary()
+)
+_clients_lock = threading.Lock()
+
+_api_key_ids: Dict[str, Tuple[Optional[int], float]] = {}
+_api_key_lock = threading.Lock()
+
+
+def get_async_openai(api_key: str, base_url: str) -> openai.AsyncOpenAI:
+    """获取当前事件循环中 (API Key, 基础URL) 对应的共享客户端.
+
+    客户端不做自动重试，限流和临时错误的重试由 LLM 调度器统一处理.
+
+    Args:
+        api_key: API Key
+        base_url: API 基础URL
+
+    Returns:
+        openai.AsyncOpenAI: 共享的客户端实例
+    """
+    loop = asyncio.get_running_loop()
+    with _clients_lock:
+        clients = _clients.setdefault(loop, {})
+        client = clients.get((api_key, base_url))
+        if client is None:
+            client = openai.AsyncOpenAI(
+                api_key=api_key,
+                base_url=base_url,
+                max_retries=0,
+                http_client=openai.DefaultAsyncHttpxClient(
+                    http2=HTTP2_ENABLED,
+                    limits=httpx.Limits(
+                        max_connections=MAX_CONNECTIONS,
+                        max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                        keepalive_expiry=KEEPALIVE_EXPIRY,
+                    ),
+                ),
+            )
+            clients[(api_key, base_url)] = client
+            logger.debug(f"创建 LLM 客户端: {base_url}（HTTP/2: {HTTP2_ENABLED}）")
+        return client
+
+
+async def close_clients():
+    """关闭当前事件循环中的全部共享客户端，在事件循环退出前调用."""
+    loop = asyncio.get_running_loop()
+    with _clients_lock:
+        clients = _clients.pop(loop, {})
+    for client in clients.values():
+        await client.close()
+
+
+def _cached_api_key_id(api_key: str) -> Tuple[bool, Optional[int]]:
+    """读取缓存的 API Key 记录ID，返回 (是否命中, 记录ID)."""
+    with _api_key_lock:
+        cached = _api_key_ids.get(api_key)
+        if cached and time.monotonic() - cached[1] < API_KEY_CACHE_TTL:
+            return True, cached[0]
+    return False, None
+
+
+def get_api_key_id(api_key: str) -> Optional[int]:
+    """获取 API Key 对应的数据库记录ID，结果缓存 API_KEY_CACHE_TTL 秒.
+
+    Args:
+        api_key: API Key
+
+    Returns:
+        Optional[int]: 记录ID，未登记的 API Key（如全局配置的 Key）返回 None
+    """
+    hit, api_key_id = _cached_api_key_id(api_key)
+    if hit:
+        return api_key_id
+
+    now = time.monotonic()
+    db = next(get_db())
+    try:
+        record = db.query(ApiKey.id).filter(ApiKey.key == api_key).first()
+    finally:
+        db.close()
+    api_key_id = record.id if record else None
+    with _api_key_lock:
+        _api_key_ids[api_key] = (api_key_id, now)
+    return api_key_id
+
+
+async def aget_api_key_id(api_key: str) -> Optional[int]:
+    """get_api_key_id 的异步版本：缓存命中时直接返回，未命中时在线程中查询数据库，不阻塞事件循环."""
+    hit, api_key_id = _cached_api_key_id(api_key)
+    if hit:
+        return api_key_id
+    return await asyncio.to_thread(get_api_key_id, api_key)
+
+
+def invalidate_api_key(api_key: str):
+    """API Key 记录变更后清除缓存."""
+    with _api_key_lock:
+        _api_key_ids.pop(api_key, None)
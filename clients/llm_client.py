@@ -3,6 +3,8 @@
 from abc import ABC, abstractmethod
 from typing import Literal
 
+DEFAULT_SYSTEM_PROMPT = "You are a helpful assistant"
+
 
 class LLMClient(ABC):
     """LLM客户端的抽象基类.
@@ -21,11 +23,12 @@ class LLMClient(ABC):
         self.base_url = base_url
 
     @abstractmethod
-    async def chat_with_text(self, message) -> dict:
+    async def chat_with_text(self, message, system_prompt: str = DEFAULT_SYSTEM_PROMPT) -> dict:
         """纯文本对话功能.
 
         Args:
             message: 用户输入的文本消息
+            system_prompt: 系统提示
 
         Returns:
             dict: 模型的回复
@@ -36,22 +39,28 @@ class LLMClient(ABC):
         self,
         message,
         image_data,
-        image_type: Literal["base64", "path"] = "base64",
+        image_type: Literal["base64", "path", "bytes"] = "base64",
+        mime_type: str = "image/jpeg",
     ) -> dict:
         """图片+文本对话功能.
 
         Args:
             message: 用户输入的文本消息
-            image_data: 图片数据（base64字符串或图片路径）
-            image_type: 图片数据类型（"base64"或"path"）
+            image_data: 图片数据（base64字符串、图片路径或二进制数据）
+            image_type: 图片数据类型（"base64"、"path"或"bytes"）
+            mime_type: 图片的MIME类型，用于构造 data URI
 
         Returns:
             dict: 模型的回复
         """
 
     @abstractmethod
-    async def update_api_key_usage(self):
-        """更新API密钥的使用情况."""
+    async def update_api_key_usage(self, usage=None):
+        """更新API密钥的使用情况.
+
+        Args:
+            usage: 本次调用的 token 用量，可选
+        """
 
     @abstractmethod
     async def update_api_key_error(self, error_message):
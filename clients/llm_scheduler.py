@@ -0,0 +1,320 @@
+"""LLM 调用调度模块.
+
+为进程内所有 LLM 调用（文本提取、翻译、对话）提供全局调度： 按 (API Key, 模型) 使用令牌桶限制请求速率，并发上限按 AIMD
+自适应调整——成功时缓慢增加， 收到 429 时减半并按 Retry-After 暂停；等待中的请求按优先级出队，交互式对话优先于后台任务.
+
+调度器状态由线程锁保护，可同时服务于 Web 事件循环和流水线工作器线程中的事件循环.
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+
+import openai
+
+from config import get_settings
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+T = TypeVar("T")
+
+
+class LLMPriority:
+    """LLM 调用优先级，数值越小越优先."""
+
+    INTERACTIVE = 0  # 交互式对话
+    BACKGROUND = 1  # 后台文档处理（文本提取、翻译）
+
+
+class _Waiter:
+    """等待调度的请求."""
+
+    __slots__ = ("priority", "seq", "loop", "event")
+
+    def __init__(self, priority: int, seq: int):
+        self.priority = priority
+        self.seq = seq
+        self.loop = asyncio.get_running_loop()
+        self.event = asyncio.Event()
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+    def wake(self):
+        """从任意线程唤醒该请求所在的事件循环."""
+        try:
+            self.loop.call_soon_threadsafe(self.event.set)
+        except RuntimeError:
+            # 事件循环已关闭，请求不会再等待
+            pass
+
+
+class RateLimiter:
+    """单个 (API Key, 模型) 的限流器.
+
+    令牌桶限制请求速率，并发上限按 AIMD 调整。同一时刻只有优先级最高、最早到达的请求可以领取名额，
+    其余请求排队等待，避免后台任务在限流恢复时抢占交互请求.
+    """
+
+    def __init__(self, requests_per_minute: int, max_concurrency: int, initial_concurrency: int):
+        """初始化限流器.
+
+        Args:
+            requests_per_minute: 每分钟允许的请求数（令牌桶速率和容量）
+            max_concurrency: 并发上限的最大值
+            initial_concurrency: 初始并发上限
+        """
+        self.rate = requests_per_minute / 60.0
+        self.capacity = float(max(1, requests_per_minute // 6))  # 允许约10秒的突发量
+        self.max_concurrency = max_concurrency
+        self.concurrency = float(min(initial_concurrency, max_concurrency))
+        self.tokens = self.capacity
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.decreased_at = 0.0
+        self.updated_at = time.monotonic()
+        self._waiters: List[_Waiter] = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    async def acquire(self, priority: int) -> float:
+        """等待并领取一个调用名额.
+
+        Args:
+            priority: 请求优先级，见 LLMPriority
+
+        Returns:
+            float: 领取时间，释放名额时传回 release
+        """
+        waiter = _Waiter(priority, next(self._seq))
+        with self._lock:
+            heapq.heappush(self._waiters, waiter)
+        try:
+            while True:
+                with self._lock:
+                    delay = self._try_grant(waiter)
+                    if delay == 0:
+                        heapq.heappop(self._waiters)
+                        self._wake_head()
+                        return time.monotonic()
+                    waiter.event.clear()
+                try:
+                    await asyncio.wait_for(waiter.event.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+        except BaseException:
+            with self._lock:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                    heapq.heapify(self._waiters)
+                self._wake_head()
+            raise
+
+    def release(self, acquired_at: float, rate_limited: bool = False, retry_after: Optional[float] = None):
+        """释放调用名额并按调用结果调整并发上限.
+
+        Args:
+            acquired_at: acquire 返回的领取时间
+            rate_limited: 调用是否收到 429
+            retry_after: 服务端要求的等待时间（秒）
+        """
+        with self._lock:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if rate_limited:
+                # 同一次拥塞中先前发出的请求陆续返回 429 时只减半一次
+                if acquired_at >= self.decreased_at:
+                    self.concurrency = max(1.0, self.concurrency / 2)
+                    self.decreased_at = now
+                    logger.warning(f"LLM 调用被限流，并发上限降为 {int(self.concurrency)}")
+                self.tokens = 0.0
+                self.paused_until = max(self.paused_until, now + (retry_after or 1.0))
+            else:
+                self.concurrency = min(float(self.max_concurrency), self.concurrency + 1 / self.concurrency)
+            self._wake_head()
+
+    def _try_grant(self, waiter: _Waiter) -> Optional[float]:
+        """检查请求能否立即领取名额，返回0表示已领取，否则返回建议的等待时间（None表示等待唤醒）."""
+        if self._waiters[0] is not waiter:
+            return None
+        now = time.monotonic()
+        if now < self.paused_until:
+            return self.paused_until - now
+        if self.in_flight >= int(self.concurrency):
+            return None
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        if self.tokens < 1:
+            return (1 - self.tokens) / self.rate
+        self.tokens -= 1
+        self.in_flight += 1
+        return 0
+
+    def _wake_head(self):
+        """唤醒队首请求重新检查名额（调用方需持有锁）."""
+        if self._waiters:
+            self._waiters[0].wake()
+
+
+class _LimitedStream:
+    """占用限流器名额的流式响应.
+
+    名额在流读取结束、出错、被关闭或对象被回收时释放，调用方从未开始读取（例如客户端在响应开始前断开）时也不会泄漏名额.
+    """
+
+    def __init__(self, stream: AsyncIterator[T], limiter: RateLimiter, acquired_at: float):
+        self._stream = stream
+        self._limiter = limiter
+        self._acquired_at = acquired_at
+        self._loop = asyncio.get_running_loop()
+        self._released = False
+
+    def _release(self):
+        if not self._released:
+            self._released = True
+            self._limiter.release(self._acquired_at)
+
+    def __aiter__(self) -> "_LimitedStream":
+        return self
+
+    async def __anext__(self) -> T:
+        if self._released:
+            raise StopAsyncIteration
+        try:
+            return await self._stream.__anext__()
+        except BaseException:
+            self._release()
+            raise
+
+    async def aclose(self):
+        """释放名额并关闭底层的流."""
+        self._release()
+        close = getattr(self._stream, "aclose", None) or getattr(self._stream, "close", None)
+        if close is not None:
+            await close()
+
+    def __del__(self):
+        if self._released:
+            return
+        self._released = True
+        # 回收可能发生在持有限流器锁的代码中，交给事件循环释放，避免重入锁
+        try:
+            self._loop.call_soon_threadsafe(self._limiter.release, self._acquired_at)
+        except RuntimeError:
+            self._limiter.release(self._acquired_at)
+
+
+class LLMScheduler:
+    """全局 LLM 调用调度器，为每个 (API Key, 模型) 维护一个限流器，并负责限流和临时错误的重试."""
+
+    RETRYABLE_ERRORS = (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)
+
+    def __init__(self):
+        """初始化调度器."""
+        self._limiters: Dict[Tuple[str, str], RateLimiter] = {}
+        self._lock = threading.Lock()
+
+    def get_limiter(self, api_key: str, model: str) -> RateLimiter:
+        """获取 (API Key, 模型) 对应的限流器."""
+        with self._lock:
+            limiter = self._limiters.get((api_key, model))
+            if limiter is None:
+                limiter = RateLimiter(
+                    settings.LLM_REQUESTS_PER_MINUTE,
+                    settings.LLM_MAX_CONCURRENCY,
+                    settings.LLM_INITIAL_CONCURRENCY,
+                )
+                self._limiters[(api_key, model)] = limiter
+            return limiter
+
+    async def run(
+        self,
+        api_key: str,
+        model: str,
+        call: Callable[[], Awaitable[T]],
+        priority: int = LLMPriority.INTERACTIVE,
+    ) -> T:
+        """在限流器的调度下执行一次 LLM 调用，遇到限流或临时错误时退避重试.
+
+        Args:
+            api_key: 调用使用的 API Key
+            model: 调用使用的模型
+            call: 发起调用的无参协程函数，每次重试都会重新调用
+            priority: 请求优先级
+
+        Returns:
+            调用结果
+        """
+        limiter = self.get_limiter(api_key, model)
+        result, acquired_at = await self._call(limiter, call, priority)
+        limiter.release(acquired_at)
+        return result
+
+    async def stream(
+        self,
+        api_key: str,
+        model: str,
+        call: Callable[[], Awaitable[AsyncIterator[T]]],
+        priority: int = LLMPriority.INTERACTIVE,
+    ) -> AsyncIterator[T]:
+        """在限流器的调度下发起流式调用，名额一直占用到流读取结束、被关闭或被回收.
+
+        Args:
+            api_key: 调用使用的 API Key
+            model: 调用使用的模型
+            call: 创建流的无参协程函数
+            priority: 请求优先级
+
+        Returns:
+            AsyncIterator: 流式响应
+        """
+        limiter = self.get_limiter(api_key, model)
+        stream, acquired_at = await self._call(limiter, call, priority)
+        return _LimitedStream(stream, limiter, acquired_at)
+
+    async def _call(self, limiter: RateLimiter, call: Callable[[], Awaitable[T]], priority: int) -> Tuple[T, float]:
+        """领取名额并执行调用，失败时释放名额并重试；成功时返回结果和领取时间，名额由调用方释放."""
+        attempt = 0
+        while True:
+            acquired_at = await limiter.acquire(priority)
+            try:
+                return await call(), acquired_at
+            except self.RETRYABLE_ERRORS as e:
+                rate_limited = isinstance(e, openai.RateLimitError)
+                limiter.release(acquired_at, rate_limited=rate_limited, retry_after=self._retry_after(e))
+                attempt += 1
+                if attempt > settings.LLM_MAX_RETRIES:
+                    raise
+                if not rate_limited:
+                    # 429 的等待由限流器统一处理，其他临时错误按指数退避
+                    await asyncio.sleep(min(2**attempt, 30) * random.uniform(0.5, 1.0))
+                logger.info(f"LLM 调用失败，第 {attempt} 次重试: {str(e)}")
+            except BaseException:
+                limiter.release(acquired_at)
+                raise
+
+    @staticmethod
+    def _retry_after(error: Exception) -> Optional[float]:
+        """从错误响应的 Retry-After 头中读取等待时间."""
+        response = getattr(error, "response", None)
+        if response is None:
+            return None
+        try:
+            return float(response.headers.get("retry-after"))
+        except (TypeError, ValueError):
+            return None
+
+
+_scheduler = LLMScheduler()
+
+
+def get_llm_scheduler() -> LLMScheduler:
+    """获取进程内共享的 LLM 调度器."""
+    return _scheduler
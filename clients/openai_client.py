@@ -6,14 +6,16 @@
 import base64
 import logging
 import os
-from datetime import datetime
 from typing import List, Literal
 
-import openai
 from openai.types.chat import ChatCompletionMessageParam
 
-from clients.llm_client import LLMClient
-from database import ApiKey, get_db
+from clients.client_pool import aget_api_key_id, get_async_openai
+from clients.llm_client import DEFAULT_SYSTEM_PROMPT, LLMClient
+from clients.llm_scheduler import LLMPriority, get_llm_scheduler
+from clients.usage_tracker import get_usage_tracker
+from config import get_settings
+from models.users import User
 
 logger = logging.getLogger(__name__)
 
@@ -22,6 +24,8 @@ class OpenAIClient(LLMClient):
     """OpenAI API的客户端实现类.
 
     继承自LLMClient抽象基类，实现了与OpenAI API的具体交互逻辑， 包括文本对话、图像对话、流式对话等功能.支持自定义API密钥、 基础URL、模型选择、最大token数和温度等参数.
+    所有调用都经过全局 LLM 调度器，按 API Key 和模型统一限流，并按 priority 排队.
+    底层的 AsyncOpenAI 客户端和 API Key 记录来自 client_pool 的共享缓存，创建实例不会建立连接或查询数据库.
     """
 
     def __init__(
@@ -31,6 +35,7 @@ class OpenAIClient(LLMClient):
         model=None,
         max_tokens=None,
         temperature=None,
+        priority=LLMPriority.INTERACTIVE,
     ):
         """初始化OpenAI客户端."""
         self.api_key = api_key if api_key else os.getenv("OPENAI_API_KEY")
@@ -38,31 +43,27 @@ class OpenAIClient(LLMClient):
         self.model = model if model else os.getenv("OPENAI_MODEL", "gpt-4")
         self.max_tokens = max_tokens if max_tokens else None
         self.temperature = temperature if temperature else float(os.getenv("OPENAI_TEMPERATURE", "0.7"))
-
-        # 获取数据库会话
-        self.db = next(get_db())
-        self.api_model = self.db.query(ApiKey).filter(ApiKey.key == self.api_key).first()
+        self.priority = priority
+        self.scheduler = get_llm_scheduler()
 
         super().__init__(api_key, base_url)
 
-        # 创建 OpenAI 模型客户端
-        self.client = openai.AsyncOpenAI(
-            api_key=self.api_key,
-            base_url=self.base_url,
-            max_retries=64,
-        )
-
         # 使用相同的模型配置
         self.text_model = self.model
         self.vision_model = self.model
 
-    async def chat_with_text(self, message) -> dict:
-        """纯文本对话功能 :param message: 用户输入的文本消息 :return: 模型的回复."""
+    @property
+    def client(self):
+        """当前事件循环中共享的 AsyncOpenAI 客户端，限流和临时错误的重试由调度器统一处理."""
+        return get_async_openai(self.api_key, self.base_url)
+
+    async def chat_with_text(self, message, system_prompt: str = DEFAULT_SYSTEM_PROMPT) -> dict:
+        """纯文本对话功能 :param message: 用户输入的文本消息 :param system_prompt: 系统提示 :return: 模型的回复."""
         try:
             messages = [
                 {
                     "role": "system",
-                    "content": "You are a helpful assistant",
+                    "content": system_prompt,
                 },
                 {"role": "user", "content": message},
             ]
@@ -72,8 +73,8 @@ class OpenAIClient(LLMClient):
                 "max_tokens": self.max_tokens,
                 "temperature": self.temperature,
             }
-            response = await self.client.chat.completions.create(**request_params)
-            await self.update_api_key_usage()
+            response = await self._create(request_params)
+            await self.update_api_key_usage(response.usage)
             result = {"text": response.choices[0].message.content}
             return result
 
@@ -83,15 +84,15 @@ class OpenAIClient(LLMClient):
 
     async def test_connection(self, standard_model, advanced_model):
         """测试OpenAI连接是否有效."""
-        self.client.max_retries = 2
-        response = await self.client.chat.completions.create(
+        client = self.client.with_options(max_retries=2)
+        response = await client.chat.completions.create(
             model=standard_model,
             messages=[{"role": "user", "content": "Hello"}],
             max_tokens=500,
         )
         if response.choices[0].message.content is None:
             raise Exception("标准模型测试失败")
-        response = await self.client.chat.completions.create(
+        response = await client.chat.completions.create(
             model=advanced_model,
             messages=[{"role": "user", "content": "Hello"}],
             max_tokens=500,
@@ -104,7 +105,8 @@ class OpenAIClient(LLMClient):
         self,
         message,
         image_data,
-        image_type: Literal["base64", "path"] = "base64",
+        image_type: Literal["base64", "path", "bytes"] = "base64",
+        mime_type: str = "image/jpeg",
     ):
         """图片+文本对话功能，使用 messages 模式 注：处理完图片后，将其作为文本传递."""
         try:
@@ -128,9 +130,12 @@ class OpenAIClient(LLMClient):
                 # 读取文件并转换为base64 URL
                 with open(image_data, "rb") as img_file:
                     img_data = base64.b64encode(img_file.read()).decode()
-                    image_url = f"data:image/jpeg;base64,{img_data}"
+                    image_url = f"data:{mime_type};base64,{img_data}"
+            elif image_type == "bytes":
+                # 直接编码内存中的图片数据，无需落盘
+                image_url = f"data:{mime_type};base64,{base64.b64encode(image_data).decode()}"
             else:
-                return {"error": "不支持的图片类型，请使用 base64 或 path"}
+                return {"error": "不支持的图片类型，请使用 base64、path 或 bytes"}
 
             messages = [
                 {
@@ -151,23 +156,39 @@ class OpenAIClient(LLMClient):
                 "max_tokens": self.max_tokens,
                 "temperature": self.temperature,
             }
-            response = await self.client.chat.completions.create(**request_params)
-            await self.update_api_key_usage()
+            response = await self._create(request_params)
+            await self.update_api_key_usage(response.usage)
             return {"text": response.choices[0].message.content}
         except Exception as e:
             await self.update_api_key_error(str(e))
             return {"error": str(e)}
 
-    async def update_api_key_usage(self):
+    async def _create(self, request_params: dict):
+        """经调度器发起一次非流式调用."""
+        return await self.scheduler.run(
+            self.api_key,
+            request_params["model"],
+            lambda: self.client.chat.completions.create(**request_params),
+            self.priority,
+        )
+
+    async def update_api_key_usage(self, usage=None):
         """更新API密钥的使用统计信息.
 
-        每次成功调用API后更新计数器和最后使用时间. 如果API密钥模型不存在，则不执行任何操作.
+        每次成功调用API后记录调用次数、token 用量和最后使用时间，由使用统计汇总器定期批量写入数据库.
+        如果API密钥未登记，则不执行任何操作.
+
+        Args:
+            usage: 本次调用的 token 用量（响应中的 usage 字段），可选
         """
-        if not self.api_model:
+        api_key_id = await aget_api_key_id(self.api_key)
+        if not api_key_id:
             return
-        self.api_model.counter += 1
-        self.api_model.last_used_at = datetime.now()
-        self.db.commit()
+        get_usage_tracker().record_success(
+            api_key_id,
+            prompt_tokens=getattr(usage, "prompt_tokens", 0),
+            completion_tokens=getattr(usage, "completion_tokens", 0),
+        )
 
     async def update_api_key_error(self, error_message):
         """更新API密钥的错误信息.
@@ -175,24 +196,73 @@ class OpenAIClient(LLMClient):
         Args:
             error_message: 需要记录的错误信息
 
-        当API调用发生错误时，更新最后一次错误信息.
-        如果API密钥模型不存在，则不执行任何操作.
+        当API调用发生错误时，记录错误次数和最后一次错误信息，由使用统计汇总器定期批量写入数据库.
+        如果API密钥未登记，则不执行任何操作.
         """
-        if not self.api_model:
+        api_key_id = await aget_api_key_id(self.api_key)
+        if not api_key_id:
             return
-        self.api_model.last_error_message = error_message
-        self.db.commit()
+        get_usage_tracker().record_error(api_key_id, error_message)
 
     async def chat_stream(self, messages: List[ChatCompletionMessageParam]):
         """流式对话功能 :param messages: 用户输入的文本消息 :return: 模型的回复."""
-        response = await self.client.chat.completions.create(
-            model=self.text_model,
-            messages=messages,
-            stream=True,
-        )
-        return response
+        try:
+            response = await self.scheduler.stream(
+                self.api_key,
+                self.text_model,
+                lambda: self.client.chat.completions.create(
+                    model=self.text_model,
+                    messages=messages,
+                    stream=True,
+                ),
+                self.priority,
+            )
+        except Exception as e:
+            await self.update_api_key_error(str(e))
+            raise
+        return self._track_stream(response)
+
+    async def _track_stream(self, response):
+        """逐块转发流式响应，结束后记录使用统计；服务端在最后一块返回 usage 时一并记录 token 用量."""
+        usage = None
+        async for chunk in response:
+            usage = getattr(chunk, "usage", None) or usage
+            yield chunk
+        await self.update_api_key_usage(usage)
+
+
+def resolve_model(user: User, model: str = None) -> str:
+    """按全局LLM模式确定实际使用的模型名称，private 模式下默认使用用户配置的标准模型."""
+    if model:
+        return model
+    settings = get_settings()
+    if settings.GLOBAL_LLM == "private":
+        return user.ai_standard_model
+    return settings.LLM_STANDARD_MODEL
 
-    def __del__(self):
-        """确保在对象被销毁时关闭数据库连接."""
-        if hasattr(self, "db"):
-            self.db.close()
+
+def create_openai_client(user: User, model: str = None, priority: int = LLMPriority.INTERACTIVE) -> OpenAIClient:
+    """根据全局LLM模式创建OpenAI客户端.
+
+    Args:
+        user: 用户对象，private 模式下使用其 API 配置
+        model: 模型名称，默认为标准模型
+        priority: 调用优先级，后台任务使用 LLMPriority.BACKGROUND
+
+    Returns:
+        OpenAIClient: 客户端实例
+    """
+    settings = get_settings()
+    if settings.GLOBAL_LLM == "private":
+        return OpenAIClient(
+            api_key=user.ai_api_key,
+            base_url=user.ai_base_url,
+            model=resolve_model(user, model),
+            priority=priority,
+        )
+    return OpenAIClient(
+        api_key=settings.OPENAI_API_KEY,
+        base_url=settings.OPENAI_BASE_URL,
+        model=resolve_model(user, model),
+        priority=priority,
+    )
@@ -0,0 +1,175 @@
+"""API Key 使用统计模块.
+
+在内存中汇总每个 API Key 的调用次数、错误次数、token 用量和最后使用时间，由后台线程定期批量写入数据库，
+LLM 调用路径上不再有数据库写入. 同时保留进程启动以来的累计值，供监控接口查询.
+"""
+
+import atexit
+import logging
+import threading
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from typing import Dict, Optional
+
+from sqlalchemy import bindparam, func, update
+
+from config import get_settings
+from database import ApiKey, get_db
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+
+@dataclass
+class KeyUsage:
+    """单个 API Key 的使用统计."""
+
+    calls: int = 0
+    errors: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    last_used_at: Optional[datetime] = None
+    last_error_message: Optional[str] = None
+    last_error_at: Optional[datetime] = None
+
+    def merge(self, other: "KeyUsage"):
+        """合并另一份统计."""
+        self.calls += other.calls
+        self.errors += other.errors
+        self.prompt_tokens += other.prompt_tokens
+        self.completion_tokens += other.completion_tokens
+        if other.last_used_at and (not self.last_used_at or other.last_used_at > self.last_used_at):
+            self.last_used_at = other.last_used_at
+        if other.last_error_at and (not self.last_error_at or other.last_error_at > self.last_error_at):
+            self.last_error_at = other.last_error_at
+            self.last_error_message = other.last_error_message
+
+
+class UsageTracker:
+    """API Key 使用统计汇总器.
+
+    record_success/record_error 只更新内存中的计数，后台线程每隔 LLM_USAGE_FLUSH_INTERVAL 秒
+    把累积的增量在一个事务中批量写入 api_keys 表.
+    """
+
+    def __init__(self, flush_interval: float):
+        """初始化统计汇总器.
+
+        Args:
+            flush_interval: 写入数据库的间隔（秒）
+        """
+        self.flush_interval = flush_interval
+        self._pending: Dict[int, KeyUsage] = {}
+        self._totals: Dict[int, KeyUsage] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def record_success(self, api_key_id: int, prompt_tokens: int = 0, completion_tokens: int = 0):
+        """记录一次成功调用."""
+        self._record(
+            api_key_id,
+            KeyUsage(
+                calls=1,
+                prompt_tokens=prompt_tokens or 0,
+                completion_tokens=completion_tokens or 0,
+                last_used_at=datetime.now(),
+            ),
+        )
+
+    def record_error(self, api_key_id: int, error_message: str):
+        """记录一次失败调用."""
+        self._record(api_key_id, KeyUsage(errors=1, last_error_message=error_message, last_error_at=datetime.now()))
+
+    def _record(self, api_key_id: int, usage: KeyUsage):
+        with self._lock:
+            self._pending.setdefault(api_key_id, KeyUsage()).merge(usage)
+            self._totals.setdefault(api_key_id, KeyUsage()).merge(usage)
+        self._ensure_started()
+
+    def snapshot(self) -> Dict[int, dict]:
+        """返回进程启动以来各 API Key 的累计统计，键为 API Key 记录ID."""
+        with self._lock:
+            return {api_key_id: asdict(usage) for api_key_id, usage in self._totals.items()}
+
+    def pending_count(self) -> int:
+        """返回尚未写入数据库的 API Key 数量."""
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self):
+        """把累积的增量批量写入数据库，写入失败时增量会保留到下一次."""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return
+
+            params = [
+                {
+                    "b_id": api_key_id,
+                    "b_calls": usage.calls,
+                    "b_errors": usage.errors,
+                    "b_prompt_tokens": usage.prompt_tokens,
+                    "b_completion_tokens": usage.completion_tokens,
+                    "b_last_used_at": usage.last_used_at,
+                    "b_last_error_message": usage.last_error_message,
+                }
+                for api_key_id, usage in pending.items()
+            ]
+            table = ApiKey.__table__
+            stmt = (
+                update(table)
+                .where(table.c.id == bindparam("b_id"))
+                .values(
+                    counter=func.coalesce(table.c.counter, 0) + bindparam("b_calls"),
+                    error_counter=func.coalesce(table.c.error_counter, 0) + bindparam("b_errors"),
+                    prompt_tokens=func.coalesce(table.c.prompt_tokens, 0) + bindparam("b_prompt_tokens"),
+                    completion_tokens=func.coalesce(table.c.completion_tokens, 0) + bindparam("b_completion_tokens"),
+                    last_used_at=func.coalesce(bindparam("b_last_used_at"), table.c.last_used_at),
+                    last_error_message=func.coalesce(bindparam("b_last_error_message"), table.c.last_error_message),
+                )
+            )
+            db = next(get_db())
+            try:
+                db.execute(stmt, params)
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                logger.error(f"写入API密钥使用统计失败: {str(e)}")
+                with self._lock:
+                    for api_key_id, usage in pending.items():
+                        usage.merge(self._pending.get(api_key_id, KeyUsage()))
+                        self._pending[api_key_id] = usage
+            finally:
+                db.close()
+
+    def _ensure_started(self):
+        """首次记录时启动后台写入线程."""
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        atexit.register(self.stop)
+
+    def _run(self):
+        while not self._stopped.wait(self.flush_interval):
+            self.flush()
+
+    def stop(self):
+        """停止后台线程并写入剩余的统计."""
+        self._stopped.set()
+        self.flush()
+
+
+_tracker = UsageTracker(settings.LLM_USAGE_FLUSH_INTERVAL)
+
+
+def get_usage_tracker() -> UsageTracker:
+    """获取进程内共享的使用统计汇总器."""
+    return _tracker
@@ -37,6 +37,7 @@ class Settings(BaseSettings):
     # 任务处理设置
     TASK_PROCESSING_INTERVAL: int = 300  # 5分钟处理一次
     MAX_CONCURRENT_TASKS: int = 3  # 最大并发任务数
+    MAX_UPLOAD_SIZE_MB: int = 512  # 单个上传文件的大小上限（MB）
 
     # 邮件设置
     SMTP_SERVER: str = "smtp.gmail.com"
@@ -84,6 +85,60 @@ class Settings(BaseSettings):
     GLOBAL_LLM: Literal["public", "private"] = "public"
     DISABLE_KB_INDEXING: bool = False
 
+    # 文档处理流水线设置
+    # staged: 每个阶段处理完全部页面后再进入下一阶段
+    # streaming: 每页渲染完成后立即进入文本提取和翻译，各阶段通过有界队列衔接
+    PIPELINE_MODE: Literal["staged", "streaming"] = "streaming"
+    PIPELINE_QUEUE_SIZE: int = 8  # 流式模式下阶段间队列的最大长度
+    PIPELINE_OCR_WORKERS: int = 5  # 单个文档的文本提取并发数，全局并发由 LLM 调度器控制
+    PIPELINE_TRANSLATE_WORKERS: int = 3  # 单个文档的翻译并发数，全局并发由 LLM 调度器控制
+    # embedded: Web进程内运行处理工作器；external: Web进程只负责入队，由 `python manage.py worker` 处理
+    PIPELINE_WORKER_MODE: Literal["embedded", "external"] = "embedded"
+    PIPELINE_POLL_INTERVAL: float = 2.0  # 工作器轮询任务队列的间隔（秒）
+    PIPELINE_LEASE_SECONDS: int = 120  # 任务租约时长（秒），工作器失联超过该时长后任务可被其他工作器接管
+    PIPELINE_MAX_IN_FLIGHT: int = 0  # 所有工作器同时处理的文档数上限，0 表示只受各工作器并发数限制
+    PIPELINE_LARGE_DOCUMENT_MB: int = 20  # 超过该大小的文档以批量优先级排队，不阻塞普通上传
+    PIPELINE_PRIORITY_AGING_SECONDS: int = 600  # 任务每排队该时长提升一级优先级，避免低优先级任务饿死
+    PIPELINE_JOB_TIMEOUT: int = 0  # 单个任务每次执行的时限（秒），超时后任务失败，可从检查点重试；0 表示不限制
+    PIPELINE_STAGE_TIMEOUT: int = 0  # 单个阶段的时限（秒），0 表示不限制
+    RASTER_WORKERS: int = 0  # PDF 渲染进程数，0 表示使用 CPU 核数
+    OCR_RENDER_FORMAT: Literal["PNG", "JPEG", "WEBP"] = "JPEG"  # 文本提取页面图片的编码格式
+    OCR_RENDER_QUALITY: int = 85  # 文本提取页面图片的 JPEG/WebP 编码质量
+    OCR_RENDER_GRAYSCALE: bool = False  # 文本提取页面图片是否渲染为灰度图
+    OCR_RENDER_MIN_DPI: int = 150  # 文字稀疏页面（图表、标题页）的渲染 DPI
+    OCR_RENDER_DPI: int = 200  # 普通页面及无文字层的扫描页面的渲染 DPI
+    OCR_RENDER_MAX_DPI: int = 300  # 文字密集页面（小字号、多栏）的渲染 DPI
+    WORKSPACE_DIR: str = ""  # 任务临时文件根目录，为空时使用系统临时目录（内存模式下为 /dev/shm）
+    WORKSPACE_QUOTA_MB: int = 2048  # 单个任务临时文件的磁盘配额（MB），0 表示不限制
+    WORKSPACE_IN_MEMORY: bool = False  # 内存模式：页面图片不落盘，工作区放在 tmpfs
+    LIBREOFFICE_POOL_SIZE: int = 2  # 常驻 LibreOffice 实例数，即同时进行的 Office 文档转换数上限
+    LIBREOFFICE_CONVERT_TIMEOUT: int = 120  # 单个 Office 文档转换的超时时间（秒）
+    LIBREOFFICE_PYTHON: str = "/usr/bin/python3"  # 带 uno 模块的 Python 解释器，用于运行 unoserver
+    TEXT_LAYER_FAST_PATH: bool = True  # 文字层完整的页面直接提取文本，只有扫描页和图表页交给视觉模型
+    TRANSLATE_BATCH_TOKENS: int = 2000  # 每个翻译请求的原文 token 预算，短页面合并翻译，超长页面拆分翻译
+    TRANSLATE_OVERLAP_CHARS: int = 300  # 每个翻译请求附带的前文字符数，用于翻译跨页断开的句子
+    PAGE_CACHE_ENABLED: bool = True  # 按页面内容哈希缓存文本提取和翻译结果，重复页面不再调用模型
+    KEYWORD_EXTRACTOR: Literal["local", "llm", "none"] = "local"  # 逐页关键词提取方式，llm 按批调用文本模型
+    KEYWORDS_PER_PAGE: int = 7  # 每页提取的关键词数
+    KEYWORD_LLM_BATCH_PAGES: int = 10  # llm 方式每个请求包含的页数
+    EMBEDDING_CACHE_ENABLED: bool = True  # 按文本哈希缓存向量，所有命名空间共享，重复内容不再调用嵌入模型
+
+    # 知识库实例缓存设置：搜索和写入复用已初始化的知识库实例及其数据库连接
+    KB_CACHE_SIZE: int = 32  # 每个事件循环缓存的知识库实例数上限，超过时关闭最久未使用的实例
+    KB_CACHE_IDLE_SECONDS: int = 900  # 知识库实例空闲超过该时长（秒）后关闭，0 表示不按空闲时间关闭
+
+    # 知识库批量重建索引设置（python manage.py reindex）
+    REINDEX_CONCURRENCY: int = 4  # 同时写入知识库的文档数
+    REINDEX_DOCUMENTS_PER_MINUTE: int = 300  # 每分钟写入的文档数上限，避免触发嵌入服务限流
+    REINDEX_BATCH_SIZE: int = 200  # 每次从数据库读取的文档数
+
+    # LLM 调用调度设置：按 (API Key, 模型) 全局限流，进程内所有文本提取、翻译和对话请求共享
+    LLM_REQUESTS_PER_MINUTE: int = 600  # 每分钟请求数上限（令牌桶速率）
+    LLM_MAX_CONCURRENCY: int = 16  # 并发上限的最大值，收到 429 时自动减半，成功时逐步恢复
+    LLM_INITIAL_CONCURRENCY: int = 8  # 初始并发上限
+    LLM_MAX_RETRIES: int = 5  # 限流或临时错误的最大重试次数
+    LLM_USAGE_FLUSH_INTERVAL: float = 10.0  # API Key 使用统计批量写入数据库的间隔（秒）
+
     # 注册控制：内网域名白名单
     # INTERNAL_REGISTRATION_HOSTS 为空 -> 允许任何 Host 访问注册接口（public 注册）
     # 非空 -> 只有 Host 在该列表中的请求才允许注册
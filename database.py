@@ -12,6 +12,7 @@ from alembic.operations import Operations
 from typing import Optional, Dict, Any, List
 from sqlalchemy import (
     JSON,
+    BigInteger,
     Boolean,
     Column,
     DateTime,
@@ -22,12 +23,14 @@ from sqlalchemy import (
     String,
     Table,
     Text,
+    UniqueConstraint,
     create_engine,
     inspect,
     text,
 )
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import Mapped, mapped_column, relationship, sessionmaker
+from sqlalchemy.schema import CreateIndex
 
 from config import get_settings
 
@@ -67,6 +70,51 @@ class ProcessingStatus(enum.Enum):
     FAILED = "failed"
 
 
+class JobStatus(enum.Enum):
+    """文档处理任务状态枚举类.
+
+    定义了处理任务的各个状态：
+    - QUEUED: 排队中（包括中断后等待恢复的任务）
+    - RUNNING: 执行中
+    - COMPLETED: 已完成
+    - FAILED: 已失败，重试时从检查点继续
+    """
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
+class JobStage:
+    """文档处理任务阶段定义类.
+
+    定义了处理流水线的阶段常量：
+    - RENDER: 渲染页面图片
+    - EXTRACT: 从页面图片中提取文本
+    - TRANSLATE: 翻译页面文本
+    - INDEX: 保存到知识库
+    """
+
+    RENDER = "render"
+    EXTRACT = "extract"
+    TRANSLATE = "translate"
+    INDEX = "index"
+
+
+class JobPriority:
+    """文档处理任务优先级定义类，数值越小越优先.
+
+    - INTERACTIVE: 用户手动重试或重新处理的文档
+    - NORMAL: 普通上传的文档
+    - BULK: 大文档、批量重新处理和启动时补登记的任务
+    """
+
+    INTERACTIVE = 0
+    NORMAL = 1
+    BULK = 2
+
+
 # 会话和文档的多对多关系表
 conversation_documents = Table(
     "conversation_documents",
@@ -118,6 +166,10 @@ class ApiKey(Base):
     last_used_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
     last_error_message: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
     counter: Mapped[int] = mapped_column(Integer, default=0)
+    # 以下统计由 clients.usage_tracker 定期批量写入
+    error_counter: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    prompt_tokens: Mapped[int] = mapped_column(BigInteger, default=0, server_default="0")
+    completion_tokens: Mapped[int] = mapped_column(BigInteger, default=0, server_default="0")
 
     # 添加外键关联
     user_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.id", ondelete="CASCADE"))
@@ -128,7 +180,7 @@ class ApiKey(Base):
 class ProcessingRecord(Base):
     """文档处理记录模型类.
 
-    记录文档处理的历史记录，包括处理版本和配置信息.
+    记录文档处理的历史记录，包括处理版本、配置信息和各阶段的版本戳.
     """
 
     __tablename__ = "processing_records"
@@ -139,12 +191,74 @@ class ProcessingRecord(Base):
     version: Mapped[int] = mapped_column(Integer, default=1)  # 处理版本号
     processor_version: Mapped[str] = mapped_column(String)  # 处理器版本
     processing_config: Mapped[Dict[str, Any]] = mapped_column(JSON)  # 处理配置
+    # 各阶段的版本和输入哈希，重新处理时据此判断哪些阶段和页面需要重新执行
+    stage_stamps: Mapped[Optional[Dict[str, Any]]] = mapped_column(JSON, nullable=True)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now)
 
     # 关系
     document = relationship("Document", back_populates="processing_records")
 
 
+class ProcessingJob(Base):
+    """文档处理任务模型类.
+
+    持久化记录一次文档处理任务的状态、已完成的阶段和各阶段已完成的页码（检查点）.
+    服务重启或任务失败后，从最后完成的阶段和页面继续处理，已完成的页面不会重复调用模型.
+    """
+
+    __tablename__ = "processing_jobs"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    document_id: Mapped[int] = mapped_column(Integer, ForeignKey("documents.id"), index=True)
+    # 文档所有者，用于在用户之间公平调度；任务表新增该列之前创建的任务为空
+    owner_id: Mapped[Optional[int]] = mapped_column(Integer, ForeignKey("users.id"), nullable=True, index=True)
+    priority: Mapped[int] = mapped_column(Integer, default=JobPriority.NORMAL, server_default="1")  # 见 JobPriority
+    cost: Mapped[int] = mapped_column(Integer, default=1, server_default="1")  # 调度开销估计，按文件大小计算
+    status: Mapped[JobStatus] = mapped_column(Enum(JobStatus), default=JobStatus.QUEUED, index=True)
+    stage: Mapped[Optional[str]] = mapped_column(String, nullable=True)  # 当前所处阶段
+    # 已完成的阶段，格式：["render", "extract"]
+    completed_stages: Mapped[List[str]] = mapped_column(JSON, default=list)
+    # 各阶段已完成的页码，格式：{"render": [0, 1, 2], "extract": [0, 1], "translate": [0]}
+    page_checkpoints: Mapped[Dict[str, List[int]]] = mapped_column(JSON, default=dict)
+    attempts: Mapped[int] = mapped_column(Integer, default=0)  # 已执行次数
+    # 用户请求取消任务，执行中的任务由持有租约的工作器检测到后终止
+    cancel_requested: Mapped[bool] = mapped_column(Boolean, default=False, server_default=text("false"))
+    locked_by: Mapped[Optional[str]] = mapped_column(String, nullable=True)  # 持有租约的工作器ID
+    lease_expires_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)  # 租约到期时间
+    error_message: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now, onupdate=datetime.now)
+    started_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    finished_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+
+    # 关系
+    document = relationship("Document")
+
+    def is_stage_completed(self, stage: str) -> bool:
+        """判断指定阶段是否已完成."""
+        return stage in (self.completed_stages or [])
+
+    def complete_stage(self, stage: str):
+        """标记指定阶段已完成."""
+        if not self.is_stage_completed(stage):
+            self.completed_stages = [*(self.completed_stages or []), stage]
+
+    def get_checkpoint(self, stage: str) -> set:
+        """获取指定阶段已完成的页码集合."""
+        return set((self.page_checkpoints or {}).get(stage, []))
+
+    def add_checkpoint(self, stage: str, page_indexes):
+        """记录指定阶段新完成的页码."""
+        checkpoints = dict(self.page_checkpoints or {})
+        checkpoints[stage] = sorted(set(checkpoints.get(stage, [])) | set(page_indexes))
+        self.page_checkpoints = checkpoints
+
+    def reset_checkpoints(self):
+        """清空全部阶段和页面检查点，从头开始处理."""
+        self.completed_stages = []
+        self.page_checkpoints = {}
+
+
 class Document(Base):
     """文档模型类.
 
@@ -158,6 +272,7 @@ class Document(Base):
     content_type: Mapped[str] = mapped_column(String)
     file_data: Mapped[bytes] = mapped_column(LargeBinary)  # 存储原始文件二进制数据
     file_size: Mapped[int] = mapped_column(Integer)  # 文件大小（字节）
+    file_hash: Mapped[Optional[str]] = mapped_column(String(64), nullable=True, index=True)  # 上传文件的SHA-256
     owner_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.id"), nullable=False)  # 修改为外键
     path: Mapped[str] = mapped_column(String)  # 添加路径字段
     is_folder: Mapped[bool] = mapped_column(Boolean, default=False)  # 添加类型标识字段
@@ -171,6 +286,9 @@ class Document(Base):
     translation_pages: Mapped[Dict[str, str]] = mapped_column(JSON, default=dict)
     # 分页关键词，格式：{"1": ["关键词1", "关键词2"], "2": ["关键词3", "关键词4"], ...}
     keywords_pages: Mapped[Dict[str, List[str]]] = mapped_column(JSON, default=dict)
+    # 已写入知识库的条目及其内容哈希，格式：{"doc_1_p1_en_0": "哈希", ...}；新文档为空字典，
+    # NULL 表示按条目记录之前的旧文档，其条目需要从知识库的文档存储中查找
+    index_entries: Mapped[Optional[Dict[str, str]]] = mapped_column(JSON, nullable=True, default=dict)
 
     # thumbnail缩略图
     thumbnail: Mapped[Optional[bytes]] = mapped_column(LargeBinary, nullable=True)
@@ -248,6 +366,80 @@ class Document(Base):
         return self.keywords_pages.get(str(page), [])
 
 
+class PageAsset(Base):
+    """文档页面资源模型类.
+
+    按文档和页码存储预处理阶段渲染出的页面图片原始二进制数据，供文本提取阶段读取.
+    """
+
+    __tablename__ = "page_assets"
+    __table_args__ = (UniqueConstraint("document_id", "page_index", name="uq_page_assets_document_page"),)
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    document_id: Mapped[int] = mapped_column(Integer, ForeignKey("documents.id"), index=True)
+    page_index: Mapped[int] = mapped_column(Integer)  # 页码，从0开始，与content_pages的键一致
+    mime_type: Mapped[str] = mapped_column(String, default="image/png")
+    data: Mapped[bytes] = mapped_column(LargeBinary)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now)
+
+
+class PageCacheKind:
+    """页面缓存类型常量."""
+
+    OCR = "ocr"  # 页面图片 -> markdown 文本
+    TRANSLATION = "translation"  # 页面文本 -> 译文
+
+
+class PageCache(Base):
+    """页面级处理结果缓存模型类.
+
+    以内容哈希为键缓存单页的文本提取和翻译结果，与文档无关，整个语料库中重复出现的页面只处理一次.
+    缓存键由输入内容的 SHA-256 和模型、提示词版本（翻译还包括目标语言）共同计算，见 services.page_cache.
+    """
+
+    __tablename__ = "page_cache"
+    __table_args__ = (UniqueConstraint("kind", "cache_key", name="uq_page_cache_kind_key"),)
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    kind: Mapped[str] = mapped_column(String)  # 缓存类型，见 PageCacheKind
+    cache_key: Mapped[str] = mapped_column(String(64))
+    content: Mapped[str] = mapped_column(Text)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now)
+
+
+class EmbeddingCache(Base):
+    """文本向量缓存模型类.
+
+    以嵌入模型、向量维度和规范化文本的哈希为键缓存向量，与命名空间无关，相同内容只计算一次向量.
+    向量以 float32 数组的二进制形式存储，见 services.embedding_cache.
+    """
+
+    __tablename__ = "embedding_cache"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    cache_key: Mapped[str] = mapped_column(String(64), unique=True, index=True)
+    embedding: Mapped[bytes] = mapped_column(LargeBinary)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now)
+
+
+class ReindexCheckpoint(Base):
+    """知识库批量重建索引进度模型类.
+
+    按文档ID顺序重建索引，last_document_id 之前（含）的文档均已处理完成，中断后从该位置继续.
+    """
+
+    __tablename__ = "reindex_checkpoints"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    name: Mapped[str] = mapped_column(String, unique=True, index=True)  # 重建任务名称
+    last_document_id: Mapped[int] = mapped_column(Integer, default=0)
+    indexed_count: Mapped[int] = mapped_column(Integer, default=0)
+    failed_document_ids: Mapped[List[int]] = mapped_column(JSON, default=list)  # 写入失败的文档ID
+    started_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now, onupdate=datetime.now)
+    finished_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+
+
 class QuizHistory(Base):
     """测验历史记录模型类.
 
@@ -402,6 +594,12 @@ def create_tables():
                                     op.add_column(table.name, col)
                                 except Exception as e:
                                     logger.error(f"添加列 {col_name} 时出错: {str(e)}")
+                        # 添加新索引：新增列上声明的索引不会随 ADD COLUMN 创建
+                        existing_indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+                        for index in table.indexes:
+                            if index.name not in existing_indexes:
+                                logger.info(f"创建索引 {index.name}")
+                                conn.execute(CreateIndex(index, if_not_exists=True))
                 logger.info("表结构更新完成")
             else:
                 # SQLite 数据库，由于 SQLite 限制，使用临时表进行迁移
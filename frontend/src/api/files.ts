@@ -1,5 +1,5 @@
 import { BASE_URL, getAuthHeaders, handleRequest } from './config';
-import type { FileItem, FolderTree, MoveFileRequest, RenameFileRequest } from './types';
+import type { FileItem, FolderTree, MoveFileRequest, ProcessingEvent, RenameFileRequest } from './types';
 
 export type DownloadFormat = 'original' | 'md' | 'md_cn' | 'md_en';
 
@@ -72,6 +72,16 @@ export const fileApi = {
     });
   },
 
+  // 订阅多个文件的处理进度（SSE），返回取消订阅函数
+  subscribeProcessingEvents: (fileIds: string[], onEvent: (event: ProcessingEvent) => void): (() => void) => {
+    const source = new EventSource(
+      `${BASE_URL}/documents/processing-events?ids=${encodeURIComponent(fileIds.join(','))}`,
+      { withCredentials: true },
+    );
+    source.onmessage = (e) => onEvent(JSON.parse(e.data));
+    return () => source.close();
+  },
+
   // 获取文件夹树结构
   getFolderTree: async (): Promise<FolderTree[]> => {
     return handleRequest(`${BASE_URL}/folders/tree`, {
@@ -136,6 +136,18 @@ export interface FileItem {
   mimeType?: string;
   processingStatus?: string;
   errorMessage?: string;
+  progressMessage?: string;
+  progress?: number;
+}
+
+// 文档处理进度事件（SSE 推送）
+export interface ProcessingEvent {
+  document_id: string;
+  processing_status: string;
+  stage: 'render' | 'extract' | 'translate' | 'index' | null;
+  completed_pages: number | null;
+  total_pages: number | null;
+  message: string | null;
 }
 
 export interface FolderTree {
@@ -1,6 +1,6 @@
 import React, { useState, useEffect, useRef } from 'react';
 import Loading from '../Loading';
-import { fileApi, type DownloadFormat, type FileItem, type FolderTree } from '../../api';
+import { fileApi, type DownloadFormat, type FileItem, type FolderTree, type ProcessingEvent } from '../../api';
 import DragZone from './DragZone';
 import { useNavigate, useLocation } from 'react-router-dom';
 import { List, Grid } from 'lucide-react';
@@ -58,6 +58,21 @@ const PROGRESS: Record<ProcessingStatus, number> = {
   'failed': 100,
 };
 
+// 各处理阶段在整体进度中的区间
+const STAGE_PROGRESS: Record<NonNullable<ProcessingEvent['stage']>, [number, number]> = {
+  'render': [0, 20],
+  'extract': [20, 60],
+  'translate': [60, 95],
+  'index': [95, 100],
+};
+
+const eventProgress = (event: ProcessingEvent): number | undefined => {
+  if (!event.stage) return undefined;
+  const [start, end] = STAGE_PROGRESS[event.stage];
+  if (!event.completed_pages || !event.total_pages) return start;
+  return start + (end - start) * Math.min(event.completed_pages / event.total_pages, 1);
+};
+
 const FileList: React.FC<FileListProps> = ({
   onFileSelect,
   onFolderChange,
@@ -146,12 +161,17 @@ const FileList: React.FC<FileListProps> = ({
     fetchFolderTree();
   }, [operation]);
 
+  // 处理中文件的ID，变化时重新订阅处理进度
+  const activeFileIds = files
+    .filter(file => !file.isFolder && (file.processingStatus === 'pending' || file.processingStatus === 'processing'))
+    .map(file => file.id)
+    .sort()
+    .join(',');
+
   useEffect(() => {
-    const interval = setInterval(() => {
-      updateProcessingStatus();
-    }, 2500);
-    return () => clearInterval(interval);
-  }, [files]);
+    if (!activeFileIds) return;
+    return fileApi.subscribeProcessingEvents(activeFileIds.split(','), handleProcessingEvent);
+  }, [activeFileIds]);
 
   useEffect(() => {
     localStorage.setItem('fileSortBy', sortBy);
@@ -159,17 +179,19 @@ const FileList: React.FC<FileListProps> = ({
     localStorage.setItem('fileViewMode', viewMode);
   }, [sortBy, sortOrder, viewMode]);
 
-  const updateProcessingStatus = async () => {
-    const targetFiles = files.filter(file => file.processingStatus === 'pending' || file.processingStatus === 'processing')
-      .filter(file => file.isFolder === false)
-    if (targetFiles.length === 0) return;
-    const statuses = await Promise.all(targetFiles.map(async (file) => {
-      const status = await fileApi.getProcessingStatus(file.id);
-      return { ...file, ...status };
-    }));
+  const handleProcessingEvent = (event: ProcessingEvent) => {
     setFiles(prevFiles => prevFiles.map(file => {
-      const status = statuses.find(status => status.id === file.id);
-      return status ? { ...file, processingStatus: status.processing_status, errorMessage: status.error_message } : file;
+      if (file.id !== event.document_id) return file;
+      const progress = eventProgress(event);
+      return {
+        ...file,
+        processingStatus: event.processing_status,
+        // 失败事件的 message 为错误信息，其他事件的 message 为进度描述
+        errorMessage: event.processing_status === 'failed' ? event.message ?? undefined : undefined,
+        progressMessage: event.processing_status === 'failed' ? undefined : event.message ?? undefined,
+        // 流式处理时各阶段交替推送，进度只增不减
+        progress: progress === undefined ? file.progress : Math.max(file.progress ?? 0, progress),
+      };
     }));
   };
 
@@ -666,7 +688,7 @@ const FileList: React.FC<FileListProps> = ({
                     file.processingStatus === 'completed' ? 'text-green-500' :
                     'text-red-500'
                   }`}
-                  title={file.errorMessage || TOOLTIPS[file.processingStatus.toLowerCase() as ProcessingStatus]}
+                  title={file.errorMessage || file.progressMessage || TOOLTIPS[file.processingStatus.toLowerCase() as ProcessingStatus]}
                 >
                   {ICONS[file.processingStatus.toLowerCase() as ProcessingStatus]}
                 </span>
@@ -674,7 +696,7 @@ const FileList: React.FC<FileListProps> = ({
                   <div className="w-16 sm:w-20 h-1.5 bg-gray-200 dark:bg-gray-700 rounded-full overflow-hidden">
                     <div
                       className="h-full bg-blue-500 rounded-full transition-all duration-300"
-                      style={{ width: `${PROGRESS[file.processingStatus.toLowerCase() as ProcessingStatus]}%` }}
+                      style={{ width: `${file.progress ?? PROGRESS[file.processingStatus.toLowerCase() as ProcessingStatus]}%` }}
                     />
                   </div>
                 )}
@@ -896,7 +918,7 @@ const FileList: React.FC<FileListProps> = ({
                               file.processingStatus === 'completed' ? 'text-green-500' :
                               'text-red-500'
                             }`}
-                            title={file.errorMessage || TOOLTIPS[file.processingStatus.toLowerCase() as ProcessingStatus]}
+                            title={file.errorMessage || file.progressMessage || TOOLTIPS[file.processingStatus.toLowerCase() as ProcessingStatus]}
                           >
                             {ICONS[file.processingStatus.toLowerCase() as ProcessingStatus]}
                             <span className="hidden sm:inline">{file.processingStatus}</span>
@@ -905,7 +927,7 @@ const FileList: React.FC<FileListProps> = ({
                             <div className="w-16 sm:w-20 h-1.5 bg-gray-200 dark:bg-gray-700 rounded-full overflow-hidden">
                               <div
                                 className="h-full bg-blue-500 rounded-full transition-all duration-300"
-                                style={{ width: `${PROGRESS[file.processingStatus.toLowerCase() as ProcessingStatus]}%` }}
+                                style={{ width: `${file.progress ?? PROGRESS[file.processingStatus.toLowerCase() as ProcessingStatus]}%` }}
                               />
                             </div>
                           )}
@@ -14,7 +14,12 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse
 from fastapi.staticfiles import StaticFiles
 
+from clients.client_pool import close_clients
+from config import get_settings
+from pipeline.document_pipeline import DocumentPipeline
+from rag.registry import close_knowledge_bases
 from routers import auth, conversations, documents, folders, search, settings
+from services.upload_service import UploadSizeLimitMiddleware
 
 # 配置根日志记录器
 root_logger = logging.getLogger()
@@ -64,10 +69,15 @@ async def lifespan(app: FastAPI):
     Yields:
         None
     """
+    # 内嵌模式下随应用启动处理工作器，继续处理上次中断的任务
+    if get_settings().PIPELINE_WORKER_MODE == "embedded":
+        api_app.state.document_pipeline = DocumentPipeline()
     yield
-    # 清理工作
-    if hasattr(app.state, "document_pipeline"):
-        app.state.document_pipeline.shutdown()
+    # 清理工作（路由挂载在 api_app 上，流水线实例保存在 api_app.state 中）
+    if hasattr(api_app.state, "document_pipeline"):
+        api_app.state.document_pipeline.shutdown()
+    await close_clients()
+    await close_knowledge_bases()
 
 
 app = FastAPI(
@@ -88,6 +98,10 @@ app.add_middleware(
 
 # 创建API路由前缀
 api_app = FastAPI(title="API")
+# 上传接口的大小限制在读取请求体时检查，超过限制的请求不必先完整写入临时文件
+api_app.add_middleware(
+    UploadSizeLimitMiddleware, max_size_mb=get_settings().MAX_UPLOAD_SIZE_MB, paths=["/documents/upload"]
+)
 
 # 注册所有 API 路由到 api_app
 api_app.include_router(auth.router)  # 用户认证路由
@@ -10,10 +10,8 @@ import sys
 
 import click
 
-from config import get_settings
-from database import Document, Folder, ProcessingStatus, SessionLocal, create_rag_db, create_tables
+from database import Document, Folder, JobPriority, ProcessingStatus, SessionLocal, create_rag_db, create_tables
 from models.users import User
-from rag.knowledgebase import KnowledgeBase
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
@@ -308,47 +306,67 @@ def migrate_legacy_db():
 
 
 def ingest_data():
-    """导入数据."""
+    """导入数据：把已处理完成的文档写入知识库."""
+    run_reindex(name="ingest")
+
+
+def run_reindex(
+    name: str = "default",
+    concurrency: int = None,
+    documents_per_minute: int = None,
+    owner_email: str = None,
+    restart: bool = False,
+    replace: bool = False,
+):
+    """批量重建知识库索引，中断后再次运行同名任务时从上次的位置继续."""
     import asyncio
     import platform
 
-    async def process_documents(documents, rag):
-        for document in documents:
-            try:
-                await rag.upload_document(document)
-            except Exception as e:
-                logger.error(f"处理文档 {document.filename} 时出错: {str(e)}")
+    from rag.registry import close_knowledge_bases
+    from services.reindex import reindex_documents
 
-    async def main():
-        settings = get_settings()
-        if settings.GLOBAL_MODE == "public":
-            namespace = "public"
-        else:
-            raise ValueError("GLOBAL_MODE 必须为 public")
+    if platform.system() == "Windows":
+        # Windows 平台特殊处理
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
 
-        pg_docs_uri = (
-            f"postgresql+asyncpg://"
-            f"{settings.DATABASE_USER}:{settings.DATABASE_PASSWORD}"
-            f"@{settings.DATABASE_HOST}:{settings.DATABASE_PORT}/{settings.RAG_DATABASE_NAME}"
-        )
-        pg_vector_uri = (
-            f"postgresql+asyncpg://"
-            f"{settings.DATABASE_USER}:{settings.DATABASE_PASSWORD}"
-            f"@{settings.DATABASE_HOST}:{settings.DATABASE_PORT}/{settings.RAG_DATABASE_NAME}"
-        )
-        rag = KnowledgeBase(
-            pg_docs_uri,
-            pg_vector_uri,
-            "public",
-            namespace,
-        )
-        db = SessionLocal()
+    async def run():
         try:
-            documents = db.query(Document).all()
-            await process_documents(documents, rag)
-            logger.info("导入数据完成")
+            return await reindex_documents(
+                name=name,
+                concurrency=concurrency,
+                documents_per_minute=documents_per_minute,
+                owner_email=owner_email,
+                restart=restart,
+                replace=replace,
+            )
         finally:
-            db.close()
+            await close_knowledge_bases()
+
+    result = asyncio.run(run())
+    click.echo(f"已写入 {result.indexed} 个文档，失败 {len(result.failed_document_ids)} 个")
+    if result.failed_document_ids:
+        click.echo(f"写入失败的文档ID: {', '.join(map(str, result.failed_document_ids))}")
+
+
+def run_worker(concurrency: int = None):
+    """运行文档处理工作器，直到收到 SIGINT/SIGTERM."""
+    import asyncio
+    import platform
+    import signal
+
+    from pipeline.document_pipeline import DocumentPipeline
+    from pipeline.worker import PipelineWorker
+
+    async def main():
+        worker = PipelineWorker(DocumentPipeline(start_worker=False), concurrency=concurrency)
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, worker.stop)
+            except NotImplementedError:
+                # Windows 不支持 add_signal_handler，依赖 KeyboardInterrupt 退出
+                pass
+        await worker.run()
 
     if platform.system() == "Windows":
         # Windows 平台特殊处理
@@ -357,6 +375,26 @@ def ingest_data():
     asyncio.run(main())
 
 
+def reprocess_documents(document_ids: tuple = (), full: bool = False):
+    """为已处理完成的文档创建重新处理任务，默认只重新执行版本或输入发生变化的阶段和页面."""
+    from pipeline.document_pipeline import DocumentPipeline
+
+    db = SessionLocal()
+    try:
+        query = db.query(Document.id).filter(Document.processing_status == ProcessingStatus.COMPLETED)
+        if document_ids:
+            query = query.filter(Document.id.in_(document_ids))
+        ids = [row.id for row in query.order_by(Document.id).all()]
+    finally:
+        db.close()
+
+    pipeline = DocumentPipeline(start_worker=False)
+    queued = sum(
+        1 for document_id in ids if pipeline.add_task(document_id, force=True, full=full, priority=JobPriority.BULK)
+    )
+    click.echo(f"共 {len(ids)} 个文档，已加入处理队列 {queued} 个，其余无需重新处理或已在队列中")
+
+
 @click.group()
 def cli():
     """TheLab管理工具."""
@@ -385,6 +423,33 @@ def ingest():
     ingest_data()
 
 
+@cli.command()
+@click.option("--name", default="default", help="重建任务名称，同名任务共享进度，中断后再次运行时继续")
+@click.option("--concurrency", type=int, default=None, help="同时写入的文档数，默认为 REINDEX_CONCURRENCY")
+@click.option("--rate", type=int, default=None, help="每分钟写入的文档数上限，默认为 REINDEX_DOCUMENTS_PER_MINUTE")
+@click.option("--owner", default=None, help="只重建该用户（邮箱）的文档")
+@click.option("--restart", is_flag=True, default=False, help="忽略已保存的进度，从头开始")
+@click.option("--replace", is_flag=True, default=False, help="重新写入全部条目（包括未变化的），更换嵌入模型后使用")
+def reindex(name, concurrency, rate, owner, restart, replace):
+    """批量重建知识库索引."""
+    run_reindex(name, concurrency, rate, owner, restart, replace)
+
+
+@cli.command()
+@click.option("--concurrency", type=int, default=None, help="同时处理的最大文档数，默认为 MAX_CONCURRENT_TASKS")
+def worker(concurrency):
+    """运行文档处理工作器."""
+    run_worker(concurrency)
+
+
+@cli.command()
+@click.option("--document-id", "document_ids", type=int, multiple=True, help="只重新处理指定的文档，可重复指定")
+@click.option("--full", is_flag=True, default=False, help="忽略版本戳，从头处理全部阶段")
+def reprocess(document_ids, full):
+    """重新处理已完成的文档，只执行因模型、提示词或配置变化而失效的阶段."""
+    reprocess_documents(document_ids, full)
+
+
 @cli.command()
 @click.option("--username", prompt="用户名", help="超级用户的用户名")
 @click.option("--email", prompt="邮箱", help="超级用户的邮箱")
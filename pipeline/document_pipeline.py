@@ -7,30 +7,123 @@ import asyncio
 import hashlib
 import logging
 import os
-import queue
-import tempfile
 import threading
+import time
 import traceback
-from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Dict, Optional
+from typing import Awaitable, Dict, List, Optional, TypeVar
 
 from fastapi import Request
 from sqlalchemy.orm import Session
 
+from clients.llm_scheduler import LLMPriority
+from clients.openai_client import create_openai_client
 from config import get_settings
-from database import Document, ProcessingRecord, ProcessingStatus, get_db
+from database import (
+    Document,
+    JobPriority,
+    JobStage,
+    JobStatus,
+    ProcessingJob,
+    ProcessingRecord,
+    ProcessingStatus,
+    get_db,
+)
 from models.users import User
+from pipeline.reprocess import ReprocessPlan, build_stage_stamps, compute_stage_versions, plan_reprocessing
+from pipeline.scheduler import job_cost, job_priority
+from pipeline.worker import CancelReason, PipelineWorker
+from prepdocs.concurrency import gather_or_cancel
 from prepdocs.config import FileType, Page, Section
-from prepdocs.parse_images import parse_images
+from prepdocs.keywords import extract_keywords
+from prepdocs.parse_images import parse_images, process_single_page
 from prepdocs.parse_page import DocsIngester
-from prepdocs.translate import translate_text
-from rag.knowledgebase import KnowledgeBase
+from prepdocs.translate import DEFAULT_TARGET_LANGUAGE, translate_pages, translate_text
+from prepdocs.translation_planner import estimate_tokens
+from rag.registry import get_knowledge_base
+from services import page_store
+from services.progress import publish_progress
+from services.workspace import open_workspace
 
 logger = logging.getLogger(__name__)
 
 settings = get_settings()
 
+T = TypeVar("T")
+
+CANCELLED_MESSAGE = "处理已取消"
+
+
+class PipelineTimeoutError(Exception):
+    """处理任务或阶段超过时限."""
+
+
+class _CheckpointWriter:
+    """逐页检查点写入器。
+
+    累积各阶段逐页完成的结果，并按时间间隔把文档页面内容和任务检查点放在同一个事务中提交，
+    保证任务中断后检查点记录的页面一定已经保存。每完成一页都会发布一次处理进度。
+    """
+
+    def __init__(self, document: Document, job: ProcessingJob, db: Session, interval: float):
+        """初始化检查点写入器。
+
+        Args:
+            document: 文档对象
+            job: 处理任务对象
+            db: 数据库会话
+            interval: 两次提交之间的最小间隔（秒）
+        """
+        self.document = document
+        self.job = job
+        self.db = db
+        self.interval = interval
+        self.content_pages: Dict[str, str] = dict(document.content_pages or {})
+        self.translation_pages: Dict[str, str] = dict(document.translation_pages or {})
+        self.keywords_pages: Dict[str, List[str]] = dict(document.keywords_pages or {})
+        self.pending: Dict[str, set] = {}
+        self.completed_counts: Dict[str, int] = {}
+        self.last_saved_at = time.monotonic()
+
+    def page_done(self, stage: str, page_index: int, content: Optional[str] = None):
+        """记录某一阶段完成了一页，必要时提交."""
+        if stage == JobStage.EXTRACT:
+            self.content_pages[str(page_index)] = content
+            # 重新提取了文本的页面，写入知识库前重新提取关键词
+            self.keywords_pages.pop(str(page_index), None)
+        elif stage == JobStage.TRANSLATE:
+            self.translation_pages[str(page_index)] = content
+        self.pending.setdefault(stage, set()).add(page_index)
+        if stage not in self.completed_counts:
+            self.completed_counts[stage] = len(self.job.get_checkpoint(stage))
+        self.completed_counts[stage] += 1
+        publish_progress(
+            self.document.id,
+            ProcessingStatus.PROCESSING.value,
+            stage=stage,
+            completed_pages=self.completed_counts[stage],
+            total_pages=self.document.total_pages,
+            message=self.document.processor,
+        )
+        self.save()
+
+    def save(self, force: bool = False):
+        """提交累积的页面内容和检查点."""
+        if not force and time.monotonic() - self.last_saved_at < self.interval:
+            return
+        self.document.content_pages = self._ordered(self.content_pages)
+        self.document.translation_pages = self._ordered(self.translation_pages)
+        self.document.keywords_pages = self._ordered(self.keywords_pages)
+        for stage, page_indexes in self.pending.items():
+            self.job.add_checkpoint(stage, page_indexes)
+        self.pending = {}
+        self.db.commit()
+        self.last_saved_at = time.monotonic()
+
+    @staticmethod
+    def _ordered(pages: Dict[str, T]) -> Dict[str, T]:
+        return {k: pages[k] for k in sorted(pages, key=int)}
+
 
 class DocumentPipeline:
     """文档处理流水线类。
@@ -41,42 +134,64 @@ class DocumentPipeline:
     3. 翻译：将英文文本翻译为中文
     4. 知识库存储：将处理后的内容保存到知识库
 
-    支持异步处理、任务队列管理和处理状态追踪。
+    每次处理对应一条持久化的 ProcessingJob 记录，记录已完成的阶段和逐页检查点。
+    服务重启或重试时从最后完成的页面继续，已完成的页面不会重复调用模型。
+    流式模式（PIPELINE_MODE=streaming）下，前三个阶段按页流水执行，见 stream_stages。
+
+    强制重新处理时按处理记录中的版本戳只重新执行失效的阶段和页面，见 pipeline.reprocess。
+
+    add_task 只负责把任务写入任务表，任务由 PipelineWorker 领取后调用 process_job 执行。
+    PIPELINE_WORKER_MODE=embedded 时工作器运行在当前进程的守护线程中；
+    external 时由独立的 `python manage.py worker` 进程处理，Web 进程只负责入队。
     """
 
     VERSION = "1.0.0"  # 处理器版本号
+    PROGRESS_COMMIT_INTERVAL = 2.0  # 保存逐页结果和检查点的最小间隔（秒）
 
-    def __init__(self, max_workers=3):
-        """初始化文档处理流水线。
+    def __init__(self, start_worker: Optional[bool] = None):
+        """初始化文档处理流水线.
 
         Args:
-            max_workers: 最大并发工作线程数，默认为3
+            start_worker: 是否在当前进程的守护线程中启动处理工作器，默认由 PIPELINE_WORKER_MODE 决定
         """
-        self.task_queue = queue.Queue()
-        self.thread_pool = ThreadPoolExecutor(max_workers=max_workers)
+        if start_worker is None:
+            start_worker = settings.PIPELINE_WORKER_MODE == "embedded"
         self.is_running = True
-        db = next(get_db())
-        # 删除之前未完成的任务
-        db.query(Document).filter(Document.processing_status == ProcessingStatus.PROCESSING).update(
-            {Document.processing_status: ProcessingStatus.FAILED}
-        )
-        db.commit()
+        self.worker: Optional[PipelineWorker] = None
+        self.cancelled_jobs: Dict[int, str] = {}  # 工作器取消的任务ID -> 取消原因（CancelReason）
 
-        # 启动守护线程处理任务
-        self.forever_loop = asyncio.new_event_loop()
-        self.daemon_thread = threading.Thread(target=self._process_queue, daemon=True)
-        self.daemon_thread.start()
-        # 继续处理队列中的任务
-        pending_documents = (
-            db.query(Document)
-            .filter(Document.processing_status == ProcessingStatus.PENDING)
-            .with_entities(Document.id)
-            .all()
-        )
-        for document in pending_documents:
-            self.add_task(document.id)
+        if start_worker:
+            # 启动守护线程运行处理工作器
+            self.worker = PipelineWorker(self)
+            self.forever_loop = asyncio.new_event_loop()
+            self.daemon_thread = threading.Thread(target=self._process_queue, daemon=True)
+            self.daemon_thread.start()
+
+    def enqueue_unscheduled_documents(self):
+        """为处于待处理或处理中状态、但没有任务记录的文档创建任务，兼容任务表出现之前上传的文档.
+
+        中断的任务无需处理：其租约到期后会被工作器重新领取并从检查点继续。
+        """
+        db = next(get_db())
+        try:
+            scheduled_document_ids = db.query(ProcessingJob.document_id).filter(
+                ProcessingJob.status.in_([JobStatus.QUEUED, JobStatus.RUNNING])
+            )
+            unscheduled_documents = (
+                db.query(Document.id)
+                .filter(
+                    Document.processing_status.in_([ProcessingStatus.PENDING, ProcessingStatus.PROCESSING]),
+                    Document.id.not_in(scheduled_document_ids),
+                )
+                .all()
+            )
+            document_ids = [doc.id for doc in unscheduled_documents]
+        finally:
+            db.close()
 
-        db.close()
+        # 启动时补登记的任务可能很多，以批量优先级排队，不阻塞新上传的文档
+        for document_id in document_ids:
+            self.add_task(document_id, priority=JobPriority.BULK)
 
     def _calculate_file_hash(self, file_data: bytes) -> str:
         """计算文件的SHA256哈希值."""
@@ -84,84 +199,228 @@ class DocumentPipeline:
         sha256_hash.update(file_data)
         return sha256_hash.hexdigest()
 
+    def _get_file_hash(self, document: Document) -> str:
+        """获取上传文件的哈希值：上传时已计算并保存，只有旧文档才需要重新计算并补写."""
+        if not document.file_hash:
+            document.file_hash = self._calculate_file_hash(document.file_data)
+        return document.file_hash
+
     def _get_processing_config(self) -> Dict:
         """获取当前的处理配置."""
         return {
             "version": self.VERSION,
-            "max_workers": self.thread_pool._max_workers,
+            "mode": settings.PIPELINE_MODE,
+            "ocr_workers": settings.PIPELINE_OCR_WORKERS,
+            "translate_workers": settings.PIPELINE_TRANSLATE_WORKERS,
             "timestamp": datetime.now().isoformat(),
         }
 
-    def _should_process_document(self, document: Document, db: Session, force: bool = False) -> bool:
-        """检查文档是否需要处理 :param document: Document对象 :param force: 是否强制处理 :return: 是否需要处理."""
-        if force:
-            return True
-        file_hash = self._calculate_file_hash(document.file_data)
-        # 检查是否存在相同哈希值的处理记录
-        existing_record: ProcessingRecord | None = (
-            db.query(ProcessingRecord)
+    def _reuse_processed_results(self, document: Document, db: Session) -> Optional[ReprocessPlan]:
+        """复用其他文档中相同文件的处理结果.
+
+        只在文档首次处理时复用，来源文档须已处理完成。复制页面内容、关键词和页面图片后返回只需重新索引的计划：
+        渲染、文本提取和翻译阶段预先完成，知识库写入阶段按新文档的所有者和命名空间执行。
+
+        Returns:
+            Optional[ReprocessPlan]: 没有可复用的结果时返回 None
+        """
+        if db.query(ProcessingJob.id).filter(ProcessingJob.document_id == document.id).first():
+            return None
+        file_hash = self._get_file_hash(document)
+        existing_document: Document | None = (
+            db.query(Document)
+            .join(ProcessingRecord, ProcessingRecord.document_id == Document.id)
             .filter(
                 ProcessingRecord.file_hash == file_hash,
                 ProcessingRecord.processor_version == self.VERSION,
+                Document.id != document.id,
+                Document.processing_status == ProcessingStatus.COMPLETED,
             )
             .first()
         )
+        if not existing_document:
+            return None
+
+        document.processor = existing_document.processor
+        document.content_pages = existing_document.content_pages
+        document.summary_pages = existing_document.summary_pages
+        document.translation_pages = existing_document.translation_pages
+        document.keywords_pages = existing_document.keywords_pages
+        document.total_pages = existing_document.total_pages
+        document.thumbnail = existing_document.thumbnail
+        document.mime_type = existing_document.mime_type
+        document.updated_at = datetime.now()
+        page_store.copy_pages(db, existing_document.id, document.id)
+        logger.info(f"文档 {document.filename} 复用文档 {existing_document.id} 的处理结果，只需写入知识库")
 
-        # 如果存在相同哈希值的处理记录，则不处理
-        if existing_record:
-            existing_document = existing_record.document
-            if not existing_document:
-                db.delete(existing_record)
-                db.commit()
-                return True
-            # 复制处理记录
-            document.processing_status = existing_document.processing_status
-            document.processor = existing_document.processor
-            document.content_pages = existing_document.content_pages
-            document.summary_pages = existing_document.summary_pages
-            document.translation_pages = existing_document.translation_pages
-            document.keywords_pages = existing_document.keywords_pages
-            document.total_pages = existing_document.total_pages
-            document.thumbnail = existing_document.thumbnail
-            document.updated_at = datetime.now()
-            document.mime_type = existing_document.mime_type
-            document.created_at = existing_document.created_at
-            document.updated_at = datetime.now()
-            db.commit()
-            return False
-
-        return existing_record is None
+        pages = list(range(document.total_pages or 0))
+        return ReprocessPlan(
+            completed_stages=[JobStage.RENDER, JobStage.EXTRACT, JobStage.TRANSLATE],
+            page_checkpoints={stage: pages for stage in (JobStage.RENDER, JobStage.EXTRACT, JobStage.TRANSLATE)},
+        )
 
     def add_task(
         self,
         document_id: int,
         force: bool = False,
+        full: bool = False,
+        priority: Optional[int] = None,
     ) -> bool:
-        """添加新任务到流水线 :param document_id: 文档ID :param force: 是否强制处理 :return: 是否成功添加任务."""
+        """添加新任务到任务队列.
+
+        Args:
+            document_id: 文档ID
+            force: 是否强制重新处理，默认只重新执行版本或输入发生变化的阶段和页面
+            full: 强制重新处理时是否忽略版本戳，从头处理全部阶段
+            priority: 任务优先级，见 JobPriority，默认按文档大小确定
+
+        Returns:
+            bool: 是否成功添加任务
+        """
         db = next(get_db())
-        document = db.query(Document).get(document_id)
-        if not document:
-            logger.error(f"文档不存在: {document_id}")
-            return False
-
-        # 检查是否需要处理
-        if not self._should_process_document(document, db, force):
-            logger.info(f"文档 {document.filename} 已经处理过，跳过处理")
-            return False
-
-        # 更新文档状态为待处理
-        document.processing_status = ProcessingStatus.PENDING
-        db.commit()
-        db.close()
+        try:
+            # 锁定文档行直到提交，同一文档的并发调用依次检查和创建任务，不会各自创建一个排队任务
+            document = db.query(Document).filter(Document.id == document_id).with_for_update().first()
+            if not document:
+                logger.error(f"文档不存在: {document_id}")
+                return False
+
+            plan = None
+            if not force:
+                plan = self._reuse_processed_results(document, db)
+            elif not full:
+                plan = self._plan_reprocessing(document, db)
+                if plan.up_to_date:
+                    logger.info(f"文档 {document.filename} 的各阶段均未失效，跳过处理")
+                    return False
+                logger.info(f"文档 {document.filename} {plan.describe()}")
+
+            job = self._get_or_create_job(document, db, force, plan)
+            if not job:
+                logger.info(f"文档 {document.filename} 已在处理队列中")
+                return False
+            if plan and plan.reset_keywords:
+                # 关键词只为缺少关键词的页面提取，提取方式变化后清空，由索引阶段按新的方式重新提取
+                document.keywords_pages = {}
+            job.owner_id = document.owner_id
+            job.priority = job_priority(document) if priority is None else priority
+            job.cost = job_cost(document)
+
+            # 更新文档状态为待处理
+            self._update_document_status(document, db, ProcessingStatus.PENDING)
+        finally:
+            db.close()
 
-        # self.task_queue.put(document_id)
-        asyncio.run_coroutine_threadsafe(self._process_document(document_id), self.forever_loop)
+        self.notify_worker()
+        return True
+
+    def cancel_document(self, document_id: int) -> bool:
+        """取消文档排队中或正在执行的处理任务.
+
+        排队中的任务直接标记为失败；正在执行的任务记录取消请求，由执行它的工作器在下一次轮询时终止，
+        已处理的页面检查点保留，之后重试时从检查点继续。
+
+        Returns:
+            bool: 是否存在可取消的任务
+        """
+        db = next(get_db())
+        try:
+            job = (
+                db.query(ProcessingJob)
+                .filter(
+                    ProcessingJob.document_id == document_id,
+                    ProcessingJob.status.in_([JobStatus.QUEUED, JobStatus.RUNNING]),
+                )
+                .order_by(ProcessingJob.id.desc())
+                .first()
+            )
+            if not job:
+                return False
+
+            # 条件更新，避免与工作器领取任务竞争
+            cancelled = (
+                db.query(ProcessingJob)
+                .filter(ProcessingJob.id == job.id, ProcessingJob.status == JobStatus.QUEUED)
+                .update(
+                    {
+                        ProcessingJob.status: JobStatus.FAILED,
+                        ProcessingJob.error_message: CANCELLED_MESSAGE,
+                        ProcessingJob.finished_at: datetime.now(),
+                    },
+                    synchronize_session=False,
+                )
+            )
+            if cancelled:
+                document = db.query(Document).get(document_id)
+                self._update_document_status(document, db, ProcessingStatus.FAILED, error_message=CANCELLED_MESSAGE)
+                logger.info(f"已取消排队中的处理任务: {job.id}")
+            else:
+                job.cancel_requested = True
+                db.commit()
+                logger.info(f"已请求取消正在执行的处理任务: {job.id}")
+        finally:
+            db.close()
 
+        self.notify_worker()
         return True
 
+    def notify_worker(self):
+        """唤醒工作器立即检查任务表，在创建、取消或删除任务的修改提交后调用."""
+        if self.worker:
+            self.worker.notify()
+
+    def _plan_reprocessing(self, document: Document, db: Session) -> ReprocessPlan:
+        """根据最近一次处理记录的版本戳规划需要重新执行的阶段和页面."""
+        latest_record = (
+            db.query(ProcessingRecord)
+            .filter(ProcessingRecord.document_id == document.id)
+            .order_by(ProcessingRecord.version.desc())
+            .first()
+        )
+        self._get_file_hash(document)
+        return plan_reprocessing(
+            document,
+            latest_record,
+            page_store.list_page_indexes(db, document.id),
+            compute_stage_versions(document.owner),
+        )
+
+    def _get_or_create_job(
+        self, document: Document, db: Session, force: bool, plan: Optional[ReprocessPlan] = None
+    ) -> Optional[ProcessingJob]:
+        """获取可继续执行的任务或创建新任务.
+
+        失败的任务会被复用并从检查点继续；强制处理时放弃之前的检查点创建新任务，
+        有重新处理计划时新任务预先记录计划中未失效的阶段和页面。 如果文档已有排队或执行中的任务，返回None。
+        """
+        latest_job: ProcessingJob | None = (
+            db.query(ProcessingJob)
+            .filter(ProcessingJob.document_id == document.id)
+            .order_by(ProcessingJob.id.desc())
+            .first()
+        )
+        if latest_job and latest_job.status in (JobStatus.QUEUED, JobStatus.RUNNING):
+            if not force:
+                return None
+            latest_job.status = JobStatus.FAILED
+            latest_job.error_message = "已被新的处理任务取代"
+        elif latest_job and latest_job.status == JobStatus.FAILED and not force:
+            latest_job.status = JobStatus.QUEUED
+            latest_job.error_message = None
+            latest_job.cancel_requested = False
+            return latest_job
+
+        job = ProcessingJob(document_id=document.id, status=JobStatus.QUEUED)
+        if plan and not plan.full:
+            job.completed_stages = plan.completed_stages
+            job.page_checkpoints = plan.page_checkpoints
+        db.add(job)
+        db.flush()
+        return job
+
     def _create_processing_record(self, document: Document, db: Session):
         """创建处理记录."""
-        file_hash = self._calculate_file_hash(document.file_data)
+        file_hash = self._get_file_hash(document)
         # 获取最新的处理记录版本号
         latest_record = (
             db.query(ProcessingRecord)
@@ -173,10 +432,12 @@ class DocumentPipeline:
         version = (latest_record.version + 1) if latest_record else 1
 
         record = ProcessingRecord(
+            document_id=document.id,
             file_hash=file_hash,
             version=version,
             processor_version=self.VERSION,
             processing_config=self._get_processing_config(),
+            stage_stamps=build_stage_stamps(document, compute_stage_versions(document.owner)),
         )
         db.add(record)
         db.commit()
@@ -188,8 +449,9 @@ class DocumentPipeline:
         status: ProcessingStatus,
         processor_msg: Optional[str] = None,
         error_message: Optional[str] = None,
+        stage: Optional[str] = None,
     ):
-        """更新文档状态."""
+        """更新文档状态并发布处理进度."""
         document.processing_status = status
         document.updated_at = datetime.now()
         if error_message:
@@ -199,60 +461,116 @@ class DocumentPipeline:
         if status == ProcessingStatus.COMPLETED:
             document.processed_at = datetime.now()
         db.commit()
+        publish_progress(
+            document.id,
+            status.value,
+            stage=stage,
+            total_pages=document.total_pages,
+            message=error_message if status == ProcessingStatus.FAILED else processor_msg,
+        )
 
-    async def _process_document(self, document_id: int):
-        """处理单个文档的流水线逻辑."""
-        db = next(get_db())
-        document = db.query(Document).get(document_id)
-        if not document:
-            logger.error(f"文档不存在: {document_id}")
-            return
-
-        try:
-            # ------------------预处理阶段------------------
-            self._update_document_status(
-                document,
-                db,
-                ProcessingStatus.PROCESSING,
-                processor_msg="预处理阶段...",
-            )
-            document = await self.stage_1(document, db)
+    async def _run_staged(self, document: Document, job: ProcessingJob, db: Session) -> Document:
+        """依次执行预处理、文本提取和翻译阶段，每个阶段处理完全部页面后再进入下一阶段，已完成的阶段会被跳过."""
+        # ------------------预处理阶段------------------
+        if not job.is_stage_completed(JobStage.RENDER):
+            self._start_stage(document, job, db, JobStage.RENDER, "预处理阶段...")
+            document = await self._run_stage(JobStage.RENDER, self.stage_1(document, job, db))
             logger.debug(f"预处理阶段完成: {document.filename}")
 
-            # ------------------文本提取阶段------------------
-            self._update_document_status(
-                document,
-                db,
-                ProcessingStatus.PROCESSING,
-                processor_msg="文本提取阶段...",
-            )
-            document = await self.stage_2(document, db)
+        # ------------------文本提取阶段------------------
+        if not job.is_stage_completed(JobStage.EXTRACT):
+            self._start_stage(document, job, db, JobStage.EXTRACT, "文本提取阶段...")
+            document = await self._run_stage(JobStage.EXTRACT, self.stage_2(document, job, db))
             logger.debug(f"文本提取阶段完成: {document.filename}")
 
-            # ------------------翻译阶段------------------
-            self._update_document_status(
-                document,
-                db,
-                ProcessingStatus.PROCESSING,
-                processor_msg="翻译阶段...",
-            )
-            document = await self.stage_3(document, db)
+        # ------------------翻译阶段------------------
+        if not job.is_stage_completed(JobStage.TRANSLATE):
+            self._start_stage(document, job, db, JobStage.TRANSLATE, "翻译阶段...")
+            document = await self._run_stage(JobStage.TRANSLATE, self.stage_3(document, job, db))
             logger.debug(f"翻译阶段完成: {document.filename}")
+        return document
 
-            # ------------------保存到知识库阶段------------------
-            self._update_document_status(
-                document,
-                db,
-                ProcessingStatus.PROCESSING,
-                processor_msg="保存到知识库阶段...",
-            )
-            document = await self.stage_4(document, db)
+    async def _run_stages(self, document: Document, job: ProcessingJob, db: Session) -> Document:
+        """按流水线模式执行尚未完成的阶段."""
+        if settings.PIPELINE_MODE == "streaming":
+            stream_stages = (JobStage.RENDER, JobStage.EXTRACT, JobStage.TRANSLATE)
+            if not all(job.is_stage_completed(stage) for stage in stream_stages):
+                # ------------------流式处理：渲染、文本提取、翻译按页重叠执行------------------
+                self._start_stage(document, job, db, JobStage.RENDER, "流式处理阶段...")
+                document = await self._run_stage("streaming", self.stream_stages(document, job, db))
+                logger.debug(f"流式处理阶段完成: {document.filename}")
+        else:
+            document = await self._run_staged(document, job, db)
+
+        # ------------------保存到知识库阶段------------------
+        if not job.is_stage_completed(JobStage.INDEX):
+            self._start_stage(document, job, db, JobStage.INDEX, "保存到知识库阶段...")
+            document = await self._run_stage(JobStage.INDEX, self.stage_4(document, job, db))
             logger.debug(f"保存到知识库阶段完成: {document.filename}")
+        return document
+
+    async def _run_stage(self, stage: str, coro: Awaitable[Document]) -> Document:
+        """执行一个阶段，超过 PIPELINE_STAGE_TIMEOUT 时取消并抛出 PipelineTimeoutError."""
+        return await self._with_deadline(
+            coro, settings.PIPELINE_STAGE_TIMEOUT, f"{stage} 阶段超过 {settings.PIPELINE_STAGE_TIMEOUT} 秒未完成"
+        )
+
+    @staticmethod
+    async def _with_deadline(coro: Awaitable[T], seconds: int, message: str) -> T:
+        """执行协程，超过时限时取消其中的全部子任务并抛出 PipelineTimeoutError；seconds 为 0 表示不限制."""
+        deadline = asyncio.timeout(seconds or None)
+        try:
+            async with deadline:
+                return await coro
+        except TimeoutError:
+            if deadline.expired():
+                raise PipelineTimeoutError(message) from None
+            raise
+
+    def _start_stage(self, document: Document, job: ProcessingJob, db: Session, stage: str, processor_msg: str):
+        """记录任务进入新阶段并更新文档状态."""
+        job.stage = stage
+        self._update_document_status(
+            document,
+            db,
+            ProcessingStatus.PROCESSING,
+            processor_msg=processor_msg,
+            stage=stage,
+        )
+
+    async def process_job(self, job_id: int):
+        """处理单个文档任务的流水线逻辑，从任务记录的检查点继续执行.
+
+        任务须已由 PipelineWorker 领取。任务被取消时按 cancelled_jobs 中记录的原因结束：
+        工作器停止时任务回到排队状态并释放租约；用户请求取消时任务和文档标记为失败；
+        任务被取代时只释放租约；文档已删除或租约已被其他工作器接管时不再写入任务记录。
+        """
+        db = next(get_db())
+        job = db.query(ProcessingJob).get(job_id)
+        if not job or not job.document:
+            logger.error(f"处理任务或文档不存在: {job_id}")
+            db.close()
+            return
+        document = job.document
+        job.attempts += 1
+        job.started_at = datetime.now()
+        db.commit()
+
+        try:
+            document = await self._with_deadline(
+                self._run_stages(document, job, db),
+                settings.PIPELINE_JOB_TIMEOUT,
+                f"处理超过 {settings.PIPELINE_JOB_TIMEOUT} 秒未完成",
+            )
 
             # 创建处理记录
             self._create_processing_record(document, db)
 
             # 完成
+            job.stage = None
+            job.status = JobStatus.COMPLETED
+            job.finished_at = datetime.now()
+            self._release_lease(job)
             self._update_document_status(
                 document,
                 db,
@@ -261,9 +579,38 @@ class DocumentPipeline:
             )
             return document
 
+        except asyncio.CancelledError:
+            reason = self.cancelled_jobs.get(job_id)
+            db.rollback()
+            if reason == CancelReason.REQUESTED:
+                logger.info(f"处理任务已取消: {job_id}")
+                job.status = JobStatus.FAILED
+                job.error_message = CANCELLED_MESSAGE
+                job.cancel_requested = False
+                job.finished_at = datetime.now()
+                self._release_lease(job)
+                self._update_document_status(document, db, ProcessingStatus.FAILED, error_message=CANCELLED_MESSAGE)
+            elif reason is None:
+                # 工作器停止：放弃本次执行，任务回到排队状态，由其他工作器从检查点继续
+                logger.info(f"处理任务被中断，重新排队: {job_id}")
+                job.status = JobStatus.QUEUED
+                self._release_lease(job)
+                db.commit()
+            elif reason == CancelReason.SUPERSEDED:
+                # 释放租约后，取代它的新任务才能被领取
+                logger.info(f"处理任务已被取代: {job_id}")
+                self._release_lease(job)
+                db.commit()
+            else:
+                logger.info(f"处理任务已终止（{reason}），不再更新任务记录: {job_id}")
+            raise
         except Exception as e:
             logger.error(f"处理文档失败: {str(e)}")
             logger.error(traceback.format_exc())
+            job.status = JobStatus.FAILED
+            job.error_message = str(e)
+            job.finished_at = datetime.now()
+            self._release_lease(job)
             self._update_document_status(
                 document,
                 db,
@@ -274,37 +621,28 @@ class DocumentPipeline:
         finally:
             db.close()
 
+    @staticmethod
+    def _release_lease(job: ProcessingJob):
+        """释放工作器对任务的租约."""
+        job.locked_by = None
+        job.lease_expires_at = None
+
     def _process_queue(self):
-        """守护线程：持续处理队列中的任务."""
+        """守护线程：运行处理工作器，持续处理队列中的任务."""
         asyncio.set_event_loop(self.forever_loop)
-        self.forever_loop.run_forever()
+        self.forever_loop.run_until_complete(self.worker.run())
 
     def shutdown(self):
-        """关闭流水线."""
+        """关闭流水线，正在处理的任务回到排队状态."""
         self.is_running = False
-        self.thread_pool.shutdown(wait=True)
-        self.daemon_thread.join(timeout=5)
+        if self.worker:
+            self.worker.stop()
+            self.daemon_thread.join(timeout=5)
         logger.info("Document Pipeline shutdown complete")
 
-    async def stage_1(self, document: Document, db: Session) -> Document:
-        """预处理阶段：将文档转换为图片."""
-        logger.info(f"开始预处理文档: {document.filename}")
-
-        # 使用系统临时目录
-        temp_dir = tempfile.mkdtemp()
-        temp_file = os.path.join(temp_dir, document.filename)
-        logger.debug(f"使用临时文件路径: {temp_file}")
-
-        with open(temp_file, "wb") as f:
-            f.write(document.file_data)
-        logger.debug(f"成功写入临时文件，大小: {len(document.file_data)} bytes")
-
-        # 使用DocsIngester处理文档
-        logger.debug("开始使用DocsIngester处理文档")
-        ingester = DocsIngester()
-        section = await ingester.process_document(temp_file, document.filename)
-        # temp_file 存储到数据库
-        with open(temp_file, "rb") as f:
+    def _save_converted_file(self, document: Document, pdf_path: str):
+        """将转换后的PDF写回文档记录，并把文件名和路径规范为 .pdf."""
+        with open(pdf_path, "rb") as f:
             document.file_data = f.read()
             document.mime_type = "application/pdf"
             document.content_type = "application/pdf"
@@ -324,110 +662,128 @@ class DocumentPipeline:
                     document.path = f"/{new_filename}"
                 else:
                     document.path = os.path.join(dir_path, new_filename)
-        logger.debug(f"DocsIngester处理完成，共 {len(section.pages)} 页")
 
-        # 更新文档状态
-        document.total_pages = len(section.pages)
-        document.content_pages = {}  # 清空现有内容
+    def _reset_document_pages(self, document: Document, db: Session):
+        """清空文档已有的页面内容和页面图片，用于从头处理."""
+        document.content_pages = {}
         document.summary_pages = {}
         document.translation_pages = {}
         document.keywords_pages = {}
+        page_store.clear_pages(db, document.id)
 
-        # 生成缩略图
-        if section.pages:
-            document.thumbnail = self._generate_thumbnail(section.pages[0].file_path)
-        else:
-            document.thumbnail = None
-
-        # 保存图片数据到content_pages
-        for i, page in enumerate(section.pages, 1):
-            with open(page.file_path, "rb") as f:
-                image_data = f.read()
-            document.content_pages[str(i)] = {
-                "type": "image",
-                "data": image_data.hex(),  # 将二进制数据转换为hex字符串存储
-            }
+    async def stage_1(self, document: Document, job: ProcessingJob, db: Session) -> Document:
+        """预处理阶段：将文档转换为图片."""
+        logger.info(f"开始预处理文档: {document.filename}")
 
-        db.commit()
-        return document
+        # 临时文件放在任务工作区，阶段结束（包括出错和取消）时删除
+        with open_workspace(job.id) as workspace:
+            temp_file = workspace.write_file(document.filename, document.file_data)
+            logger.debug(f"成功写入临时文件: {temp_file}，大小: {len(document.file_data)} bytes")
+
+            # 使用DocsIngester处理文档
+            logger.debug("开始使用DocsIngester处理文档")
+            ingester = DocsIngester(workspace)
+            section = await ingester.process_document(temp_file, document.filename, settings.TEXT_LAYER_FAST_PATH)
+            self._save_converted_file(document, temp_file)
+            logger.debug(f"DocsIngester处理完成，共 {len(section.pages)} 页")
+
+            # 更新文档状态，从头处理时清空现有内容
+            document.total_pages = len(section.pages)
+            if not job.page_checkpoints:
+                self._reset_document_pages(document, db)
+
+            # 直接以缩略图分辨率渲染首页
+            document.thumbnail = await ingester.render_thumbnail(temp_file)
+
+            # 保存页面图片到页面资源存储，content_pages 只保存文本；之前已保存的页面不重复写入
+            # 直接从文字层提取了文本的页面不保存图片，文本提取阶段随之完成；整个阶段在一个事务中提交
+            rendered = job.get_checkpoint(JobStage.RENDER)
+            writer = _CheckpointWriter(document, job, db, float("inf"))
+            for i, page in enumerate(section.pages):
+                if i in rendered:
+                    continue
+                if page.content is not None:
+                    writer.page_done(JobStage.EXTRACT, i, page.content)
+                    continue
+                page_store.save_page(db, document.id, i, self._take_page_image(page), page.mime_type)
+
+            job.add_checkpoint(JobStage.RENDER, range(len(section.pages)))
+            job.complete_stage(JobStage.RENDER)
+            writer.save(force=True)
+            return document
 
-    async def stage_2(self, document: Document, db: Session) -> Document:
-        """文本提取阶段：将图片转换为文本."""
+    async def stage_2(self, document: Document, job: ProcessingJob, db: Session) -> Document:
+        """文本提取阶段：将图片转换为文本，跳过检查点中已完成的页面."""
         logger.info(f"开始提取文档文本: {document.filename}")
 
-        # 构建图片Section
+        # 构建图片Section，页面图片在处理时才从页面资源存储中逐页加载
+        extracted = job.get_checkpoint(JobStage.EXTRACT)
+        page_indexes = [i for i in page_store.list_page_indexes(db, document.id) if i not in extracted]
         image_section = Section(
             title=document.filename,
-            pages=[],
+            pages=[Page() for _ in page_indexes],
             file_type=FileType.IMAGE,
             filename=document.filename,
         )
 
-        # 创建临时图片文件，使用系统临时目录
-        temp_dir = tempfile.mkdtemp()
-        temp_files = []
-        for page_num, page_data in document.content_pages.items():
-            if page_data["type"] == "image":
-                temp_file = os.path.join(temp_dir, f"page_{page_num}.png")
-                with open(temp_file, "wb") as f:
-                    f.write(bytes.fromhex(page_data["data"]))
-                temp_files.append(temp_file)
-                image_section.pages.append(Page(file_path=temp_file))
+        def load_image(index: int) -> Page:
+            asset = page_store.load_page(db, document.id, page_indexes[index])
+            return Page(image_data=asset.data, mime_type=asset.mime_type)
 
+        writer = _CheckpointWriter(document, job, db, self.PROGRESS_COMMIT_INTERVAL)
         try:
-            # 解析图片
+            # 解析图片，每页完成后立即记录检查点
             user: User = document.owner
-            logger.debug(f"开始处理图片，共 {len(image_section.pages)} 页")
-            text_section = await parse_images(image_section, user)
-            logger.debug(f"文本提取完成，结果页数: {len(text_section.pages)}")
-
-            # 创建新的content_pages字典
-            new_content_pages = {}
-
-            # 更新文档内容
-            for i, page in enumerate(text_section.pages):
-                new_content_pages[str(i)] = page.content
-
-            # 更新文档的content_pages
-            document.content_pages = new_content_pages
-            logger.debug(f"处理后的content_pages: {document.content_pages}")
-
-            # 提交更改
-            db.commit()
-            logger.info(f"文本提取阶段完成，共处理 {len(new_content_pages)} 页")
-            return document
-
+            logger.debug(f"开始处理图片，共 {len(image_section.pages)} 页，已跳过 {len(extracted)} 页")
+            await parse_images(
+                image_section,
+                user,
+                image_loader=load_image,
+                on_page_done=lambda i, page: writer.page_done(JobStage.EXTRACT, page_indexes[i], page.content),
+            )
         except Exception as e:
             logger.error(f"文本提取阶段失败: {str(e)}")
             logger.error(traceback.format_exc())
             raise
+        finally:
+            writer.save(force=True)
 
-    async def stage_3(self, document: Document, db: Session) -> Document:
-        """翻译阶段：将英文文本翻译为中文."""
+        job.complete_stage(JobStage.EXTRACT)
+        db.commit()
+        logger.info(f"文本提取阶段完成，共处理 {len(page_indexes)} 页")
+        return document
+
+    async def stage_3(self, document: Document, job: ProcessingJob, db: Session) -> Document:
+        """翻译阶段：将英文文本翻译为中文，跳过检查点中已完成的页面."""
         logger.info(f"开始翻译文档: {document.filename}")
 
         # 构建文本Section
+        translated = job.get_checkpoint(JobStage.TRANSLATE)
+        page_keys = [k for k in sorted(document.content_pages, key=int) if int(k) not in translated]
         text_section = Section(
             title=document.filename,
-            pages=[Page(content=page_data) for page_data in document.content_pages.values()],
+            pages=[Page(content=document.content_pages[k]) for k in page_keys],
             file_type=FileType.TEXT,
             filename=document.filename,
         )
 
-        # 翻译文本
+        # 翻译文本，每页完成后立即记录检查点
         user: User = document.owner
-        translated_section = await translate_text(text_section, user)
-
-        # 更新文档翻译
-        new_translation_pages = {}
-        for i, page in enumerate(translated_section.pages):
-            new_translation_pages[str(i)] = page.content
-        document.translation_pages = new_translation_pages
+        writer = _CheckpointWriter(document, job, db, self.PROGRESS_COMMIT_INTERVAL)
+        try:
+            await translate_text(
+                text_section,
+                user,
+                on_page_done=lambda i, page: writer.page_done(JobStage.TRANSLATE, int(page_keys[i]), page.content),
+            )
+        finally:
+            writer.save(force=True)
 
+        job.complete_stage(JobStage.TRANSLATE)
         db.commit()
         return document
 
-    async def stage_4(self, document: Document, db: Session) -> Document:
+    async def stage_4(self, document: Document, job: ProcessingJob, db: Session) -> Document:
         """保存阶段：将处理后的内容保存到知识库."""
         logger.info(f"开始保存文档到知识库: {document.filename}")
         # 临时关闭索引/保存到知识库阶段：
@@ -435,47 +791,164 @@ class DocumentPipeline:
         # 2) 或者直接注释掉下方调用 rag.upload_document(document)
         if settings.DISABLE_KB_INDEXING:
             logger.info("[stage_4] 索引/保存已被禁用 (DISABLE_KB_INDEXING)，跳过保存到知识库阶段")
+            job.complete_stage(JobStage.INDEX)
+            db.commit()
             return document
         if settings.GLOBAL_MODE == "public":
             namespace = "public"
         else:
             namespace = document.owner.email
 
-        pg_docs_uri = (
-            f"postgresql+asyncpg://"
-            f"{settings.DATABASE_USER}:{settings.DATABASE_PASSWORD}"
-            f"@{settings.DATABASE_HOST}:{settings.DATABASE_PORT}/{settings.RAG_DATABASE_NAME}"
-        )
-        pg_vector_uri = (
-            f"postgresql+asyncpg://"
-            f"{settings.DATABASE_USER}:{settings.DATABASE_PASSWORD}"
-            f"@{settings.DATABASE_HOST}:{settings.DATABASE_PORT}/{settings.RAG_DATABASE_NAME}"
-        )
-        rag = KnowledgeBase(
-            pg_docs_uri,
-            pg_vector_uri,
-            "public",
-            namespace,
-        )
+        # 为缺少关键词的页面提取关键词，保存后重试和重新索引时直接复用
+        keywords_pages = await extract_keywords(document)
+        if keywords_pages != (document.keywords_pages or {}):
+            document.keywords_pages = keywords_pages
+            db.commit()
+
+        rag = await get_knowledge_base(namespace)
 
-        # 为每一页创建知识库条目
-        await rag.upload_document(document)
+        # 为每一页创建知识库条目，只写入有变化的条目
+        document.index_entries = await rag.upload_document(document)
+        job.complete_stage(JobStage.INDEX)
+        db.commit()
         return document
 
-    def _generate_thumbnail(self, file_path: str) -> bytes:
-        """生成缩略图."""
-        import io
+    async def stream_stages(self, document: Document, job: ProcessingJob, db: Session) -> Document:
+        """流式处理阶段：每页依次经过渲染、文本提取和翻译.
+
+        渲染、文本提取和翻译之间通过有界队列衔接，页面渲染完成后立即进入文本提取，提取完成后立即进入翻译，
+        总耗时接近最慢阶段的耗时而不是各阶段耗时之和。每页在各阶段完成后都会记录检查点，
+        恢复执行时已完成的页面直接从检查点所在阶段继续。
+        """
+        logger.info(f"开始流式处理文档: {document.filename}")
+        rendered = job.get_checkpoint(JobStage.RENDER)
+        extracted = job.get_checkpoint(JobStage.EXTRACT)
+        translated = job.get_checkpoint(JobStage.TRANSLATE)
+
+        # 临时文件放在任务工作区，处理结束（包括出错和取消）时删除
+        with open_workspace(job.id) as workspace:
+            ingester = DocsIngester(workspace)
+            pdf_path = None
+            if document.total_pages and len(rendered) >= document.total_pages:
+                # 全部页面已渲染（如只重新识别或重新翻译），无需再转换和读取PDF
+                total_pages = document.total_pages
+            else:
+                temp_file = workspace.write_file(document.filename, document.file_data)
+                pdf_path = await ingester.prepare_pdf(temp_file, document.filename)
+                self._save_converted_file(document, str(pdf_path))
+                total_pages = ingester.count_pages(pdf_path)
+            logger.debug(f"文档共 {total_pages} 页，已渲染 {len(rendered)} 页，已翻译 {len(translated)} 页")
+
+            document.total_pages = total_pages
+            if not job.page_checkpoints:
+                # 从头处理时清空现有内容
+                self._reset_document_pages(document, db)
+                document.thumbnail = None
+            db.commit()
 
-        from PIL import Image
+            user: User = document.owner
+            ocr_workers = settings.PIPELINE_OCR_WORKERS
+            translate_workers = settings.PIPELINE_TRANSLATE_WORKERS
+            ocr_queue: asyncio.Queue = asyncio.Queue(maxsize=settings.PIPELINE_QUEUE_SIZE)
+            translate_queue: asyncio.Queue = asyncio.Queue(maxsize=settings.PIPELINE_QUEUE_SIZE)
+            writer = _CheckpointWriter(document, job, db, self.PROGRESS_COMMIT_INTERVAL)
+
+            async def render_stage():
+                # 已渲染但尚未提取文本的页面直接从页面资源存储读取
+                for page_num in sorted(rendered - extracted):
+                    asset = page_store.load_page(db, document.id, page_num)
+                    await ocr_queue.put((page_num, Page(image_data=asset.data, mime_type=asset.mime_type)))
+                # 已提取文本但尚未翻译的页面直接进入翻译
+                for page_num in sorted(extracted - translated):
+                    await translate_queue.put((page_num, Page(content=writer.content_pages[str(page_num)])))
+
+                if document.thumbnail is None and pdf_path is not None:
+                    # 直接以缩略图分辨率渲染首页，不依赖文本提取用的页面图片
+                    document.thumbnail = await ingester.render_thumbnail(pdf_path)
+
+                pages_to_render = [i for i in range(total_pages) if i not in rendered]
+                async for page_num, page in ingester.iter_pdf_pages(
+                    pdf_path, pages_to_render, text_fast_path=settings.TEXT_LAYER_FAST_PATH
+                ):
+                    if page.content is not None:
+                        # 文字层完整的页面已直接提取文本，跳过视觉模型；先记录文本提取，保证渲染检查点中的页面都可恢复
+                        writer.page_done(JobStage.EXTRACT, page_num, page.content)
+                        writer.page_done(JobStage.RENDER, page_num)
+                        await translate_queue.put((page_num, page))
+                        continue
+                    image_data = self._take_page_image(page)
+                    page_store.save_page(db, document.id, page_num, image_data, page.mime_type)
+                    writer.page_done(JobStage.RENDER, page_num)
+                    await ocr_queue.put((page_num, Page(image_data=image_data, mime_type=page.mime_type)))
+                for _ in range(ocr_workers):
+                    await ocr_queue.put(None)
+
+            async def extract_worker():
+                openai_client = create_openai_client(user, priority=LLMPriority.BACKGROUND)
+                while (item := await ocr_queue.get()) is not None:
+                    page_num, page = item
+                    text_page = await process_single_page(openai_client, page)
+                    writer.page_done(JobStage.EXTRACT, page_num, text_page.content)
+                    await translate_queue.put((page_num, text_page))
+
+            async def extract_stage():
+                await gather_or_cancel(*(extract_worker() for _ in range(ocr_workers)))
+                for _ in range(translate_workers):
+                    await translate_queue.put(None)
+
+            def translation_done(page_num: int, translated_page: Page):
+                document.processor = f"流式处理阶段（已完成 {len(writer.translation_pages) + 1}/{total_pages} 页）..."
+                writer.page_done(JobStage.TRANSLATE, page_num, translated_page.content)
+
+            async def translate_worker():
+                openai_client = create_openai_client(user, priority=LLMPriority.BACKGROUND)
+                finished = False
+                while not finished and (item := await translate_queue.get()) is not None:
+                    # 取出队列中已经就绪的页面，在 token 预算内合并为一次翻译
+                    batch = [item]
+                    batch_tokens = estimate_tokens(item[1].content or "")
+                    while batch_tokens < settings.TRANSLATE_BATCH_TOKENS:
+                        try:
+                            item = translate_queue.get_nowait()
+                        except asyncio.QueueEmpty:
+                            break
+                        if item is None:
+                            finished = True
+                            break
+                        batch.append(item)
+                        batch_tokens += estimate_tokens(item[1].content or "")
+                    batch.sort(key=lambda entry: entry[0])
+                    await translate_pages(
+                        openai_client,
+                        [(page_num, text_page.content) for page_num, text_page in batch],
+                        DEFAULT_TARGET_LANGUAGE,
+                        on_page_done=translation_done,
+                        context_for=lambda page_num: writer.content_pages.get(str(page_num)),
+                    )
+
+            async def translate_stage():
+                await gather_or_cancel(*(translate_worker() for _ in range(translate_workers)))
+
+            try:
+                await gather_or_cancel(render_stage(), extract_stage(), translate_stage())
+            finally:
+                writer.save(force=True)
+
+            for stage in (JobStage.RENDER, JobStage.EXTRACT, JobStage.TRANSLATE):
+                job.complete_stage(stage)
+            db.commit()
+            logger.info(f"流式处理完成，共处理 {total_pages} 页")
+            return document
 
-        # 打开图片
-        with Image.open(file_path) as img:
-            # 调整大小
-            img.thumbnail((512, 512))
-            # 转换为字节流
-            thumb_io = io.BytesIO()
-            img.save(thumb_io, format="JPEG")
-            return thumb_io.getvalue()
+    @staticmethod
+    def _take_page_image(page: Page) -> bytes:
+        """取出渲染得到的页面图片数据，图片文件读取后立即删除，不在工作区中累积."""
+        if page.image_data is not None:
+            return page.image_data
+        with open(page.file_path, "rb") as f:
+            image_data = f.read()
+        os.remove(page.file_path)
+        return image_data
 
 
 def get_document_pipeline(request: Request) -> DocumentPipeline:
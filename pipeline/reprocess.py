@@ -0,0 +1,196 @@
+"""增量重新处理模块。
+
+每次处理完成时，在处理记录（ProcessingRecord.stage_stamps）中保存各阶段的版本戳和输入哈希：
+- render：渲染配置和文字层规则的版本，输入为文件哈希
+- extract：视觉模型和提取提示词的版本，输入为文件哈希
+- translate：文本模型、翻译提示词和目标语言的版本，输入为逐页原文的哈希
+- index：知识库写入方式、嵌入模型和关键词提取方式的版本，输入为全部页面内容的哈希；
+  另外单独记录关键词提取方式的版本，提取方式变化时清空已有关键词，重新索引时按新的方式提取
+
+重新处理时与当前版本比较，只重新执行失效的阶段和页面：例如只修改了翻译提示词时跳过渲染和文本提取，
+只重新翻译并重新索引；只更换了嵌入模型时只重新索引。
+"""
+
+import dataclasses
+import hashlib
+import json
+import os
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from clients.openai_client import resolve_model
+from config import get_settings
+from database import Document, JobStage, ProcessingRecord
+from models.users import User
+from prepdocs.parse_images import PARSE_PROMPT_VERSION
+from prepdocs.rasterizer import OCR_PROFILE
+from prepdocs.text_layer import TEXT_LAYER_VERSION
+from prepdocs.translate import DEFAULT_TARGET_LANGUAGE, TRANSLATE_PROMPT_VERSION
+from rag.knowledgebase import KnowledgeBase
+
+settings = get_settings()
+
+STAGES = (JobStage.RENDER, JobStage.EXTRACT, JobStage.TRANSLATE, JobStage.INDEX)
+KEYWORDS = "keywords"  # 版本和 index 阶段版本戳中关键词提取方式版本的键
+
+
+def _digest(*parts: Any) -> str:
+    """计算任意可 JSON 序列化内容的短哈希."""
+    data = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(data.encode()).hexdigest()[:16]
+
+
+def compute_stage_versions(user: User) -> Dict[str, str]:
+    """按当前配置计算各阶段的版本，任一影响阶段输出的配置变化都会改变版本.
+
+    除各阶段外还包含关键词提取方式的版本（键为 KEYWORDS），它同时计入 index 阶段的版本。
+    """
+    model = resolve_model(user)
+    keywords = _digest(settings.KEYWORD_EXTRACTOR, settings.KEYWORDS_PER_PAGE)
+    return {
+        JobStage.RENDER: _digest(dataclasses.asdict(OCR_PROFILE), settings.TEXT_LAYER_FAST_PATH, TEXT_LAYER_VERSION),
+        JobStage.EXTRACT: _digest(model, PARSE_PROMPT_VERSION),
+        JobStage.TRANSLATE: _digest(model, TRANSLATE_PROMPT_VERSION, DEFAULT_TARGET_LANGUAGE),
+        JobStage.INDEX: _digest(
+            KnowledgeBase.INDEX_VERSION,
+            os.getenv("EMBEDDING_MODEL"),
+            os.getenv("EMB_DIMENSIONS", "1536"),
+            settings.DISABLE_KB_INDEXING,
+            keywords,
+        ),
+        KEYWORDS: keywords,
+    }
+
+
+def _page_hashes(pages: Optional[Dict[str, str]]) -> Dict[str, str]:
+    return {key: _digest(text) for key, text in (pages or {}).items()}
+
+
+def _index_input(document: Document) -> str:
+    return _digest(document.content_pages, document.translation_pages, document.keywords_pages)
+
+
+def build_stage_stamps(document: Document, versions: Dict[str, str]) -> Dict[str, Any]:
+    """生成处理完成时各阶段的版本戳，保存到处理记录中."""
+    return {
+        JobStage.RENDER: {"version": versions[JobStage.RENDER], "input": document.file_hash},
+        JobStage.EXTRACT: {"version": versions[JobStage.EXTRACT], "input": document.file_hash},
+        JobStage.TRANSLATE: {
+            "version": versions[JobStage.TRANSLATE],
+            "pages": _page_hashes(document.content_pages),
+        },
+        JobStage.INDEX: {
+            "version": versions[JobStage.INDEX],
+            "input": _index_input(document),
+            KEYWORDS: versions[KEYWORDS],
+        },
+    }
+
+
+@dataclass
+class ReprocessPlan:
+    """重新处理计划：新任务预先写入的已完成阶段和逐页检查点.
+
+    full 为 True 时从头处理全部阶段；reset_keywords 为 True 时关键词提取方式已变化，需清空已有关键词。
+    """
+
+    full: bool = False
+    completed_stages: List[str] = field(default_factory=list)
+    page_checkpoints: Dict[str, List[int]] = field(default_factory=dict)
+    reset_keywords: bool = False
+
+    @property
+    def up_to_date(self) -> bool:
+        """全部阶段都未失效，无需重新处理."""
+        return not self.full and all(stage in self.completed_stages for stage in STAGES)
+
+    def describe(self) -> str:
+        """计划的简要说明，用于日志."""
+        if self.full:
+            return "从头处理全部阶段"
+        pending = [stage for stage in STAGES if stage not in self.completed_stages]
+        return f"重新执行阶段: {', '.join(pending) or '无'}"
+
+
+def plan_reprocessing(
+    document: Document,
+    record: Optional[ProcessingRecord],
+    asset_pages: List[int],
+    versions: Dict[str, str],
+) -> ReprocessPlan:
+    """比较上次处理的版本戳与当前版本，规划需要重新执行的阶段和页面.
+
+    Args:
+        document: 文档对象，包含上次处理的结果
+        record: 文档最近一次处理记录，没有记录或记录中没有版本戳时从头处理
+        asset_pages: 页面资源存储中保存了图片的页码；直接从文字层提取文本的页面没有图片
+        versions: 当前各阶段的版本，见 compute_stage_versions
+
+    Returns:
+        ReprocessPlan: 重新处理计划
+    """
+    stamps = (record.stage_stamps if record else None) or {}
+    render = stamps.get(JobStage.RENDER) or {}
+    total_pages = document.total_pages or 0
+    pages = set(range(total_pages))
+    content_pages = document.content_pages or {}
+    translation_pages = document.translation_pages or {}
+
+    # 文件或渲染方式变化时页面图片和文字层文本都已失效
+    if (
+        not total_pages
+        or set(stamps) != set(STAGES)
+        or render.get("input") != document.file_hash
+        or render.get("version") != versions[JobStage.RENDER]
+    ):
+        return ReprocessPlan(full=True)
+
+    # 文本提取：模型或提示词变化时重新识别有页面图片的页面，文字层页面的文本不依赖模型
+    assets = pages & set(asset_pages)
+    missing_content = {i for i in pages if str(i) not in content_pages}
+    if missing_content - assets:
+        # 既没有文本也没有图片的页面只能重新渲染
+        return ReprocessPlan(full=True)
+    if stamps[JobStage.EXTRACT].get("version") != versions[JobStage.EXTRACT]:
+        reextract = assets
+    else:
+        reextract = missing_content
+
+    # 翻译：版本变化时全部重新翻译，否则只翻译原文有变化、重新识别或缺少译文的页面
+    translate = stamps[JobStage.TRANSLATE]
+    if translate.get("version") != versions[JobStage.TRANSLATE]:
+        retranslate = set(pages)
+    else:
+        source_hashes = translate.get("pages") or {}
+        current_hashes = _page_hashes(content_pages)
+        retranslate = reextract | {
+            i
+            for i in pages
+            if str(i) not in translation_pages or source_hashes.get(str(i)) != current_hashes.get(str(i))
+        }
+
+    index = stamps[JobStage.INDEX]
+    # 已有页面的关键词不会被重新提取，提取方式变化时清空全部关键词
+    reset_keywords = index.get(KEYWORDS) != versions[KEYWORDS]
+    reindex = (
+        bool(reextract or retranslate)
+        or index.get("version") != versions[JobStage.INDEX]
+        or index.get("input") != _index_input(document)
+    )
+
+    completed_stages = [JobStage.RENDER]
+    if not reextract:
+        completed_stages.append(JobStage.EXTRACT)
+    if not retranslate:
+        completed_stages.append(JobStage.TRANSLATE)
+    if not reindex:
+        completed_stages.append(JobStage.INDEX)
+    return ReprocessPlan(
+        completed_stages=completed_stages,
+        page_checkpoints={
+            JobStage.RENDER: sorted(pages),
+            JobStage.EXTRACT: sorted(pages - reextract),
+            JobStage.TRANSLATE: sorted(pages - retranslate),
+        },
+        reset_keywords=reset_keywords,
+    )
@@ -0,0 +1,119 @@
+"""文档处理任务调度模块。
+
+工作器领取任务时按以下规则选择：
+1. 优先级：用户手动重试的任务优先于普通上传，普通上传优先于大文档和批量任务；
+   排队时间每超过 PIPELINE_PRIORITY_AGING_SECONDS 提升一级，低优先级任务不会被无限推迟。
+2. 同一优先级内按用户公平排队：每个用户累计已领取任务的开销（按文件大小估计），
+   下一个任务交给累计开销最小的用户。一个用户批量上传大量文档时，其他用户新上传的文档仍会很快被处理。
+3. 全局在途上限：所有工作器正在处理的文档数达到 PIPELINE_MAX_IN_FLIGHT 时不再领取新任务。
+   统计和领取在同一事务中进行，并由在途锁串行化。
+
+公平排队的状态保存在各工作器进程内，多个工作器时各自近似公平。
+"""
+
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import func, text
+from sqlalchemy.orm import Session
+
+from config import get_settings
+from database import Document, JobPriority, JobStatus, ProcessingJob
+
+settings = get_settings()
+
+COST_UNIT_BYTES = 1024 * 1024  # 每 1MB 文件大小计为一个开销单位
+IN_FLIGHT_LOCK_KEY = 0x50495045  # 在途锁使用的 PostgreSQL 咨询锁键
+
+
+def job_priority(document: Document) -> int:
+    """按文档大小确定默认优先级：大文档以批量优先级排队."""
+    if (document.file_size or 0) > settings.PIPELINE_LARGE_DOCUMENT_MB * 1024 * 1024:
+        return JobPriority.BULK
+    return JobPriority.NORMAL
+
+
+def job_cost(document: Document) -> int:
+    """估计处理文档的开销，用于在用户之间分配处理能力."""
+    return 1 + (document.file_size or 0) // COST_UNIT_BYTES
+
+
+def effective_priority(priority: int, queued_at: Optional[datetime], now: datetime) -> int:
+    """计算考虑排队时间后的优先级."""
+    aging = settings.PIPELINE_PRIORITY_AGING_SECONDS
+    if not aging or queued_at is None:
+        return priority
+    promoted = int((now - queued_at).total_seconds() // aging)
+    return max(priority - promoted, JobPriority.INTERACTIVE)
+
+
+class FairQueue:
+    """按用户公平排队（起始时间公平排队，效果与差额轮询相同）.
+
+    每个用户有一个虚拟时间，领取任务后增加任务开销；下一个任务交给虚拟时间最小的用户。
+    空闲后重新排队的用户从当前虚拟时间开始计算，不会因为之前空闲而积累额度。
+    """
+
+    def __init__(self):
+        self.virtual_time = 0.0
+        self.finish_times: Dict[Optional[int], float] = {}
+
+    def order(self, owners: Iterable[Optional[int]]) -> List[Optional[int]]:
+        """按应被服务的先后顺序排列有排队任务的用户."""
+        owners = list(owners)
+        for owner in owners:
+            self.finish_times[owner] = max(self.finish_times.get(owner, 0.0), self.virtual_time)
+        # 清理不再排队的用户，避免长期运行时无限增长
+        for owner in set(self.finish_times) - set(owners):
+            if self.finish_times[owner] <= self.virtual_time:
+                del self.finish_times[owner]
+        return sorted(owners, key=lambda owner: (self.finish_times[owner], owner is None, owner or 0))
+
+    def charge(self, owner: Optional[int], cost: int):
+        """记录用户领取了一个任务."""
+        start = max(self.finish_times.get(owner, 0.0), self.virtual_time)
+        self.virtual_time = start
+        self.finish_times[owner] = start + max(cost, 1)
+
+
+def count_in_flight(db: Session, now: datetime) -> int:
+    """所有工作器正在处理（租约未过期）的任务数."""
+    return (
+        db.query(func.count(ProcessingJob.id))
+        .filter(ProcessingJob.status == JobStatus.RUNNING, ProcessingJob.lease_expires_at >= now)
+        .scalar()
+    )
+
+
+def lock_in_flight(db: Session):
+    """获取在途锁，直到当前事务结束时释放.
+
+    PostgreSQL 上使用事务级咨询锁；SQLite 的写事务本身是串行的，无需加锁。
+    """
+    if db.bind.dialect.name == "postgresql":
+        db.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": IN_FLIGHT_LOCK_KEY})
+
+
+def queue_stats(db: Session, now: Optional[datetime] = None) -> dict:
+    """任务队列统计：各优先级的排队数、各用户的排队数、在途任务数和最长排队时间."""
+    now = now or datetime.now()
+    queued = db.query(ProcessingJob).filter(ProcessingJob.status == JobStatus.QUEUED)
+    by_priority = dict(
+        queued.with_entities(ProcessingJob.priority, func.count(ProcessingJob.id)).group_by(ProcessingJob.priority)
+    )
+    by_owner = (
+        queued.with_entities(ProcessingJob.owner_id, func.count(ProcessingJob.id))
+        .group_by(ProcessingJob.owner_id)
+        .order_by(func.count(ProcessingJob.id).desc())
+        .limit(20)
+        .all()
+    )
+    oldest = queued.with_entities(func.min(ProcessingJob.updated_at)).scalar()
+    return {
+        "queued": sum(by_priority.values()),
+        "queuedByPriority": {str(priority): count for priority, count in by_priority.items()},
+        "queuedByOwner": [{"ownerId": owner_id, "queued": count} for owner_id, count in by_owner],
+        "running": count_in_flight(db, now),
+        "maxInFlight": settings.PIPELINE_MAX_IN_FLIGHT,
+        "oldestQueuedSeconds": (now - oldest).total_seconds() if oldest else 0,
+    }
@@ -0,0 +1,307 @@
+"""文档处理工作器模块。
+
+从数据库任务表中以租约方式领取文档处理任务并执行，支持在多个进程或节点上同时运行。 领取任务使用 `SELECT ... FOR UPDATE SKIP
+LOCKED` 加条件更新，保证同一任务只会被一个工作器持有； 工作器失联后租约到期，任务会被其他工作器接管并从检查点继续。
+"""
+
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.engine import Row
+from sqlalchemy.orm import Session, aliased
+
+from clients.client_pool import close_clients
+from config import get_settings
+from database import JobStatus, ProcessingJob, get_db
+from pipeline.scheduler import FairQueue, count_in_flight, effective_priority, lock_in_flight
+from prepdocs.office_converter import shutdown_office_converter
+from prepdocs.rasterizer import get_rasterizer
+from rag.registry import close_knowledge_bases
+from services.workspace import sweep_orphaned_workspaces
+
+if TYPE_CHECKING:
+    from pipeline.document_pipeline import DocumentPipeline
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+
+class CancelReason:
+    """工作器取消正在执行的任务的原因.
+
+    - REQUESTED: 用户请求取消，任务标记为失败
+    - DELETED: 文档已被删除，任务记录随之删除
+    - LEASE_LOST: 租约已被其他工作器接管，由接管的工作器继续处理
+    - SUPERSEDED: 任务已被强制重新处理创建的新任务取代
+    """
+
+    REQUESTED = "requested"
+    DELETED = "deleted"
+    LEASE_LOST = "lease_lost"
+    SUPERSEDED = "superseded"
+
+
+class PipelineWorker:
+    """文档处理工作器类。
+
+    循环领取排队中或租约已过期的任务，交给 DocumentPipeline 执行，并定期续约正在处理的任务。
+    领取顺序按优先级和用户公平排队决定，见 pipeline.scheduler。
+    每次轮询时检查正在处理的任务，请求取消、文档已删除或租约被接管的任务会被立即终止。
+    停止时取消正在处理的任务，任务回到排队状态，由下一个工作器从检查点继续。
+    """
+
+    def __init__(self, pipeline: "DocumentPipeline", concurrency: Optional[int] = None):
+        """初始化工作器。
+
+        Args:
+            pipeline: 执行任务的文档处理流水线
+            concurrency: 同时处理的最大任务数，默认为 MAX_CONCURRENT_TASKS
+        """
+        self.pipeline = pipeline
+        self.concurrency = concurrency or settings.MAX_CONCURRENT_TASKS
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.lease_duration = timedelta(seconds=settings.PIPELINE_LEASE_SECONDS)
+        self.tasks: Dict[int, asyncio.Task] = {}
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._stopping = False
+        self._last_heartbeat = 0.0
+        self.fair_queue = FairQueue()
+
+    async def run(self):
+        """运行工作器主循环，直到调用 stop."""
+        self.loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        # 清理已退出进程遗留的任务工作区，这些工作区所属的任务会被重新领取并在新的工作区中继续
+        await asyncio.to_thread(sweep_orphaned_workspaces)
+        logger.info(f"文档处理工作器启动: {self.worker_id}，并发数: {self.concurrency}")
+        await asyncio.to_thread(self.pipeline.enqueue_unscheduled_documents)
+
+        # 数据库操作都在线程中执行，不阻塞同一事件循环中正在处理的任务
+        while not self._stopping:
+            await self._check_cancellations()
+            await self._renew_leases()
+            while len(self.tasks) < self.concurrency and not self._stopping:
+                job_id = await asyncio.to_thread(self._lease_job)
+                if job_id is None:
+                    break
+                self._start(job_id)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=settings.PIPELINE_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+        await self._cancel_running()
+        await close_clients()
+        await close_knowledge_bases()
+        await asyncio.to_thread(get_rasterizer().shutdown)
+        await asyncio.to_thread(shutdown_office_converter)
+        logger.info(f"文档处理工作器已停止: {self.worker_id}")
+
+    def notify(self):
+        """唤醒工作器立即检查任务队列，可在其他线程中调用."""
+        if self.loop and self._wakeup:
+            self.loop.call_soon_threadsafe(self._wakeup.set)
+
+    def stop(self):
+        """停止领取新任务并退出主循环，可在其他线程中调用."""
+        self._stopping = True
+        self.notify()
+
+    def _start(self, job_id: int):
+        """启动已领取的任务."""
+        task = asyncio.create_task(self.pipeline.process_job(job_id))
+        self.tasks[job_id] = task
+        task.add_done_callback(lambda t: self._on_task_done(job_id, t))
+
+    def _on_task_done(self, job_id: int, task: asyncio.Task):
+        """任务结束后释放名额并唤醒主循环领取下一个任务."""
+        self.tasks.pop(job_id, None)
+        self.pipeline.cancelled_jobs.pop(job_id, None)
+        if not task.cancelled() and task.exception():
+            logger.debug(f"任务 {job_id} 执行失败: {task.exception()}")
+        self._wakeup.set()
+
+    async def _cancel_running(self):
+        """取消正在处理的任务，任务会释放租约并回到排队状态."""
+        for task in self.tasks.values():
+            task.cancel()
+        await asyncio.gather(*self.tasks.values(), return_exceptions=True)
+
+    @staticmethod
+    def _leasable(now: datetime):
+        """可领取任务的过滤条件：排队中，或执行中但租约已过期.
+
+        同一文档的其他任务仍持有未过期的租约时不可领取，例如被强制重新处理取代、尚未被原工作器终止的旧任务，
+        避免新旧任务同时处理同一文档。
+        """
+        other = aliased(ProcessingJob)
+        held = (
+            select(other.id)
+            .where(
+                other.document_id == ProcessingJob.document_id,
+                other.id != ProcessingJob.id,
+                other.locked_by.is_not(None),
+                other.lease_expires_at >= now,
+            )
+            .exists()
+        )
+        return and_(
+            or_(
+                ProcessingJob.status == JobStatus.QUEUED,
+                and_(
+                    ProcessingJob.status == JobStatus.RUNNING,
+                    or_(ProcessingJob.lease_expires_at.is_(None), ProcessingJob.lease_expires_at < now),
+                ),
+            ),
+            ~held,
+        )
+
+    def _lease_job(self) -> Optional[int]:
+        """原子地领取一个任务，返回任务ID；没有可领取的任务或达到全局在途上限时返回None.
+
+        先选出考虑排队时间后优先级最高的任务所属的用户，再按公平排队的顺序依次尝试领取这些用户的任务。
+        同一优先级中最早入队的任务老化得最多，因此每个用户只需比较各优先级最早入队的任务。
+        有全局在途上限时，统计在途任务数到领取任务提交之间持有在途锁，多个工作器不会同时通过检查而超出上限。
+        """
+        db = next(get_db())
+        try:
+            now = datetime.now()
+            if settings.PIPELINE_MAX_IN_FLIGHT:
+                lock_in_flight(db)
+                if count_in_flight(db, now) >= settings.PIPELINE_MAX_IN_FLIGHT:
+                    db.commit()
+                    return None
+
+            heads = (
+                db.query(ProcessingJob.owner_id, ProcessingJob.priority, func.min(ProcessingJob.updated_at))
+                .filter(self._leasable(now))
+                .group_by(ProcessingJob.owner_id, ProcessingJob.priority)
+                .all()
+            )
+            # 用户 -> (考虑排队时间后的优先级, 入队时间, 任务的原始优先级)，取每个用户最应优先领取的任务
+            owner_heads: Dict[Optional[int], Tuple[int, datetime, int]] = {}
+            for owner_id, priority, queued_at in heads:
+                head = (effective_priority(priority, queued_at, now), queued_at, priority)
+                if owner_id not in owner_heads or head < owner_heads[owner_id]:
+                    owner_heads[owner_id] = head
+            if not owner_heads:
+                db.commit()
+                return None
+
+            top = min(head[0] for head in owner_heads.values())
+            for owner_id in self.fair_queue.order(o for o, head in owner_heads.items() if head[0] == top):
+                leased = self._lease_owner_job(db, owner_id, owner_heads[owner_id][2], now)
+                if leased is not None:
+                    db.commit()
+                    self.fair_queue.charge(owner_id, leased.cost or 1)
+                    return leased.id
+            db.commit()
+            return None
+        finally:
+            db.close()
+
+    def _lease_owner_job(self, db: Session, owner_id: Optional[int], priority: int, now: datetime) -> Optional[Row]:
+        """在当前事务中领取指定用户在指定原始优先级中最早入队的任务，该任务考虑排队时间后的优先级最高.
+
+        Returns:
+            Optional[Row]: 领取到的任务ID和开销，由调用方提交事务
+        """
+        owner_filter = ProcessingJob.owner_id.is_(None) if owner_id is None else ProcessingJob.owner_id == owner_id
+        candidate = (
+            db.query(ProcessingJob.id, ProcessingJob.cost)
+            .filter(self._leasable(now), owner_filter, ProcessingJob.priority == priority)
+            .order_by(ProcessingJob.updated_at, ProcessingJob.id)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+            .first()
+        )
+        if not candidate:
+            return None
+        # 条件更新保证不支持 SKIP LOCKED 的数据库（如 SQLite）上同样只有一个工作器能领取成功
+        leased = (
+            db.query(ProcessingJob)
+            .filter(ProcessingJob.id == candidate.id, self._leasable(now))
+            .update(
+                {
+                    ProcessingJob.status: JobStatus.RUNNING,
+                    ProcessingJob.locked_by: self.worker_id,
+                    ProcessingJob.lease_expires_at: now + self.lease_duration,
+                },
+                synchronize_session=False,
+            )
+        )
+        return candidate if leased else None
+
+    @staticmethod
+    def _load_job_states(job_ids: List[int]) -> List[Row]:
+        """读取任务的状态、租约持有者和取消请求."""
+        db = next(get_db())
+        try:
+            return (
+                db.query(
+                    ProcessingJob.id, ProcessingJob.status, ProcessingJob.locked_by, ProcessingJob.cancel_requested
+                )
+                .filter(ProcessingJob.id.in_(job_ids))
+                .all()
+            )
+        finally:
+            db.close()
+
+    async def _check_cancellations(self):
+        """终止请求取消、文档已删除或租约已被其他工作器接管的任务.
+
+        取消原因记录在 DocumentPipeline.cancelled_jobs 中，由 process_job 据此决定如何结束任务。
+        """
+        if not self.tasks:
+            return
+        rows = await asyncio.to_thread(self._load_job_states, list(self.tasks))
+
+        jobs = {row.id: row for row in rows}
+        for job_id, task in list(self.tasks.items()):
+            if task.done() or job_id in self.pipeline.cancelled_jobs:
+                continue
+            row = jobs.get(job_id)
+            if row is None:
+                reason = CancelReason.DELETED
+            elif row.cancel_requested:
+                reason = CancelReason.REQUESTED
+            elif row.locked_by != self.worker_id:
+                reason = CancelReason.LEASE_LOST
+            elif row.status == JobStatus.FAILED:
+                reason = CancelReason.SUPERSEDED
+            else:
+                continue
+            logger.info(f"终止处理任务 {job_id}: {reason}")
+            self.pipeline.cancelled_jobs[job_id] = reason
+            task.cancel()
+
+    async def _renew_leases(self):
+        """每隔租约时长的三分之一为正在处理的任务续约."""
+        if not self.tasks or self.loop.time() - self._last_heartbeat < self.lease_duration.total_seconds() / 3:
+            return
+        await asyncio.to_thread(self._extend_leases, list(self.tasks))
+        self._last_heartbeat = self.loop.time()
+
+    def _extend_leases(self, job_ids: List[int]):
+        """延长本工作器持有的任务租约."""
+        db = next(get_db())
+        try:
+            db.query(ProcessingJob).filter(
+                ProcessingJob.id.in_(job_ids),
+                ProcessingJob.locked_by == self.worker_id,
+            ).update(
+                {ProcessingJob.lease_expires_at: datetime.now() + self.lease_duration},
+                synchronize_session=False,
+            )
+            db.commit()
+        finally:
+            db.close()
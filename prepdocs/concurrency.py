@@ -0,0 +1,19 @@
+"""并发执行工具模块。"""
+
+import asyncio
+from typing import Any, Awaitable, List
+
+
+async def gather_or_cancel(*aws: Awaitable[Any]) -> List[Any]:
+    """并发运行协程，任一协程失败或调用方被取消时取消其余协程，并抛出原始异常.
+
+    与 asyncio.gather 不同，失败后其余协程不会继续运行，已排队的页面不再调用模型。
+    """
+    tasks = [asyncio.ensure_future(aw) for aw in aws]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
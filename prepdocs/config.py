@@ -4,6 +4,7 @@
 """
 
 from dataclasses import dataclass
+from typing import Optional
 
 
 class FileType:
@@ -18,15 +19,65 @@ class FileType:
     TEXT = "text"
 
 
+class ImageFormat:
+    """页面图片编码格式定义类."""
+
+    PNG = "PNG"
+    JPEG = "JPEG"
+    WEBP = "WEBP"
+
+
+_IMAGE_FORMAT_INFO = {
+    ImageFormat.PNG: ("image/png", "png"),
+    ImageFormat.JPEG: ("image/jpeg", "jpg"),
+    ImageFormat.WEBP: ("image/webp", "webp"),
+}
+
+
+@dataclass(frozen=True)
+class RenderProfile:
+    """页面渲染配置。
+
+    不同用途的页面图片使用不同的分辨率和编码：文本提取按页面文字密度选择 DPI，
+    缩略图直接按目标尺寸以低分辨率渲染，存档保留无损的高分辨率图片。
+    """
+
+    name: str
+    dpi: int  # 基础渲染 DPI
+    image_format: str = ImageFormat.PNG  # 编码格式
+    quality: int = 90  # JPEG/WebP 的编码质量（1-100），PNG 忽略
+    grayscale: bool = False  # 是否渲染为灰度图
+    min_dpi: Optional[int] = None  # 文字稀疏页面使用的 DPI，为空时不按文字密度调整
+    max_dpi: Optional[int] = None  # 文字密集页面使用的 DPI，为空时不按文字密度调整
+    max_side: Optional[int] = None  # 图片长边的最大像素数，缩略图按此尺寸渲染
+
+    @property
+    def adaptive(self) -> bool:
+        """是否按页面文字密度调整 DPI."""
+        return self.min_dpi is not None and self.max_dpi is not None
+
+    @property
+    def mime_type(self) -> str:
+        """编码格式对应的MIME类型."""
+        return _IMAGE_FORMAT_INFO[self.image_format][0]
+
+    @property
+    def extension(self) -> str:
+        """编码格式对应的文件扩展名."""
+        return _IMAGE_FORMAT_INFO[self.image_format][1]
+
+
 @dataclass
 class Page:
     """页面数据类。
 
-    存储单个页面的文件路径和文本内容。
+    存储单个页面的文件路径和文本内容，页面图片也可以直接以二进制形式携带。
     """
 
     file_path: str = None  # 文件路径
     content: str = None  # 可选的文本内容
+    image_data: bytes = None  # 可选的页面图片二进制数据，存在时优先于 file_path
+    mime_type: str = "image/png"  # 页面图片的MIME类型
 
     def to_dict(self):
         """将页面数据转换为字典格式。
@@ -0,0 +1,214 @@
+"""关键词提取模块。
+
+写入知识库前为每页提取关键词，保存到 Document.keywords_pages，作为知识库条目的元数据参与向量化。
+已有关键词的页面直接复用，只为新页面和重新提取了文本的页面提取。提取方式由 KEYWORD_EXTRACTOR 决定：
+- local（默认）：本地统计方法，不调用模型。候选短语按停用词和标点切分（RAKE），按词的共现度评分，
+  再乘以短语在文档各页中的逆文档频率，页眉页脚等每页都出现的短语得分很低；中文按虚词切分为候选短语。
+- llm：多页合并为一个请求，由文本模型为每页给出关键词。
+- none：不提取关键词。
+"""
+
+import asyncio
+import json
+import logging
+import math
+import re
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from clients.llm_scheduler import LLMPriority
+from clients.openai_client import OpenAIClient, create_openai_client
+from config import Settings, get_settings
+from database import Document
+from prepdocs.concurrency import gather_or_cancel
+
+logger = logging.getLogger(__name__)
+
+settings: Settings = get_settings()
+
+MAX_PHRASE_WORDS = 3  # 候选短语的最大词数
+LLM_PAGE_CHARS = 2000  # llm 方式每页发送给模型的最大字符数
+
+STOPWORDS = frozenset(
+    """
+    a about above after again against all also am an and any are as at be because been before being below between
+    both but by can could did do does doing down during each either et al etc few for from further had has have
+    having he her here hers herself him himself his how however i ie if in into is it its itself just may me might
+    more most must my myself no nor not now of off on once only or other our ours ourselves out over own same she
+    should since so some such than that the their theirs them themselves then there therefore these they this those
+    through thus to too under until up upon use used using very via was we were what when where which while who
+    whom why will with within without would yet you your yours yourself yourselves fig figure table eq page section
+    allow allows achieve achieves based give given gives make makes made present presented propose proposed rely
+    relies replace replaces show shows shown well new first second paper entirely respectively
+    """.split()
+)
+CJK_STOP_CHARS = "的了是在和与及或等对为中也而将被这那其之以于由从到并有不我你他她它们个一上下"
+MAX_CJK_PHRASE_CHARS = 8  # 中文候选短语的最大字数
+
+_URL_PATTERN = re.compile(r"https?://\S+")
+_TOKEN_PATTERN = re.compile(r"[A-Za-z][A-Za-z0-9'-]*|[一-鿿]+|\S")
+_CJK_PATTERN = re.compile(r"[一-鿿]+")
+_CJK_STOP_PATTERN = re.compile(f"[{CJK_STOP_CHARS}]+")
+
+
+def _candidate_phrases(text: str) -> Iterable[Tuple[str, ...]]:
+    """按停用词、标点、数字和语言切换把页面文本切分为候选短语，每个短语为小写词的元组.
+
+    超过 MAX_PHRASE_WORDS 个词的连续片段通常是句子而不是术语，不作为候选短语。
+    """
+    phrase: List[str] = []
+    for token in _TOKEN_PATTERN.findall(_URL_PATTERN.sub(" ", text)):
+        word = token.lower().strip("'-")
+        if _CJK_PATTERN.fullmatch(token):
+            if phrase:
+                yield tuple(phrase)
+                phrase = []
+            for segment in _CJK_STOP_PATTERN.split(token):
+                if 2 <= len(segment) <= MAX_CJK_PHRASE_CHARS:
+                    yield (segment,)
+        elif len(word) >= 2 and word[0].isalpha() and word not in STOPWORDS:
+            phrase.append(word)
+        elif phrase:
+            if len(phrase) <= MAX_PHRASE_WORDS:
+                yield tuple(phrase)
+            phrase = []
+    if phrase and len(phrase) <= MAX_PHRASE_WORDS:
+        yield tuple(phrase)
+
+
+def extract_keywords_local(
+    pages: Dict[str, str], top_k: int, targets: Optional[Iterable[str]] = None
+) -> Dict[str, List[str]]:
+    """用本地统计方法提取逐页关键词.
+
+    Args:
+        pages: 页码到页面文本的映射，全部页面用于计算逆文档频率
+        top_k: 每页的关键词数
+        targets: 需要提取关键词的页码，默认为全部页面
+
+    Returns:
+        Dict[str, List[str]]: 页码到关键词列表的映射
+    """
+    page_phrases = {key: Counter(_candidate_phrases(text or "")) for key, text in pages.items()}
+    document_frequency: Counter = Counter()
+    for phrases in page_phrases.values():
+        document_frequency.update(phrases.keys())
+
+    results: Dict[str, List[str]] = {}
+    for key in pages if targets is None else targets:
+        phrases = page_phrases.get(key)
+        if not phrases:
+            continue
+        # RAKE：词的得分为共现度与词频之比，长短语中的词得分更高
+        frequency: Counter = Counter()
+        degree: Dict[str, int] = defaultdict(int)
+        for phrase, count in phrases.items():
+            for word in phrase:
+                frequency[word] += count
+                degree[word] += len(phrase) * count
+        scores = {}
+        for phrase, count in phrases.items():
+            idf = math.log((1 + len(pages)) / (1 + document_frequency[phrase])) + 1
+            rake = sum(degree[word] / frequency[word] for word in phrase)
+            scores[phrase] = rake * (1 + math.log(count)) * idf
+
+        keywords: List[str] = []
+        for phrase in sorted(scores, key=lambda p: (-scores[p], p)):
+            keyword = "".join(phrase) if _CJK_PATTERN.fullmatch(phrase[0]) else " ".join(phrase)
+            # 跳过已选短语的一部分
+            if any(keyword in chosen for chosen in keywords):
+                continue
+            keywords.append(keyword)
+            if len(keywords) == top_k:
+                break
+        results[key] = keywords
+    return results
+
+
+def _build_llm_message(pages: List[Tuple[str, str]], top_k: int) -> str:
+    parts = [
+        f"Extract up to {top_k} keywords or key phrases for each page below. Reply with a JSON object only,"
+        f' mapping each page number to a list of keywords, for example {{"{pages[0][0]}": ["keyword", ...]}}.'
+        f" Keep the keywords in the language of the page."
+    ]
+    for key, text in pages:
+        parts.append(f"[[PAGE {key}]]\n{text[:LLM_PAGE_CHARS]}")
+    return "\n\n".join(parts)
+
+
+def _parse_llm_response(text: str, keys: List[str], top_k: int) -> Dict[str, List[str]]:
+    """解析模型返回的 JSON，忽略无法解析的内容和不在本批次中的页码."""
+    match = re.search(r"\{.*\}", text, re.DOTALL)
+    if not match:
+        return {}
+    try:
+        data = json.loads(match.group(0))
+    except json.JSONDecodeError:
+        return {}
+    results = {}
+    for key in keys:
+        keywords = data.get(key) if isinstance(data, dict) else None
+        if isinstance(keywords, list):
+            results[key] = [str(keyword).strip() for keyword in keywords if str(keyword).strip()][:top_k]
+    return results
+
+
+async def extract_keywords_llm(
+    openai_client: OpenAIClient, pages: Dict[str, str], top_k: int, batch_pages: int
+) -> Dict[str, List[str]]:
+    """按批调用文本模型提取逐页关键词，失败的批次只记录日志.
+
+    Args:
+        openai_client: OpenAI客户端实例
+        pages: 需要提取关键词的页码到页面文本的映射
+        top_k: 每页的关键词数
+        batch_pages: 每个请求包含的页数
+
+    Returns:
+        Dict[str, List[str]]: 页码到关键词列表的映射
+    """
+    items = [(key, text) for key, text in pages.items() if text and text.strip()]
+    batches = [items[i : i + max(batch_pages, 1)] for i in range(0, len(items), max(batch_pages, 1))]
+    results: Dict[str, List[str]] = {}
+
+    async def process_batch(batch: List[Tuple[str, str]]):
+        keys = [key for key, _ in batch]
+        response = await openai_client.chat_with_text(_build_llm_message(batch, top_k))
+        if "error" in response:
+            logger.warning(f"关键词提取失败（第 {', '.join(keys)} 页）: {response['error']}")
+            return
+        parsed = _parse_llm_response(response["text"], keys, top_k)
+        if len(parsed) < len(keys):
+            logger.warning(f"关键词提取结果不完整，{len(keys) - len(parsed)} 页没有关键词")
+        results.update(parsed)
+
+    await gather_or_cancel(*(process_batch(batch) for batch in batches))
+    return results
+
+
+async def extract_keywords(document: Document) -> Dict[str, List[str]]:
+    """为缺少关键词的页面提取关键词.
+
+    Args:
+        document: 文档对象，使用其 content_pages 和已有的 keywords_pages
+
+    Returns:
+        Dict[str, List[str]]: 合并后的逐页关键词，没有需要提取的页面时与已有关键词相同
+    """
+    keywords_pages: Dict[str, List[str]] = dict(document.keywords_pages or {})
+    pages: Dict[str, str] = document.content_pages or {}
+    missing = [key for key, text in pages.items() if key not in keywords_pages and text and text.strip()]
+    if settings.KEYWORD_EXTRACTOR == "none" or not missing:
+        return keywords_pages
+
+    top_k = settings.KEYWORDS_PER_PAGE
+    if settings.KEYWORD_EXTRACTOR == "llm":
+        openai_client = create_openai_client(document.owner, priority=LLMPriority.BACKGROUND)
+        extracted = await extract_keywords_llm(
+            openai_client, {key: pages[key] for key in missing}, top_k, settings.KEYWORD_LLM_BATCH_PAGES
+        )
+    else:
+        extracted = await asyncio.to_thread(extract_keywords_local, pages, top_k, missing)
+    logger.info(f"为文档 {document.id} 的 {len(extracted)} 页提取了关键词（{settings.KEYWORD_EXTRACTOR}）")
+    keywords_pages.update(extracted)
+    return {key: keywords_pages[key] for key in sorted(keywords_pages, key=int)}
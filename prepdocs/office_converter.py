@@ -0,0 +1,265 @@
+"""Office 文档转换服务模块。
+
+维护一组常驻的无界面 LibreOffice 实例（由 unoserver 托管），DOCX、PPTX 转 PDF 时直接交给空闲实例，
+不再为每个文件冷启动一次 soffice。每个实例使用独立的用户配置目录，并发转换不会争用同一份配置；
+实例数量即同时进行的转换数上限，转换超时的实例会被终止并在下次使用时重新启动。
+
+未安装 unoserver 或找不到带 uno 模块的 Python 解释器时，退化为每次启动一个 soffice 进程，
+同样使用独立的用户配置目录、超时和并发上限。
+"""
+
+import asyncio
+import importlib.util
+import logging
+import os
+import shutil
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+import xmlrpc.client
+from pathlib import Path
+from typing import List, Optional
+
+from config import get_settings
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+STARTUP_TIMEOUT = 60.0  # 等待 LibreOffice 实例就绪的最长时间（秒）
+ACQUIRE_POLL_INTERVAL = 0.1  # 等待空闲实例的轮询间隔（秒）
+MAX_CONVERSIONS_PER_INSTANCE = 200  # 单个实例完成该数量的转换后重启，释放 LibreOffice 累积的内存
+
+
+class OfficeConversionError(Exception):
+    """Office 文档转换失败."""
+
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _unoserver_pythonpath() -> Optional[str]:
+    """返回 unoserver 所在的 site-packages 目录，供带 uno 模块的解释器导入 unoserver."""
+    spec = importlib.util.find_spec("unoserver")
+    if spec is None or spec.origin is None:
+        return None
+    return str(Path(spec.origin).parent.parent)
+
+
+class _OfficeInstance:
+    """单个 LibreOffice 实例，拥有独立的用户配置目录.
+
+    warm 为 True 时常驻一个 unoserver 进程，否则每次转换启动一个 soffice 进程。
+    """
+
+    def __init__(self, index: int, warm: bool):
+        self.index = index
+        self.warm = warm
+        self.profile_dir = tempfile.mkdtemp(prefix=f"thelab-libreoffice-{index}-")
+        self.process: Optional[subprocess.Popen] = None
+        self.port: Optional[int] = None
+        self.conversions = 0
+
+    def alive(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def ensure_started(self):
+        """启动 unoserver 并等待其就绪，已在运行时直接返回."""
+        if not self.warm or self.alive():
+            return
+        self.stop()
+        self.port = _free_port()
+        cmd = [
+            settings.LIBREOFFICE_PYTHON,
+            "-m",
+            "unoserver.server",
+            "--port",
+            str(self.port),
+            "--uno-port",
+            str(_free_port()),
+            "--user-installation",
+            self.profile_dir,
+            "--conversion-timeout",
+            str(settings.LIBREOFFICE_CONVERT_TIMEOUT),
+            "--quiet",
+        ]
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.pathsep.join(filter(None, [_unoserver_pythonpath(), env.get("PYTHONPATH")]))
+        self.process = subprocess.Popen(cmd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                stderr = self.process.stderr.read().decode(errors="replace")
+                self.process = None
+                raise OfficeConversionError(f"LibreOffice 实例启动失败: {stderr.strip()}")
+            try:
+                with xmlrpc.client.ServerProxy(f"http://127.0.0.1:{self.port}", allow_none=True) as proxy:
+                    proxy.info()
+                logger.info(f"LibreOffice 实例 {self.index} 已就绪，端口: {self.port}")
+                return
+            except (ConnectionError, OSError):
+                time.sleep(0.5)
+        self.stop()
+        raise OfficeConversionError("LibreOffice 实例启动超时")
+
+    def convert(self, input_file: str, output_pdf: str):
+        """把文件转换为 PDF，写入 output_pdf."""
+        self.conversions += 1
+        if self.warm:
+            from unoserver.client import UnoClient
+
+            UnoClient(port=str(self.port)).convert(inpath=input_file, outpath=output_pdf, convert_to="pdf")
+        else:
+            self._convert_cold(input_file, output_pdf)
+        if not os.path.exists(output_pdf):
+            raise OfficeConversionError("LibreOffice 未生成 PDF 文件")
+
+    def _convert_cold(self, input_file: str, output_pdf: str):
+        outdir = tempfile.mkdtemp(dir=os.path.dirname(output_pdf))
+        try:
+            cmd = [
+                "soffice",
+                f"-env:UserInstallation={Path(self.profile_dir).as_uri()}",
+                "--headless",
+                "--convert-to",
+                "pdf",
+                "--outdir",
+                outdir,
+                input_file,
+            ]
+            process = subprocess.run(cmd, capture_output=True, text=True, timeout=settings.LIBREOFFICE_CONVERT_TIMEOUT)
+            if process.returncode != 0:
+                raise OfficeConversionError(f"LibreOffice 转换失败: {process.stderr}")
+            converted = os.path.join(outdir, f"{Path(input_file).stem}.pdf")
+            if os.path.exists(converted):
+                os.replace(converted, output_pdf)
+        except subprocess.TimeoutExpired:
+            raise OfficeConversionError("LibreOffice 转换超时")
+        finally:
+            shutil.rmtree(outdir, ignore_errors=True)
+
+    def stop(self):
+        """终止 unoserver 及其 LibreOffice 进程."""
+        process, self.process = self.process, None
+        self.conversions = 0
+        if process is None or process.poll() is not None:
+            return
+        process.terminate()
+        try:
+            process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+    def close(self):
+        """终止进程并删除用户配置目录."""
+        self.stop()
+        shutil.rmtree(self.profile_dir, ignore_errors=True)
+
+
+class OfficeConverter:
+    """常驻 LibreOffice 实例池.
+
+    实例在首次使用时启动；同一时间每个实例只处理一个文件，没有空闲实例时等待。
+    进程内的所有事件循环共享同一个实例池。
+    """
+
+    def __init__(self, pool_size: int):
+        """初始化实例池.
+
+        Args:
+            pool_size: 实例数量，即同时进行的转换数上限
+        """
+        self.warm = _unoserver_pythonpath() is not None and shutil.which(settings.LIBREOFFICE_PYTHON) is not None
+        if not self.warm:
+            logger.warning("未找到 unoserver 或带 uno 模块的 Python，Office 文档转换将每次启动 soffice")
+        self._instances: List[_OfficeInstance] = [_OfficeInstance(i, self.warm) for i in range(max(pool_size, 1))]
+        self._idle: List[_OfficeInstance] = list(self._instances)
+        self._lock = threading.Lock()
+
+    async def _acquire(self) -> _OfficeInstance:
+        while True:
+            with self._lock:
+                if self._idle:
+                    return self._idle.pop()
+            await asyncio.sleep(ACQUIRE_POLL_INTERVAL)
+
+    def _release(self, instance: _OfficeInstance):
+        with self._lock:
+            self._idle.append(instance)
+
+    async def convert_to_pdf(self, input_file: str, output_pdf: str) -> str:
+        """把 DOCX、PPTX 等文档转换为 PDF.
+
+        Args:
+            input_file: 输入文件路径
+            output_pdf: 输出 PDF 路径
+
+        Returns:
+            str: 输出 PDF 路径
+
+        Raises:
+            OfficeConversionError: 实例启动失败、转换失败或超时
+        """
+        instance = await self._acquire()
+        finished = False
+        try:
+            if instance.warm and instance.conversions >= MAX_CONVERSIONS_PER_INSTANCE:
+                await asyncio.to_thread(instance.stop)
+            try:
+                await asyncio.to_thread(instance.ensure_started)
+            except OfficeConversionError as e:
+                # 实例无法启动（如缺少 uno 模块）时退化为每次启动 soffice，不影响转换
+                logger.warning(f"{str(e)}，改为每次启动 soffice")
+                instance.warm = False
+            await asyncio.wait_for(
+                asyncio.to_thread(instance.convert, str(input_file), str(output_pdf)),
+                timeout=settings.LIBREOFFICE_CONVERT_TIMEOUT + 5,
+            )
+            finished = True
+            return str(output_pdf)
+        except asyncio.TimeoutError:
+            raise OfficeConversionError("LibreOffice 转换超时")
+        except OfficeConversionError:
+            raise
+        except Exception as e:
+            raise OfficeConversionError(f"LibreOffice 转换失败: {str(e)}") from e
+        finally:
+            try:
+                if not finished:
+                    # 超时、取消或出错的实例可能仍在处理文件，终止后下次使用时重新启动
+                    await asyncio.shield(asyncio.to_thread(instance.stop))
+            finally:
+                self._release(instance)
+
+    def shutdown(self):
+        """终止全部实例."""
+        for instance in self._instances:
+            instance.close()
+
+
+_converter: Optional[OfficeConverter] = None
+_converter_lock = threading.Lock()
+
+
+def get_office_converter() -> OfficeConverter:
+    """获取进程内共享的 Office 文档转换实例池，首次调用时创建."""
+    global _converter
+    with _converter_lock:
+        if _converter is None:
+            _converter = OfficeConverter(settings.LIBREOFFICE_POOL_SIZE)
+        return _converter
+
+
+def shutdown_office_converter():
+    """终止已创建的实例池，在进程退出前调用."""
+    with _converter_lock:
+        converter = _converter
+    if converter is not None:
+        converter.shutdown()
@@ -5,16 +5,24 @@
 
 import asyncio
 import logging
+from typing import Callable, Optional
 
-from clients.openai_client import OpenAIClient
+from clients.llm_scheduler import LLMPriority
+from clients.openai_client import OpenAIClient, create_openai_client
 from config import Settings, get_settings
+from database import PageCacheKind
 from models.users import User
+from prepdocs.concurrency import gather_or_cancel
 from prepdocs.config import FileType, Page, Section
+from services import page_cache
 
 logger = logging.getLogger(__name__)
 
 settings: Settings = get_settings()
 
+# 提示词版本，修改 get_parse_markdown_system_prompt 时需要递增，使旧的页面缓存失效
+PARSE_PROMPT_VERSION = "1"
+
 
 def get_parse_markdown_system_prompt() -> str:
     """获取用于图片解析的系统提示。
@@ -33,6 +41,8 @@ def get_parse_markdown_system_prompt() -> str:
 async def process_single_page(openai_client: OpenAIClient, page: Page) -> Page:
     """处理单个页面的图片转文本。
 
+    相同的页面图片在同一模型和提示词版本下直接使用页面缓存中的结果。
+
     Args:
         openai_client: OpenAI客户端实例
         page: 要处理的页面对象
@@ -43,22 +53,41 @@ async def process_single_page(openai_client: OpenAIClient, page: Page) -> Page:
     Raises:
         ValueError: 当图片解析失败时抛出
     """
+    image_data = page.image_data
+    if image_data is None:
+        with open(page.file_path, "rb") as f:
+            image_data = f.read()
+    cache_key = page_cache.ocr_cache_key(image_data, openai_client.vision_model, PARSE_PROMPT_VERSION)
+    cached = page_cache.get(PageCacheKind.OCR, cache_key)
+    if cached is not None:
+        return Page(content=cached)
+
     response = await openai_client.chat_with_image(
         get_parse_markdown_system_prompt(),
-        page.file_path,
-        "path",
+        image_data,
+        "bytes",
+        mime_type=page.mime_type,
     )
     if "error" in response:
         raise ValueError(f"解析图片失败: {response['error']}")
+    page_cache.put(PageCacheKind.OCR, cache_key, response["text"])
     return Page(content=response["text"])
 
 
-async def parse_images(section: Section, user: User) -> Section:
+async def parse_images(
+    section: Section,
+    user: User,
+    image_loader: Optional[Callable[[int], Page]] = None,
+    on_page_done: Optional[Callable[[int, Page], None]] = None,
+) -> Section:
     """将图片Section转换为文本Section。
 
     Args:
         section: 输入的图片Section
         user: 用户对象，用于获取API配置
+        image_loader: 可选的页面加载函数，参数为页面在section中的序号。提供时在获得并发名额后才加载页面图片，
+            同一时间只有并发数量的页面驻留内存
+        on_page_done: 可选的回调函数，每页处理完成后立即以 (序号, 结果页面) 调用，用于逐页保存检查点
 
     Returns:
         Section: 包含提取文本的Section对象
@@ -70,28 +99,20 @@ async def parse_images(section: Section, user: User) -> Section:
         filename=section.filename,
     )
 
-    max_workers = 5
-
-    semaphore = asyncio.Semaphore(max_workers)
+    semaphore = asyncio.Semaphore(settings.PIPELINE_OCR_WORKERS)
+    openai_client = create_openai_client(user, priority=LLMPriority.BACKGROUND)
 
-    async def process_page(page: Page, s: asyncio.Semaphore):
+    async def process_page(index: int, page: Page, s: asyncio.Semaphore):
         async with s:
-            if settings.GLOBAL_LLM == "private":
-                openai_client = OpenAIClient(
-                    api_key=user.ai_api_key,
-                    base_url=user.ai_base_url,
-                    model=user.ai_standard_model,
-                )
-            else:
-                openai_client = OpenAIClient(
-                    api_key=settings.OPENAI_API_KEY,
-                    base_url=settings.OPENAI_BASE_URL,
-                    model=settings.LLM_STANDARD_MODEL,
-                )
-            return await process_single_page(openai_client, page)
-
-    tasks = [process_page(page, semaphore) for page in section.pages]
-    result_section.pages = await asyncio.gather(*tasks)
+            if image_loader is not None:
+                page = image_loader(index)
+            result = await process_single_page(openai_client, page)
+            if on_page_done is not None:
+                on_page_done(index, result)
+            return result
+
+    tasks = [process_page(i, page, semaphore) for i, page in enumerate(section.pages)]
+    result_section.pages = await gather_or_cancel(*tasks)
 
     # 移除任何处理失败的页面（None值）
     result_section.pages = [page for page in result_section.pages if page is not None]
@@ -0,0 +1,288 @@
+"""PDF 页面渲染进程池模块。
+
+进程内共享一个常驻的渲染进程池，按页提交渲染任务：空闲的工作进程从共享队列中领取下一页，
+页面耗时不均时也不会出现某个进程闲置而其他进程积压的情况。渲染结果通过 asyncio 的 future 交回，
+不阻塞事件循环；工作进程会缓存打开的 PDF，同一文档的后续页面不再重复打开，文件随工作区删除后关闭。
+
+页面按渲染配置（RenderProfile）输出：文本提取使用按文字密度调整 DPI 的有损压缩图片，
+缩略图直接以低分辨率渲染，存档使用无损的高分辨率图片。
+"""
+
+import asyncio
+import io
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import AsyncIterator, Dict, Iterable, Optional
+
+import pypdfium2 as pdfium
+
+from config import get_settings
+from prepdocs.config import ImageFormat, Page, RenderProfile
+from prepdocs.text_layer import extract_page_text
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+# 文本提取：按页面文字密度在 OCR_RENDER_MIN_DPI 和 OCR_RENDER_MAX_DPI 之间选择分辨率
+OCR_PROFILE = RenderProfile(
+    name="ocr",
+    dpi=settings.OCR_RENDER_DPI,
+    image_format=settings.OCR_RENDER_FORMAT,
+    quality=settings.OCR_RENDER_QUALITY,
+    grayscale=settings.OCR_RENDER_GRAYSCALE,
+    min_dpi=settings.OCR_RENDER_MIN_DPI,
+    max_dpi=settings.OCR_RENDER_MAX_DPI,
+)
+# 缩略图：长边 512 像素
+THUMBNAIL_PROFILE = RenderProfile(name="thumbnail", dpi=72, image_format=ImageFormat.JPEG, quality=80, max_side=512)
+# 存档：300 DPI 无损彩色图片
+ARCHIVAL_PROFILE = RenderProfile(name="archival", dpi=300, image_format=ImageFormat.PNG)
+
+# 文字密度（每平方英寸字符数）阈值：10pt 单栏正文约 30，小字号多栏排版通常超过 50
+SPARSE_TEXT_DENSITY = 10
+DENSE_TEXT_DENSITY = 45
+
+# 工作进程内缓存的已打开PDF，同一时间通常只处理少数几个文档
+_open_documents: Dict[str, pdfium.PdfDocument] = {}
+_MAX_OPEN_DOCUMENTS = 4
+# 工作区删除后，已打开的文件句柄会让文件继续占用磁盘（内存模式下占用内存），工作进程按该间隔（秒）关闭这些文档
+_SWEEP_INTERVAL = 5
+# pdfium 不是线程安全的，渲染和后台关闭文档互斥执行
+_documents_lock = threading.Lock()
+_sweeper: Optional[threading.Thread] = None
+
+
+def _close_deleted_documents():
+    """关闭文件已被删除（所属工作区已清理）的缓存文档，调用方须持有 _documents_lock."""
+    for pdf_path in [path for path in _open_documents if not os.path.exists(path)]:
+        _open_documents.pop(pdf_path).close()
+
+
+def _sweep_deleted_documents():
+    """工作进程的后台线程：定期关闭已删除文件的缓存文档，空闲的工作进程也不会一直持有它们."""
+    while True:
+        time.sleep(_SWEEP_INTERVAL)
+        with _documents_lock:
+            _close_deleted_documents()
+
+
+def _get_document(pdf_path: str) -> pdfium.PdfDocument:
+    """在工作进程中获取已打开的PDF，超出缓存数量时关闭最早打开的文档.
+
+    调用方须持有 _documents_lock。
+    """
+    global _sweeper
+    if _sweeper is None:
+        _sweeper = threading.Thread(target=_sweep_deleted_documents, daemon=True)
+        _sweeper.start()
+    _close_deleted_documents()
+    pdf = _open_documents.get(pdf_path)
+    if pdf is None:
+        while len(_open_documents) >= _MAX_OPEN_DOCUMENTS:
+            _open_documents.pop(next(iter(_open_documents))).close()
+        pdf = pdfium.PdfDocument(pdf_path)
+        _open_documents[pdf_path] = pdf
+    return pdf
+
+
+def _text_density(page: pdfium.PdfPage) -> float:
+    """计算页面文字层的字符密度（每平方英寸字符数），没有文字层的扫描页面返回 0."""
+    width, height = page.get_size()
+    textpage = page.get_textpage()
+    try:
+        char_count = textpage.count_chars()
+    finally:
+        textpage.close()
+    return char_count / max((width / 72) * (height / 72), 1e-6)
+
+
+def render_scale(page: pdfium.PdfPage, profile: RenderProfile) -> float:
+    """根据渲染配置计算页面的渲染缩放比例（DPI / 72）."""
+    if profile.max_side:
+        return profile.max_side / max(page.get_size())
+
+    dpi = profile.dpi
+    if profile.adaptive:
+        density = _text_density(page)
+        # 扫描页面没有文字层，无法判断字号，使用基础 DPI
+        if density >= DENSE_TEXT_DENSITY:
+            dpi = profile.max_dpi
+        elif 0 < density <= SPARSE_TEXT_DENSITY:
+            dpi = profile.min_dpi
+    return dpi / 72
+
+
+def encode_page(pdf: pdfium.PdfDocument, page_num: int, profile: RenderProfile) -> bytes:
+    """按渲染配置渲染单个PDF页面，返回编码后的图片数据."""
+    page = pdf[page_num]
+    bitmap = page.render(scale=render_scale(page, profile), grayscale=profile.grayscale)
+    try:
+        image = bitmap.to_pil()
+        if profile.image_format != ImageFormat.PNG and image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        options = {} if profile.image_format == ImageFormat.PNG else {"quality": profile.quality}
+        buffer = io.BytesIO()
+        image.save(buffer, profile.image_format, **options)
+        return buffer.getvalue()
+    finally:
+        # 释放资源
+        bitmap.close()
+        page.close()
+
+
+def render_page(pdf: pdfium.PdfDocument, page_num: int, output_path: str, profile: RenderProfile) -> str:
+    """按渲染配置渲染单个PDF页面并保存，返回图片路径."""
+    data = encode_page(pdf, page_num, profile)
+    with open(output_path, "wb") as f:
+        f.write(data)
+    return output_path
+
+
+def render_thumbnail(pdf_path: str, page_num: int = 0) -> bytes:
+    """直接以缩略图分辨率渲染页面（默认首页），返回编码后的图片数据."""
+    pdf = pdfium.PdfDocument(pdf_path)
+    try:
+        return encode_page(pdf, page_num, THUMBNAIL_PROFILE)
+    finally:
+        pdf.close()
+
+
+def _render_in_worker(
+    pdf_path: str, page_num: int, output_path: Optional[str], profile: RenderProfile, text_fast_path: bool
+) -> Page:
+    """工作进程入口：处理一页.
+
+    启用文字层快速通道时，文字为主的页面直接返回提取的文本，不再渲染图片；
+    output_path 为空时页面图片以二进制数据返回，不写入文件。
+    """
+    with _documents_lock:
+        pdf = _get_document(pdf_path)
+        if text_fast_path:
+            content = extract_page_text(pdf, page_num)
+            if content is not None:
+                return Page(content=content)
+        if output_path is None:
+            return Page(image_data=encode_page(pdf, page_num, profile), mime_type=profile.mime_type)
+        return Page(file_path=render_page(pdf, page_num, output_path, profile), mime_type=profile.mime_type)
+
+
+class Rasterizer:
+    """常驻的PDF渲染进程池.
+
+    进程池在首次使用时创建，之后在整个进程生命周期内复用；工作进程异常退出导致进程池损坏时会自动重建。
+    """
+
+    def __init__(self, max_workers: Optional[int] = None):
+        """初始化渲染进程池.
+
+        Args:
+            max_workers: 工作进程数，默认为 CPU 核数
+        """
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # 父进程中有事件循环线程和数据库连接，使用 spawn 避免 fork 复制这些状态
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+                logger.info(f"PDF 渲染进程池启动，工作进程数: {self.max_workers}")
+            return self._executor
+
+    def _reset_executor(self, executor: ProcessPoolExecutor):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    async def render_pages(
+        self,
+        pdf_path: str,
+        page_numbers: Iterable[int],
+        output_dir: Optional[str],
+        profile: RenderProfile = OCR_PROFILE,
+        text_fast_path: bool = False,
+    ) -> AsyncIterator[tuple[int, Page]]:
+        """并行渲染PDF页面，按完成顺序产出 (页码, Page).
+
+        渲染得到的页面只包含图片路径（output_dir 为空时为图片数据）；启用文字层快速通道时，文字为主的页面只包含提取的文本。
+
+        同一时间最多提交工作进程数两倍的页面，迭代被中断时取消尚未开始的页面。
+
+        Args:
+            pdf_path: PDF文件路径
+            page_numbers: 要渲染的页码（从0开始）
+            output_dir: 图片输出目录，为空时图片不写入文件
+            profile: 渲染配置，默认为文本提取配置
+            text_fast_path: 是否对文字为主的页面直接提取文字层
+        """
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        pending_pages = iter(page_numbers)
+        in_flight: Dict[asyncio.Future, int] = {}
+
+        def submit_next() -> bool:
+            page_num = next(pending_pages, None)
+            if page_num is None:
+                return False
+            output_path = os.path.join(output_dir, f"page_{page_num+1}.{profile.extension}") if output_dir else None
+            future = loop.run_in_executor(
+                executor, _render_in_worker, str(pdf_path), page_num, output_path, profile, text_fast_path
+            )
+            in_flight[future] = page_num
+            return True
+
+        try:
+            while len(in_flight) < self.max_workers * 2 and submit_next():
+                pass
+            while in_flight:
+                done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    page_num = in_flight.pop(future)
+                    yield page_num, future.result()
+                    submit_next()
+        except BrokenProcessPool:
+            logger.error("PDF 渲染进程异常退出，重建进程池")
+            self._reset_executor(executor)
+            raise
+        finally:
+            for future in in_flight:
+                future.cancel()
+
+    async def render_thumbnail(self, pdf_path: str) -> bytes:
+        """在渲染进程池中以缩略图分辨率渲染PDF首页.
+
+        pdfium 不是线程安全的，所有渲染都放在工作进程中执行。
+        """
+        executor = self._get_executor()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(executor, render_thumbnail, str(pdf_path))
+        except BrokenProcessPool:
+            logger.error("PDF 渲染进程异常退出，重建进程池")
+            self._reset_executor(executor)
+            raise
+
+    def shutdown(self):
+        """关闭进程池."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+_rasterizer = Rasterizer(settings.RASTER_WORKERS or None)
+
+
+def get_rasterizer() -> Rasterizer:
+    """获取进程内共享的渲染进程池."""
+    return _rasterizer
@@ -0,0 +1,166 @@
+"""PDF 文字层提取模块。
+
+原生生成的 PDF（论文、报告等）自带完整的文字层，pdfium 可以在毫秒级别直接提取文本。
+按页面的文字层覆盖率、字符数和图片面积判断页面类型：文字为主的页面直接提取文本并做简单的
+Markdown 规整，只有扫描页、以图表为主或表格、公式较多的页面才交给视觉模型识别。
+"""
+
+import re
+from dataclasses import dataclass
+from typing import List, Optional
+
+import pypdfium2 as pdfium
+import pypdfium2.raw as pdfium_c
+
+
+class PageKind:
+    """页面类型定义类。
+
+    - TEXT: 文字层完整，直接提取文本
+    - VISION: 扫描页或以图表、表格为主，需要视觉模型识别
+    """
+
+    TEXT = "text"
+    VISION = "vision"
+
+
+TEXT_LAYER_VERSION = "1"  # 页面分类和文本规整规则的版本，修改后已处理的文档重新处理时会重新渲染
+MIN_CHARS = 200  # 文字层字符数少于该值时视为扫描页或图片页
+MIN_TEXT_COVERAGE = 0.15  # 文字区域占页面面积的最小比例
+MAX_IMAGE_COVERAGE = 0.3  # 图片占页面面积的最大比例，超过时视为以图为主
+MAX_PATH_OBJECTS = 150  # 矢量路径对象数量上限，表格框线、矢量图和公式会产生大量路径
+MAX_UNMAPPED_RATIO = 0.02  # 无法映射到 Unicode 的字符比例上限，超过时说明字体编码缺失
+
+
+@dataclass
+class PageClassification:
+    """页面分类结果."""
+
+    kind: str
+    char_count: int
+    text_coverage: float
+    image_coverage: float
+    path_count: int
+    unmapped_ratio: float
+
+
+def _object_area(obj: pdfium.PdfObject) -> float:
+    left, bottom, right, top = obj.get_pos()
+    return max(right - left, 0) * max(top - bottom, 0)
+
+
+def classify_page(page: pdfium.PdfPage, textpage: pdfium.PdfTextPage) -> PageClassification:
+    """根据文字层覆盖率、字符数和图片面积判断页面是否可以直接提取文本.
+
+    Args:
+        page: PDF页面
+        textpage: 页面的文字层
+
+    Returns:
+        PageClassification: 分类结果及判断依据
+    """
+    width, height = page.get_size()
+    page_area = max(width * height, 1e-6)
+
+    char_count = textpage.count_chars()
+    text_area = 0.0
+    for index in range(textpage.count_rects()):
+        left, bottom, right, top = textpage.get_rect(index)
+        text_area += max(right - left, 0) * max(top - bottom, 0)
+
+    image_area = 0.0
+    path_count = 0
+    for obj in page.get_objects(filter=(pdfium_c.FPDF_PAGEOBJ_IMAGE, pdfium_c.FPDF_PAGEOBJ_PATH)):
+        if obj.type == pdfium_c.FPDF_PAGEOBJ_IMAGE:
+            image_area += _object_area(obj)
+        else:
+            path_count += 1
+
+    text = textpage.get_text_range() if char_count else ""
+    unmapped = sum(1 for char in text if char == "\ufffd" or (ord(char) < 32 and char not in "\r\n\t"))
+
+    classification = PageClassification(
+        kind=PageKind.VISION,
+        char_count=char_count,
+        text_coverage=min(text_area / page_area, 1.0),
+        image_coverage=min(image_area / page_area, 1.0),
+        path_count=path_count,
+        unmapped_ratio=unmapped / max(len(text), 1),
+    )
+    if (
+        classification.char_count >= MIN_CHARS
+        and classification.text_coverage >= MIN_TEXT_COVERAGE
+        and classification.image_coverage <= MAX_IMAGE_COVERAGE
+        and classification.path_count <= MAX_PATH_OBJECTS
+        and classification.unmapped_ratio <= MAX_UNMAPPED_RATIO
+    ):
+        classification.kind = PageKind.TEXT
+    return classification
+
+
+def extract_page_text(pdf: pdfium.PdfDocument, page_num: int) -> Optional[str]:
+    """页面以文字为主时直接从文字层提取 Markdown 文本，否则返回 None 交由视觉模型识别."""
+    page = pdf[page_num]
+    textpage = page.get_textpage()
+    try:
+        if classify_page(page, textpage).kind != PageKind.TEXT:
+            return None
+        return normalize_markdown(textpage.get_text_range())
+    finally:
+        textpage.close()
+        page.close()
+
+
+_BULLET_RE = re.compile(r"^(?:[•·▪◦●○■□–—*]|-(?=\s))\s*")
+_NUMBERED_RE = re.compile(r"^(?:\d+[.)]|\(\d+\))\s+")
+_PAGE_NUMBER_RE = re.compile(r"^(?:\d+|[ivxlcdm]+|page \d+(?: of \d+)?)$", re.IGNORECASE)
+_CJK_RE = re.compile(r"[\u3000-\u303f\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]")
+_SENTENCE_END = (".", "!", "?", ":", "。", "！", "？", "：")
+
+
+def _join_line(paragraph: str, line: str) -> str:
+    """把折行的下一行接到段落末尾：去掉断词连字符，中日韩文字之间不加空格."""
+    if paragraph.endswith("-") and line[:1].islower():
+        return paragraph[:-1] + line
+    if _CJK_RE.match(paragraph[-1]) or _CJK_RE.match(line[0]):
+        return paragraph + line
+    return f"{paragraph} {line}"
+
+
+def normalize_markdown(text: str) -> str:
+    """把 pdfium 按行输出的文本规整为 Markdown 段落.
+
+    合并折行、去掉断词连字符和单独成行的页码，把项目符号统一为 Markdown 列表，
+    较短且以句末标点结尾的行视为段落结束。
+    """
+    lines = [" ".join(line.split()) for line in text.replace("\r\n", "\n").replace("\r", "\n").split("\n")]
+    while lines and (not lines[0] or _PAGE_NUMBER_RE.match(lines[0])):
+        lines.pop(0)
+    while lines and (not lines[-1] or _PAGE_NUMBER_RE.match(lines[-1])):
+        lines.pop()
+
+    full_width = max((len(line) for line in lines), default=0)
+    blocks: List[str] = []
+    paragraph = ""
+    for line in lines:
+        if not line:
+            if paragraph:
+                blocks.append(paragraph)
+            paragraph = ""
+            continue
+
+        bullet = _BULLET_RE.match(line)
+        if bullet or _NUMBERED_RE.match(line):
+            if paragraph:
+                blocks.append(paragraph)
+            paragraph = f"- {line[bullet.end():]}" if bullet else line
+        else:
+            paragraph = _join_line(paragraph, line) if paragraph else line
+
+        # 明显短于正文行宽且以句末标点结尾的行是段落的最后一行
+        if line.endswith(_SENTENCE_END) and len(line) < full_width * 0.7:
+            blocks.append(paragraph)
+            paragraph = ""
+    if paragraph:
+        blocks.append(paragraph)
+    return "\n\n".join(blocks)
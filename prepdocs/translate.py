@@ -1,18 +1,33 @@
 """文档翻译模块。
 
 提供文本翻译功能，使用OpenAI的语言模型将文档内容翻译成目标语言。 主要用于将英文文档翻译成中文或其他目标语言。
+页面按 token 预算打包成批次翻译（见 translation_planner），译文按页面写入页面缓存。
 """
 
 # 解析英文文档
 import asyncio
+import logging
+from typing import Callable, Dict, List, Optional, Tuple
 
-from clients.openai_client import OpenAIClient
+from clients.llm_scheduler import LLMPriority
+from clients.openai_client import OpenAIClient, create_openai_client
 from config import Settings, get_settings
+from database import PageCacheKind
 from models.users import User
+from prepdocs.concurrency import gather_or_cancel
 from prepdocs.config import FileType, Page, Section
+from prepdocs.translation_planner import CONTEXT_END, CONTEXT_START, SEGMENT_MARKER, Batch, Segment, plan_batches
+from services import page_cache
+
+logger = logging.getLogger(__name__)
 
 settings: Settings = get_settings()
 
+DEFAULT_TARGET_LANGUAGE = "Simplified Chinese"
+
+# 提示词版本，修改 get_translate_system_prompt 时需要递增，使旧的翻译缓存失效
+TRANSLATE_PROMPT_VERSION = "2"
+
 
 def get_translate_system_prompt(target_language: str) -> str:
     """获取翻译系统提示。
@@ -24,9 +39,115 @@ def get_translate_system_prompt(target_language: str) -> str:
         str: 系统提示文本
     """
     return (
-        f"You are a professional translator, translate the following text into {target_language},"
-        f" and cannot output any other extra content:"
+        f"You are a professional translator. Translate the text of every segment into {target_language}.\n"
+        f"Each segment starts with a marker line such as {SEGMENT_MARKER.format(1)}. Output every marker unchanged"
+        f" on its own line, followed by the translation of that segment only. Do not merge, split, skip or add"
+        f" segments, and do not output any other extra content.\n"
+        f"Text between {CONTEXT_START} and {CONTEXT_END} is the preceding part of the document, given only as"
+        f" context: do not translate or output it."
+    )
+
+
+async def _translate_batch(openai_client: OpenAIClient, batch: Batch, target_language: str) -> List[str]:
+    """翻译一个批次，返回与片段一一对应的译文.
+
+    模型返回的分隔标记不完整时（如输出被截断），把批次中的片段逐个重新翻译。
+
+    Raises:
+        ValueError: 当翻译失败时抛出
+    """
+    response = await openai_client.chat_with_text(
+        batch.build_message(), system_prompt=get_translate_system_prompt(target_language)
     )
+    if "error" in response:
+        raise ValueError(f"翻译失败: {response['error']}")
+    translations = batch.parse_response(response["text"])
+    if translations is not None:
+        return translations
+    if len(batch.segments) == 1:
+        raise ValueError("翻译失败: 模型返回的内容无法解析")
+
+    logger.warning(f"批量翻译结果的分隔标记不完整，逐段重新翻译 {len(batch.segments)} 个片段")
+    results = []
+    for i, segment in enumerate(batch.segments):
+        single = Batch(segments=[segment], context=batch.context if i == 0 else "")
+        results.extend(await _translate_batch(openai_client, single, target_language))
+    return results
+
+
+async def translate_pages(
+    openai_client: OpenAIClient,
+    pages: List[Tuple[int, str]],
+    target_language: str = DEFAULT_TARGET_LANGUAGE,
+    on_page_done: Optional[Callable[[int, Page], None]] = None,
+    context_for: Optional[Callable[[int], Optional[str]]] = None,
+    concurrency: int = 1,
+) -> Dict[int, str]:
+    """批量翻译多个页面.
+
+    已缓存的页面和空白页面直接返回，其余页面按 TRANSLATE_BATCH_TOKENS 打包成批次并发翻译；
+    超长页面拆分到多个批次中，全部片段完成后再拼接成整页译文。
+
+    Args:
+        openai_client: OpenAI客户端实例
+        pages: (页码, 原文) 列表，按页码顺序排列
+        target_language: 目标语言
+        on_page_done: 每页译文完成后以 (页码, 结果页面) 调用
+        context_for: 按页码返回不在本次翻译中的页面原文，作为批次的前文上下文
+        concurrency: 同时进行的翻译请求数
+
+    Returns:
+        Dict[int, str]: 页码到译文的映射
+
+    Raises:
+        ValueError: 当翻译失败时抛出
+    """
+    results: Dict[int, str] = {}
+    cache_keys: Dict[int, str] = {}
+
+    def finish(page_index: int, content: str):
+        results[page_index] = content
+        if on_page_done is not None:
+            on_page_done(page_index, Page(content=content))
+
+    pending: List[Tuple[int, str]] = []
+    for page_index, text in pages:
+        if not text or not text.strip():
+            finish(page_index, text or "")
+            continue
+        cache_keys[page_index] = page_cache.translation_cache_key(
+            text, target_language, openai_client.text_model, TRANSLATE_PROMPT_VERSION
+        )
+        cached = page_cache.get(PageCacheKind.TRANSLATION, cache_keys[page_index])
+        if cached is not None:
+            finish(page_index, cached)
+        else:
+            pending.append((page_index, text))
+
+    batches = plan_batches(pending, settings.TRANSLATE_BATCH_TOKENS, settings.TRANSLATE_OVERLAP_CHARS, context_for)
+    # 每页尚未完成的片段数，以及已完成片段的译文
+    remaining: Dict[int, int] = {}
+    for batch in batches:
+        for segment in batch.segments:
+            remaining[segment.page_index] = remaining.get(segment.page_index, 0) + 1
+    parts: Dict[int, List[Tuple[Segment, str]]] = {page_index: [] for page_index in remaining}
+    semaphore = asyncio.Semaphore(max(concurrency, 1))
+
+    async def process_batch(batch: Batch):
+        async with semaphore:
+            translations = await _translate_batch(openai_client, batch, target_language)
+        for segment, translation in zip(batch.segments, translations):
+            parts[segment.page_index].append((segment, translation))
+            remaining[segment.page_index] -= 1
+            if remaining[segment.page_index] == 0:
+                # 同一页面的片段按批次完成顺序收集，拼接前恢复原始顺序
+                ordered = sorted(parts.pop(segment.page_index), key=lambda item: item[0].part)
+                content = "".join(part_segment.separator + translation for part_segment, translation in ordered)
+                page_cache.put(PageCacheKind.TRANSLATION, cache_keys[segment.page_index], content)
+                finish(segment.page_index, content)
+
+    await gather_or_cancel(*(process_batch(batch) for batch in batches))
+    return results
 
 
 async def process_single_translation(
@@ -36,6 +157,8 @@ async def process_single_translation(
 ) -> Page:
     """处理单个页面的翻译。
 
+    相同的文本在同一模型、提示词版本和目标语言下直接使用页面缓存中的译文。
+
     Args:
         openai_client: OpenAI客户端实例
         page_content: 要翻译的页面内容
@@ -47,51 +170,32 @@ async def process_single_translation(
     Raises:
         ValueError: 当翻译失败时抛出
     """
-    response = await openai_client.chat_with_text(
-        f"{get_translate_system_prompt(target_language)}\n{page_content}",
-    )
-    if "error" in response:
-        raise ValueError(f"翻译失败: {response['error']}")
-    return Page(content=response["text"])
+    results = await translate_pages(openai_client, [(0, page_content)], target_language)
+    return Page(content=results[0])
 
 
 async def translate_text(
     section: Section,
     user: User,
-    target_language: str = "Simplified Chinese",
+    target_language: str = DEFAULT_TARGET_LANGUAGE,
+    on_page_done: Optional[Callable[[int, Page], None]] = None,
 ) -> Section:
-    """多线程翻译文本，保持原始顺序."""
-    if settings.GLOBAL_LLM == "private":
-        openai_client = OpenAIClient(
-            api_key=user.ai_api_key,
-            base_url=user.ai_base_url,
-            model=user.ai_standard_model,
-        )
-    else:
-        openai_client = OpenAIClient(
-            api_key=settings.OPENAI_API_KEY,
-            base_url=settings.OPENAI_BASE_URL,
-            model=settings.LLM_STANDARD_MODEL,
-        )
+    """批量翻译文本，保持原始顺序.
 
-    result_section = Section(
+    on_page_done 为可选回调，每页翻译完成后立即以 (序号, 结果页面) 调用，用于逐页保存检查点。
+    """
+    openai_client = create_openai_client(user, priority=LLMPriority.BACKGROUND)
+
+    results = await translate_pages(
+        openai_client,
+        [(i, page.content) for i, page in enumerate(section.pages)],
+        target_language,
+        on_page_done=on_page_done,
+        concurrency=settings.PIPELINE_TRANSLATE_WORKERS,
+    )
+    return Section(
         title=section.title,
-        pages=[None] * len(section.pages),  # 预分配空间以保持顺序
+        pages=[Page(content=results[i]) for i in range(len(section.pages))],
         file_type=FileType.TEXT,
         filename=section.filename,
     )
-    max_workers = 3
-
-    semaphore = asyncio.Semaphore(max_workers)
-
-    async def process_page(page: Page):
-        async with semaphore:
-            return await process_single_translation(openai_client, page.content, target_language)
-
-    tasks = [process_page(page) for page in section.pages]
-    result_section.pages = await asyncio.gather(*tasks)
-
-    # 移除任何处理失败的页面（None值）
-    result_section.pages = [page for page in result_section.pages if page is not None]
-
-    return result_section
@@ -0,0 +1,175 @@
+"""翻译批次规划模块。
+
+把待翻译的页面按 token 预算打包成批次：短页面合并到同一个请求中，超长页面按段落、行、句子拆分成多个片段。
+批次内的片段用固定的分隔标记区分，模型返回后按标记把译文映射回页面；每个批次附带前文的一小段原文作为上下文，
+跨页断开的句子也能在上下文中翻译。
+"""
+
+import re
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional, Tuple
+
+SEGMENT_MARKER = "<<<SEGMENT {}>>>"
+CONTEXT_START = "<<<CONTEXT>>>"
+CONTEXT_END = "<<<END CONTEXT>>>"
+MARKER_TOKENS = 8  # 每个分隔标记占用的 token 估计值
+
+_MARKER_RE = re.compile(r"<<<SEGMENT (\d+)>>>")
+_CJK_RE = re.compile(r"[\u3000-\u303f\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef]")
+# 依次尝试的拆分位置：空行、换行、句末标点
+_SPLIT_PATTERNS = (r"\n\s*\n", r"\n", r"(?<=[.!?;])\s+|(?<=[。！？；])")
+
+
+def estimate_tokens(text: str) -> int:
+    """估算文本的 token 数：中日韩字符按每字一个 token，其余按每 4 个字符一个 token."""
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk) // 4 + 1
+
+
+@dataclass
+class Segment:
+    """待翻译的片段，对应一个完整页面或超长页面的一部分."""
+
+    page_index: int
+    text: str
+    part: int = 0  # 在页面中的序号
+    separator: str = ""  # 与同一页面上一个片段之间的原始分隔符，页面的第一个片段为空
+
+
+@dataclass
+class Batch:
+    """一次翻译请求包含的片段."""
+
+    segments: List[Segment] = field(default_factory=list)
+    context: str = ""  # 批次之前的原文，只作为上下文，不翻译
+
+    def build_message(self) -> str:
+        """构造请求内容：可选的上下文和按顺序编号的片段."""
+        lines = []
+        if self.context:
+            lines += [CONTEXT_START, self.context, CONTEXT_END]
+        for number, segment in enumerate(self.segments, start=1):
+            lines += [SEGMENT_MARKER.format(number), segment.text]
+        return "\n".join(lines)
+
+    def parse_response(self, text: str) -> Optional[List[str]]:
+        """按分隔标记拆分模型返回的译文，标记缺失、重复或乱序时返回 None."""
+        matches = list(_MARKER_RE.finditer(text))
+        if not matches and len(self.segments) == 1:
+            return [text.replace(CONTEXT_START, "").replace(CONTEXT_END, "").strip()]
+        if [int(m.group(1)) for m in matches] != list(range(1, len(self.segments) + 1)):
+            return None
+        ends = [m.start() for m in matches[1:]] + [len(text)]
+        return [text[m.end() : end].strip() for m, end in zip(matches, ends)]
+
+
+def _split_keep(text: str, pattern: str) -> List[Tuple[str, str]]:
+    """按正则拆分文本，返回 (前置分隔符, 片段) 列表，拼接后与原文一致（忽略空片段）."""
+    pieces = []
+    separator = ""
+    last = 0
+    for match in re.finditer(pattern, text):
+        if match.end() == 0 or match.end() == len(text):
+            continue
+        pieces.append((separator, text[last : match.start()]))
+        separator = match.group()
+        last = match.end()
+    pieces.append((separator, text[last:]))
+    pieces = [(sep, piece) for sep, piece in pieces if piece]
+    if pieces:
+        pieces[0] = ("", pieces[0][1])
+    return pieces
+
+
+def split_text(text: str, max_tokens: int) -> List[Tuple[str, str]]:
+    """把超出预算的文本依次按空行、换行、句子拆分，仍超出时按字符截断.
+
+    Returns:
+        List[Tuple[str, str]]: (与上一部分之间的分隔符, 文本) 列表，第一部分的分隔符为空
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return [("", text)]
+
+    for pattern in _SPLIT_PATTERNS:
+        pieces = _split_keep(text, pattern)
+        if len(pieces) > 1:
+            break
+    else:
+        size = max(len(text) * max_tokens // estimate_tokens(text), 1)
+        return [("", text[i : i + size]) for i in range(0, len(text), size)]
+
+    # 拆分后仍超出预算的片段继续细分，再把相邻的小片段合并到预算以内
+    units: List[Tuple[str, str]] = []
+    for separator, piece in pieces:
+        sub_units = split_text(piece, max_tokens)
+        sub_units[0] = (separator, sub_units[0][1])
+        units.extend(sub_units)
+
+    parts: List[Tuple[str, str]] = []
+    part_separator, part = units[0]
+    for separator, unit in units[1:]:
+        if estimate_tokens(part + separator + unit) <= max_tokens:
+            part += separator + unit
+        else:
+            parts.append((part_separator, part))
+            part_separator, part = separator, unit
+    parts.append((part_separator, part))
+    parts[0] = ("", parts[0][1])
+    return parts
+
+
+def _tail(text: str, max_chars: int) -> str:
+    """取文本末尾不超过 max_chars 个字符，尽量从词边界开始."""
+    if len(text) <= max_chars:
+        return text
+    tail = text[-max_chars:]
+    boundary = tail.find(" ")
+    return tail[boundary + 1 :] if 0 <= boundary < max_chars // 2 else tail
+
+
+def plan_batches(
+    pages: List[Tuple[int, str]],
+    max_tokens: int,
+    overlap_chars: int = 0,
+    context_for: Optional[Callable[[int], Optional[str]]] = None,
+) -> List[Batch]:
+    """把页面打包成翻译批次.
+
+    Args:
+        pages: (页码, 原文) 列表，按页码顺序排列
+        max_tokens: 每个批次原文的 token 预算
+        overlap_chars: 附带的前文上下文字符数，0 表示不附带
+        context_for: 按页码返回不在本次规划中的页面原文，用于取得批次第一页的前一页内容
+
+    Returns:
+        List[Batch]: 按原文顺序排列的批次，每个片段只属于一个批次
+    """
+    segments: List[Segment] = []
+    for page_index, text in pages:
+        for part, (separator, part_text) in enumerate(split_text(text, max_tokens)):
+            segments.append(Segment(page_index=page_index, text=part_text, part=part, separator=separator))
+
+    batches: List[Batch] = []
+    batch_tokens = 0
+    for segment in segments:
+        tokens = estimate_tokens(segment.text) + MARKER_TOKENS
+        if not batches or (batches[-1].segments and batch_tokens + tokens > max_tokens):
+            batches.append(Batch())
+            batch_tokens = 0
+        batches[-1].segments.append(segment)
+        batch_tokens += tokens
+
+    if overlap_chars > 0:
+        position = 0
+        for batch in batches:
+            first = batch.segments[0]
+            before = segments[position - 1] if position > 0 else None
+            if before is not None and before.page_index in (first.page_index, first.page_index - 1):
+                context = before.text
+            elif context_for is not None and first.page_index > 0:
+                context = context_for(first.page_index - 1) or ""
+            else:
+                context = ""
+            batch.context = _tail(context, overlap_chars)
+            position += len(batch.segments)
+    return batches
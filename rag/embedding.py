@@ -0,0 +1,84 @@
+"""带缓存的嵌入模型模块。
+
+包装实际的嵌入模型，文本块的向量先按批从 services.embedding_cache 中读取，只为未命中的文本调用嵌入模型，
+新计算的向量写回缓存。查询文本不缓存，直接交给实际的嵌入模型。
+"""
+
+import asyncio
+from typing import Dict, List
+
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from pydantic import PrivateAttr
+
+from services import embedding_cache
+
+
+class CachedEmbedding(BaseEmbedding):
+    """带持久化向量缓存的嵌入模型."""
+
+    _embed_model: BaseEmbedding = PrivateAttr()
+    _dimensions: int = PrivateAttr()
+
+    def __init__(self, embed_model: BaseEmbedding, model_name: str, dimensions: int, **kwargs):
+        """初始化带缓存的嵌入模型.
+
+        Args:
+            embed_model: 实际的嵌入模型
+            model_name: 嵌入模型名称，与向量维度共同组成缓存键
+            dimensions: 向量维度
+        """
+        super().__init__(
+            model_name=model_name,
+            embed_batch_size=embed_model.embed_batch_size,
+            num_workers=embed_model.num_workers,
+            **kwargs,
+        )
+        self._embed_model = embed_model
+        self._dimensions = dimensions
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedEmbedding"
+
+    def _split_cached(self, texts: List[str]):
+        """返回各文本的缓存键、已缓存的向量和需要计算向量的文本（相同文本只计算一次）."""
+        keys = [embedding_cache.cache_key(self.model_name, self._dimensions, text) for text in texts]
+        cached = embedding_cache.get_many(keys)
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in cached:
+                missing.setdefault(key, text)
+        return keys, cached, missing
+
+    @staticmethod
+    def _merge(keys: List[str], cached: Dict[str, List[float]], computed: Dict[str, List[float]]):
+        return [cached[key] if key in cached else computed[key] for key in keys]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        keys, cached, missing = self._split_cached(texts)
+        computed = {}
+        if missing:
+            computed = dict(zip(missing, self._embed_model._get_text_embeddings(list(missing.values()))))
+            embedding_cache.put_many(computed)
+        return self._merge(keys, cached, computed)
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        keys, cached, missing = await asyncio.to_thread(self._split_cached, texts)
+        computed = {}
+        if missing:
+            embeddings = await self._embed_model._aget_text_embeddings(list(missing.values()))
+            computed = dict(zip(missing, embeddings))
+            await asyncio.to_thread(embedding_cache.put_many, computed)
+        return self._merge(keys, cached, computed)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._get_text_embeddings([text])[0]
+
+    async def _aget_text_embedding(self, text: str) -> List[float]:
+        return (await self._aget_text_embeddings([text]))[0]
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._embed_model._get_query_embedding(query)
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return await self._embed_model._aget_query_embedding(query)
@@ -7,12 +7,13 @@ import asyncio
 import hashlib
 import logging
 import os
+import re
 import traceback
 from concurrent.futures.thread import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
 
 import dotenv
 from llama_index.core import Document, PromptTemplate, QueryBundle, StorageContext, VectorStoreIndex
-from llama_index.core.extractors import KeywordExtractor
 from llama_index.core.indices.vector_store import VectorIndexRetriever
 from llama_index.core.ingestion import IngestionPipeline
 from llama_index.core.node_parser import SentenceSplitter, SentenceWindowNodeParser
@@ -28,9 +29,17 @@ from llama_index.vector_stores.postgres import PGVectorStore
 from pydantic import BaseModel
 
 from database import Document as DBDocument
+from rag.embedding import CachedEmbedding
 
 logger = logging.getLogger(__name__)
 
+# 文档各语言的分页内容：语言标识 -> Document 上的字段名，与 Markdown 导出的 md_en / md_cn 对应
+PAGE_LANGUAGES = {"en": "content_pages", "cn": "translation_pages"}
+# 只作为检索结果定位信息、不参与向量化和模型上下文的元数据
+LOCATOR_METADATA_KEYS = ["owner", "url", "mimetype", "document_id", "page", "language"]
+
+_HEADING_PATTERN = re.compile(r"^#{1,6}\s+(.+?)\s*#*\s*$", re.MULTILINE)
+
 # DEBUG日志
 
 # logging.basicConfig(stream=sys.stdout, level=logging.DEBUG)
@@ -44,13 +53,18 @@ Settings.llm = OpenAILike(
     is_chat_model=True,
     max_retries=64,
 )
-Settings.embed_model = SiliconFlowEmbedding(
-    api_key=os.getenv("EMBEDDING_API_KEY"),
-    api_base=os.getenv("EMBEDDING_BASE_URL"),
-    model=os.getenv("EMBEDDING_MODEL"),
-    timeout=30,
-    max_retries=64,
-    num_workers=10,
+# 文本块的向量按内容缓存，重复内容不再调用嵌入模型
+Settings.embed_model = CachedEmbedding(
+    SiliconFlowEmbedding(
+        api_key=os.getenv("EMBEDDING_API_KEY"),
+        api_base=os.getenv("EMBEDDING_BASE_URL"),
+        model=os.getenv("EMBEDDING_MODEL"),
+        timeout=30,
+        max_retries=64,
+        num_workers=10,
+    ),
+    model_name=os.getenv("EMBEDDING_MODEL"),
+    dimensions=int(os.getenv("EMB_DIMENSIONS", 1536)),
 )
 
 
@@ -60,6 +74,8 @@ class KnowledgeBase:
     提供文档的存储、检索和查询功能。支持异步操作，使用向量数据库进行相似度搜索。
     """
 
+    INDEX_VERSION = "3"  # 文档写入知识库的方式（分块、拼接、元数据）的版本，修改后已索引的文档重新处理时会重新索引
+
     vector_store: PGVectorStore
     doc_store: PostgresDocumentStore
     pipeline: IngestionPipeline
@@ -72,6 +88,8 @@ class KnowledgeBase:
         pg_vector_uri,
         schema: str = "public",
         namespace: str = "default_user",
+        engine=None,
+        async_engine=None,
     ):
         """初始化知识库。
 
@@ -80,11 +98,14 @@ class KnowledgeBase:
             pg_vector_uri: PostgreSQL向量存储URI
             schema: 数据库schema名称
             namespace: 命名空间，用于隔离不同用户的数据
+            engine: 向量存储使用的同步数据库引擎，为空时按 pg_vector_uri 创建
+            async_engine: 向量存储使用的异步数据库引擎，为空时按 pg_vector_uri 创建；
+                多个命名空间的知识库可共享同一对引擎及其连接池
         """
         hashed_namespace = hashlib.md5(namespace.encode()).hexdigest()
         # 创建一个与 PostgreSQL 数据库交互的键值存储 (PostgresKVStore) 实例，用于存储向量化后的文档
         # 存储向量化的文档（例如嵌入向量）
-        self.vector_store = PGVectorStore.from_params(
+        self.vector_store = PGVectorStore(
             connection_string=pg_vector_uri.replace("asyncpg", "psycopg2"),
             async_connection_string=pg_vector_uri,
             table_name=f"{hashed_namespace}_vector",
@@ -92,7 +113,10 @@ class KnowledgeBase:
             hybrid_search=True,
             embed_dim=int(os.getenv("EMB_DIMENSIONS", 1536)),
             cache_ok=True,
+            engine=engine,
+            async_engine=async_engine,
         )
+        self._owns_engines = engine is None and async_engine is None
         # 创建一个键值存储实例 doc_store，用于存储原始文档内容。
         # 存储原始的文本文档，供后续检索和使用
         self.doc_store = PostgresDocumentStore.from_uri(
@@ -123,10 +147,7 @@ class KnowledgeBase:
                 #     questions=3,
                 #     num_workers=5,
                 # ),
-                KeywordExtractor(
-                    keywords=7,
-                    num_workers=5,
-                ),
+                # 关键词在写入前由 prepdocs.keywords 逐页提取并保存，作为条目元数据写入，不再逐个节点调用模型
                 Settings.embed_model,
             ],
             vector_store=self.vector_store,
@@ -136,6 +157,8 @@ class KnowledgeBase:
         # 用于存储用户的查询和模型的回答，以支持上下文增强生成(RAG)。
         # 格式通常为[(用户查询, 模型回答), ...]，在后续查询中，历史上下文将拼接到用户的新查询中。
         self.history = []
+        # 未按条目记录的文档（旧版本写入）在知识库中的条目ID，按文档ID分组，首次需要时从文档存储读取
+        self._untracked_entries: Optional[Dict[int, List[str]]] = None
         logger.info("RAG 初始化完成")
 
     # async：这是一个异步函数，允许通过await 调用异步操作，提高性能（特别是涉及I/O操作时，如数据库或网络访问）
@@ -154,33 +177,58 @@ class KnowledgeBase:
         await self.pipeline.arun(documents=[doc])
         return doc_id
 
-    async def upload_document(self, document: DBDocument):
-        """上传文档并存储到数据库."""
-        # 将分页内容拼接为完整的文本
-        text = f"{document.content_pages}\n{document.translation_pages}\n{document.keywords_pages}"
-        # 生成文档ID
-        hash_text = hashlib.md5(text.encode()).hexdigest()
-        doc_id = f"doc_{document.id}_{hash_text}"
-        metadata = {
-            "source": "document",
-            "title": document.filename,
-            "owner": document.owner.email,
-            "url": document.path,
-            "mimetype": document.content_type,
-        }
+    async def upload_document(self, document: DBDocument, replace: bool = False) -> Dict[str, str]:
+        """上传文档并存储到数据库，只写入有变化的条目.
 
-        # 将文档内容封装为Document对象
-        doc = Document(
-            text=text,
-            id_=doc_id,
-            metadata=metadata,
-            excluded_embed_metadata_keys=["owner"],
-            excluded_llm_metadata_keys=["owner"],
-        )
+        每页每种语言按 Markdown 标题拆分为章节，每个章节写入一个条目，元数据中记录页码、语言和所属标题，
+        检索结果可以定位到具体页面。条目ID由页码、语言和章节序号确定，与 document.index_entries
+        记录的上次写入结果对比：内容未变化的条目跳过，变化的条目删除后重新向量化，不再存在的条目删除。
+
+        Args:
+            document: 文档对象
+            replace: 是否删除全部已有条目后重新写入，更换嵌入模型后需要替换才会重新计算向量
+
+        Returns:
+            dict[str, str]: 写入后的条目ID到内容哈希的映射，调用方应保存到 document.index_entries
+        """
+        docs = build_section_documents(document)
+        entries = {doc.id_: doc.hash for doc in docs}
+        previous = document.index_entries
+        if previous is None:
+            # 按条目记录之前的旧文档：旧版本写入的条目ID带有内容哈希，无法推算，从文档存储中查找该文档的全部条目；
+            # 新文档创建时即为空字典，不会触发这里的全量扫描
+            stale = await self._get_untracked_entries(document.id)
+            changed = docs
+        elif replace:
+            stale = list(previous)
+            changed = docs
+        else:
+            stale, changed = diff_section_entries(docs, previous)
+
+        # 写入管道按条目哈希去重，需要同时删除已有的向量、节点和哈希记录
+        for ref_doc_id in stale:
+            await self.index.adelete_ref_doc(ref_doc_id=ref_doc_id, delete_from_docstore=True)
+            await self.doc_store.adelete_document(ref_doc_id, raise_error=False)
 
         # 执行文档注入管道（索引与落库）
-        await self.pipeline.arun(documents=[doc])
-        return doc_id
+        if changed:
+            await self.pipeline.arun(documents=changed)
+        logger.info(
+            f"文档 {document.id} 写入知识库：{len(changed)} 个条目更新，{len(docs) - len(changed)} 个未变化，"
+            f"删除 {len(set(stale) - set(entries))} 个"
+        )
+        return entries
+
+    async def _get_untracked_entries(self, document_id: int) -> List[str]:
+        """查找未按条目记录的文档在知识库中的全部条目ID."""
+        if self._untracked_entries is None:
+            untracked: Dict[int, List[str]] = {}
+            for ref_doc_id in (await self.doc_store.aget_all_document_hashes()).values():
+                parts = ref_doc_id.split("_")
+                if len(parts) >= 3 and parts[0] == "doc" and parts[1].isdigit():
+                    untracked.setdefault(int(parts[1]), []).append(ref_doc_id)
+            self._untracked_entries = untracked
+        return self._untracked_entries.pop(document_id, [])
 
     async def upload_files(self, file_paths: list[str]):
         """上传文件并存储到数据库。
@@ -381,6 +429,93 @@ class KnowledgeBase:
         """重置对话历史."""
         self.history = []
 
+    async def aclose(self):
+        """关闭知识库自己创建的数据库连接池，共享的引擎由创建者关闭."""
+        stores = [self.doc_store._kvstore]
+        if self._owns_engines:
+            stores.append(self.vector_store)
+        for store in stores:
+            if getattr(store, "_async_engine", None) is not None:
+                await store._async_engine.dispose()
+            if getattr(store, "_engine", None) is not None:
+                store._engine.dispose()
+
+
+def split_sections(text: str, heading: Optional[str] = None) -> Iterator[Tuple[Optional[str], str]]:
+    """按 Markdown 标题把页面文本拆分为章节.
+
+    Args:
+        text: 页面文本
+        heading: 上一页最后一个章节的标题，页面开头不在任何标题下的内容属于该章节
+
+    Yields:
+        tuple[Optional[str], str]: (章节标题, 章节文本)，跳过空白章节
+    """
+    start = 0
+    for match in _HEADING_PATTERN.finditer(text):
+        section = text[start : match.start()].strip()
+        if section:
+            yield heading, section
+        heading = match.group(1)
+        start = match.start()
+    section = text[start:].strip()
+    if section:
+        yield heading, section
+
+
+def build_section_documents(document: DBDocument) -> List[Document]:
+    """把文档的分页内容和翻译转换为按页、按章节划分的知识库条目.
+
+    条目ID格式为 doc_{文档ID}_p{页码}_{语言}_{章节序号}，重新处理后同一位置的章节ID不变。
+    """
+    base_metadata = {
+        "source": "document",
+        "title": document.filename,
+        "owner": document.owner.email,
+        "url": document.path,
+        "mimetype": document.content_type,
+        "document_id": document.id,
+    }
+    keywords_pages: Dict[str, List[str]] = document.keywords_pages or {}
+    docs = []
+    for language, field in PAGE_LANGUAGES.items():
+        pages: Dict[str, str] = getattr(document, field) or {}
+        heading = None
+        for key in sorted(pages, key=int):
+            page = int(key) + 1
+            for index, (heading, text) in enumerate(split_sections(pages[key] or "", heading)):
+                metadata = {**base_metadata, "page": page, "language": language}
+                if heading:
+                    metadata["heading"] = heading
+                if keywords_pages.get(key):
+                    metadata["keywords"] = ", ".join(keywords_pages[key])
+                docs.append(
+                    Document(
+                        text=text,
+                        id_=f"doc_{document.id}_p{page}_{language}_{index}",
+                        metadata=metadata,
+                        excluded_embed_metadata_keys=LOCATOR_METADATA_KEYS,
+                        excluded_llm_metadata_keys=["owner"],
+                    )
+                )
+    return docs
+
+
+def diff_section_entries(docs: List[Document], previous: Dict[str, str]) -> Tuple[List[str], List[Document]]:
+    """对比本次生成的条目与上次写入的条目.
+
+    Args:
+        docs: 本次生成的条目
+        previous: 上次写入的条目ID到内容哈希的映射
+
+    Returns:
+        tuple[List[str], List[Document]]: (需要删除的条目ID, 需要写入的条目)；内容变化的条目同时出现在两者中
+    """
+    entries = {doc.id_: doc.hash for doc in docs}
+    stale = [ref_doc_id for ref_doc_id, doc_hash in previous.items() if entries.get(ref_doc_id) != doc_hash]
+    changed = [doc for doc in docs if previous.get(doc.id_) != doc.hash]
+    return stale, changed
+
 
 # 定义请求和响应模型
 class QueryRequest(BaseModel):
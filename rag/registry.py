@@ -0,0 +1,122 @@
+"""知识库实例缓存模块.
+
+初始化 KnowledgeBase 需要创建向量存储、文档存储、索引和写入管道，首次访问时还要建立连接并检查数据表，
+每次搜索或写入都重新创建会让这些开销超过查询本身。这里按命名空间缓存已初始化的实例：
+所有命名空间的向量存储共享同一对数据库引擎及其连接池；实例数超过 KB_CACHE_SIZE 时关闭最久未使用的实例，
+空闲超过 KB_CACHE_IDLE_SECONDS 的实例在下一次获取时关闭。
+
+asyncpg 连接绑定在创建它的事件循环上，Web 进程、流水线工作器线程和命令行各自运行事件循环，因此缓存按事件循环分别保存.
+缓存的实例由多个请求共享，不应使用 query_with_context 的对话历史.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from typing import List, Tuple
+
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from config import get_settings
+from rag.knowledgebase import KnowledgeBase
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+
+def rag_database_uri() -> str:
+    """知识库数据库的异步连接URI."""
+    return (
+        f"postgresql+asyncpg://"
+        f"{settings.DATABASE_USER}:{settings.DATABASE_PASSWORD}"
+        f"@{settings.DATABASE_HOST}:{settings.DATABASE_PORT}/{settings.RAG_DATABASE_NAME}"
+    )
+
+
+class KnowledgeBaseRegistry:
+    """一个事件循环内按命名空间缓存的知识库实例."""
+
+    def __init__(self):
+        self.uri = rag_database_uri()
+        self.engine = create_engine(self.uri.replace("asyncpg", "psycopg2"), pool_pre_ping=True)
+        self.async_engine = create_async_engine(self.uri, pool_pre_ping=True)
+        # 命名空间 -> (知识库实例, 最近使用时间)，按最近使用顺序排列
+        self._entries: "OrderedDict[str, Tuple[KnowledgeBase, float]]" = OrderedDict()
+
+    async def get(self, namespace: str) -> KnowledgeBase:
+        """获取命名空间对应的知识库实例，不存在时创建."""
+        now = time.monotonic()
+        entry = self._entries.pop(namespace, None)
+        if entry is None:
+            kb = KnowledgeBase(
+                self.uri,
+                self.uri,
+                "public",
+                namespace,
+                engine=self.engine,
+                async_engine=self.async_engine,
+            )
+            logger.debug(f"创建知识库实例: {namespace}")
+        else:
+            kb = entry[0]
+        self._entries[namespace] = (kb, now)
+        await self._close_all(self._evict(now))
+        return kb
+
+    def _evict(self, now: float) -> List[KnowledgeBase]:
+        """移出空闲超时和超出数量上限的实例."""
+        evicted = []
+        idle_seconds = settings.KB_CACHE_IDLE_SECONDS
+        while self._entries:
+            namespace, (kb, used_at) = next(iter(self._entries.items()))
+            idle = idle_seconds and now - used_at >= idle_seconds
+            if len(self._entries) <= max(settings.KB_CACHE_SIZE, 1) and not idle:
+                break
+            del self._entries[namespace]
+            evicted.append(kb)
+            logger.debug(f"关闭知识库实例: {namespace}")
+        return evicted
+
+    @staticmethod
+    async def _close_all(knowledge_bases: List[KnowledgeBase]):
+        # 正在使用的连接在归还时才关闭，关闭仍被其他请求使用的实例不会中断其请求
+        for kb in knowledge_bases:
+            try:
+                await kb.aclose()
+            except Exception as e:
+                logger.warning(f"关闭知识库实例失败: {str(e)}")
+
+    async def close(self):
+        """关闭全部实例和共享的数据库引擎."""
+        knowledge_bases = [kb for kb, _ in self._entries.values()]
+        self._entries.clear()
+        await self._close_all(knowledge_bases)
+        await self.async_engine.dispose()
+        self.engine.dispose()
+
+
+_registries: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, KnowledgeBaseRegistry]" = weakref.WeakKeyDictionary()
+_registries_lock = threading.Lock()
+
+
+async def get_knowledge_base(namespace: str) -> KnowledgeBase:
+    """获取当前事件循环中命名空间对应的共享知识库实例."""
+    loop = asyncio.get_running_loop()
+    with _registries_lock:
+        registry = _registries.get(loop)
+        if registry is None:
+            registry = _registries[loop] = KnowledgeBaseRegistry()
+    return await registry.get(namespace)
+
+
+async def close_knowledge_bases():
+    """关闭当前事件循环中缓存的全部知识库实例，在事件循环退出前调用."""
+    loop = asyncio.get_running_loop()
+    with _registries_lock:
+        registry = _registries.pop(loop, None)
+    if registry is not None:
+        await registry.close()
@@ -3,6 +3,8 @@
 这个模块包含了所有与文档相关的路由处理器，包括文档上传、下载、预览、处理状态查询等功能。 支持文件夹管理、批量操作和笔记功能。
 """
 
+import asyncio
+import json
 import mimetypes
 import os
 import zipfile
@@ -22,12 +24,15 @@ from database import (
     DocumentReadRecord,
     Note,
     Folder,
+    JobPriority,
     ProcessingStatus,
     get_db,
 )
 from models.users import User
 from pipeline.document_pipeline import DocumentPipeline, get_document_pipeline
 from services.delete_service import delete_documents_by_ids
+from services.progress import get_latest_progress, subscribe_progress
+from services.upload_service import UploadTooLargeError, find_duplicate, spool_upload
 from services.session import get_current_user
 
 router = APIRouter(prefix="/documents", tags=["documents"])
@@ -318,7 +323,7 @@ async def upload_file(
         FileResponse: 上传的文件信息
 
     Raises:
-        HTTPException: 当文件夹不存在时抛出404错误
+        HTTPException: 当文件夹不存在时抛出404错误，文件超过大小限制时抛出413错误
     """
     if settings.GLOBAL_MODE == "public":
         base_query_folder = db.query(Folder)
@@ -332,34 +337,47 @@ async def upload_file(
             raise HTTPException(status_code=404, detail="文件夹不存在")
         folder_path = folder.path
 
-    # 读取文件内容
-    file_content = await file.read()
+    # 按块读取文件内容，同时计算哈希值并检查大小
+    try:
+        upload = await spool_upload(file, settings.MAX_UPLOAD_SIZE_MB * 1024 * 1024)
+    except UploadTooLargeError:
+        raise HTTPException(status_code=413, detail=f"文件大小超过限制（{settings.MAX_UPLOAD_SIZE_MB}MB）")
     filename = filename or file.filename
+    folder_id = int(folderId) if folderId else None
+
+    try:
+        # 同一文件夹下以相同文件名重复上传相同内容时直接返回已有文档
+        db_document = find_duplicate(db, current_user.id, folder_id, filename, upload.sha256)
+        is_duplicate = db_document is not None
+        if not is_duplicate:
+            # 创建新的文档记录
+            db_document = Document(
+                filename=filename,
+                content_type=file.content_type,
+                file_data=upload.read(),
+                file_size=upload.size,
+                file_hash=upload.sha256,
+                folder_id=folder_id,
+                owner_id=current_user.id,  # 使用当前用户ID
+                path=os.path.join(folder_path, str(filename)),  # 构建完整路径
+                is_folder=False,
+                mime_type=file.content_type,
+                processing_status=ProcessingStatus.PENDING,  # 设置初始状态为待处理
+            )
 
-    # 创建新的文档记录
-    db_document = Document(
-        filename=filename or file.filename,
-        content_type=file.content_type,
-        file_data=file_content,
-        file_size=len(file_content),
-        folder_id=int(folderId) if folderId else None,
-        owner_id=current_user.id,  # 使用当前用户ID
-        path=os.path.join(folder_path, str(filename)),  # 构建完整路径
-        is_folder=False,
-        mime_type=file.content_type,
-        processing_status=ProcessingStatus.PENDING,  # 设置初始状态为待处理
-    )
-
-    db.add(db_document)
-    db.commit()
-    db.refresh(db_document)
+            db.add(db_document)
+            db.commit()
+            db.refresh(db_document)
+    finally:
+        upload.close()
 
     user = db.query(User).filter(User.id == db_document.owner_id).first()
     if not user:
         raise HTTPException(status_code=404, detail="用户不存在")
-    
-    # 直接添加到处理队列
-    document_pipeline.add_task(db_document.id)
+
+    if not is_duplicate:
+        # 直接添加到处理队列
+        document_pipeline.add_task(db_document.id)
 
     return FileResponse(
         id=str(db_document.id),
@@ -457,6 +475,101 @@ async def list_files(
     ]
 
 
+@router.get("/processing-events")
+async def stream_processing_events(
+    ids: str = Query(..., description="逗号分隔的文档ID"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+    settings: Settings = Depends(get_settings),
+):
+    """以 SSE 推送多个文档的处理进度。
+
+    连接建立后先发送每个文档的当前进度，之后转发流水线通过 Redis 发布的逐阶段、逐页进度事件，
+    所有文档都处理完成或失败后结束。取代对 processing-status 的轮询。
+
+    Args:
+        ids: 逗号分隔的文档ID
+        db: 数据库会话
+        current_user: 当前用户
+        settings: 应用配置
+
+    Returns:
+        StreamingResponse: text/event-stream 响应，每个事件的 data 为一条进度 JSON
+
+    Raises:
+        HTTPException: 文档ID格式错误时抛出400错误，文档不存在时抛出404错误
+    """
+    try:
+        document_ids = sorted({int(document_id) for document_id in ids.split(",") if document_id})
+    except ValueError:
+        raise HTTPException(status_code=400, detail="文档ID格式错误")
+    if not document_ids:
+        raise HTTPException(status_code=400, detail="文档ID不能为空")
+
+    if settings.GLOBAL_MODE == "public":
+        base_query = db.query(Document)
+    else:
+        base_query = db.query(Document).filter(Document.owner_id == current_user.id)
+    documents = (
+        base_query.filter(Document.id.in_(document_ids))
+        .with_entities(
+            Document.id,
+            Document.processing_status,
+            Document.processor,
+            Document.error_message,
+            Document.total_pages,
+        )
+        .all()
+    )
+    if not documents:
+        raise HTTPException(status_code=404, detail="文档未找到")
+    # 推送期间不再访问数据库，提前归还连接
+    db.close()
+
+    # 处理状态以数据库为准，页级进度使用最近一次发布的进度
+    latest = await asyncio.to_thread(get_latest_progress, [doc.id for doc in documents])
+    initial_events = []
+    for doc in documents:
+        event = latest.get(doc.id)
+        if not event or event["processing_status"] != doc.processing_status.value:
+            event = {
+                "document_id": str(doc.id),
+                "processing_status": doc.processing_status.value,
+                "stage": None,
+                "completed_pages": None,
+                "total_pages": doc.total_pages,
+                "message": doc.error_message if doc.processing_status == ProcessingStatus.FAILED else doc.processor,
+            }
+        initial_events.append(event)
+    active_ids = {
+        doc.id for doc in documents if doc.processing_status in (ProcessingStatus.PENDING, ProcessingStatus.PROCESSING)
+    }
+    finished_statuses = (ProcessingStatus.COMPLETED.value, ProcessingStatus.FAILED.value)
+
+    async def event_stream():
+        for event in initial_events:
+            yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+        if not active_ids:
+            return
+        # 初始进度已发送，订阅只补发读取初始进度之后才发布的进度
+        async for event in subscribe_progress(sorted(active_ids), known=latest):
+            if event is None:
+                # 心跳，防止代理关闭空闲连接
+                yield ": ping\n\n"
+                continue
+            yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+            if event["processing_status"] in finished_statuses:
+                active_ids.discard(int(event["document_id"]))
+                if not active_ids:
+                    return
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @router.get("/{fileId}/processing-status")
 async def get_processing_status(
     fileId: str,
@@ -701,6 +814,7 @@ async def delete_file(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
     settings: Settings = Depends(get_settings),
+    document_pipeline: DocumentPipeline = Depends(get_document_pipeline),
 ):
     """删除文件。
 
@@ -709,6 +823,7 @@ async def delete_file(
         db: 数据库会话
         current_user: 当前用户
         settings: 应用配置
+        document_pipeline: 文档处理管道
 
     Returns:
         dict: 删除结果信息
@@ -725,6 +840,8 @@ async def delete_file(
         raise HTTPException(status_code=404, detail="文档未找到")
     delete_documents_by_ids(db, [int(fileId)])
     db.commit()
+    # 正在处理该文档的任务由工作器立即终止
+    document_pipeline.notify_worker()
     return {"message": "文件已删除"}
 
 
@@ -853,6 +970,7 @@ async def batch_delete_files(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
     settings: Settings = Depends(get_settings),
+    document_pipeline: DocumentPipeline = Depends(get_document_pipeline),
 ):
     """批量删除文件。
 
@@ -861,6 +979,7 @@ async def batch_delete_files(
         db: 数据库会话
         current_user: 当前用户
         settings: 应用配置
+        document_pipeline: 文档处理管道
 
     Returns:
         dict: 删除结果信息
@@ -880,6 +999,7 @@ async def batch_delete_files(
 
     delete_documents_by_ids(db, file_ids)
     db.commit()
+    document_pipeline.notify_worker()
     return {"message": "文件已批量删除"}
 
 
@@ -1046,12 +1166,104 @@ async def retry_processing(
     )
     db.commit()
 
-    # 重新添加到处理队列
-    document_pipeline.add_task(document.id)
+    # 重新添加到处理队列，用户手动重试的文档优先处理
+    document_pipeline.add_task(document.id, priority=JobPriority.INTERACTIVE)
 
     return {"message": "文件已重新加入处理队列"}
 
 
+@router.post("/{fileId}/reprocess")
+async def reprocess_document(
+    fileId: str,
+    full: bool = Query(False, description="是否从头处理全部阶段"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+    settings: Settings = Depends(get_settings),
+    document_pipeline: DocumentPipeline = Depends(get_document_pipeline),
+):
+    """重新处理已完成的文件。
+
+    默认只重新执行因模型、提示词或配置变化而失效的阶段和页面，full 为 True 时从头处理。
+
+    Args:
+        fileId: 文件ID
+        full: 是否从头处理全部阶段
+        db: 数据库会话
+        current_user: 当前用户
+        settings: 应用配置
+        document_pipeline: 文档处理管道
+
+    Returns:
+        dict: 处理结果信息
+
+    Raises:
+        HTTPException: 当文档不存在或尚未处理完成时抛出错误
+    """
+    if settings.GLOBAL_MODE == "public":
+        base_query_document = db.query(Document)
+    else:
+        base_query_document = db.query(Document).filter(Document.owner_id == current_user.id)
+    document = (
+        base_query_document.filter(Document.id == int(fileId))
+        .with_entities(Document.id, Document.processing_status)
+        .first()
+    )
+    if not document:
+        raise HTTPException(status_code=404, detail="文档未找到")
+
+    if document.processing_status != ProcessingStatus.COMPLETED:
+        raise HTTPException(status_code=400, detail="只能重新处理已处理完成的文件")
+
+    if not document_pipeline.add_task(document.id, force=True, full=full, priority=JobPriority.INTERACTIVE):
+        return {"message": "文件的处理结果已是最新，无需重新处理"}
+    return {"message": "文件已重新加入处理队列"}
+
+
+@router.post("/{fileId}/cancel-processing")
+async def cancel_processing(
+    fileId: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+    settings: Settings = Depends(get_settings),
+    document_pipeline: DocumentPipeline = Depends(get_document_pipeline),
+):
+    """取消排队中或正在处理的文件。
+
+    正在处理的文件会在工作器下一次轮询时停止，已处理的页面保留，之后重试时从中断处继续。
+
+    Args:
+        fileId: 文件ID
+        db: 数据库会话
+        current_user: 当前用户
+        settings: 应用配置
+        document_pipeline: 文档处理管道
+
+    Returns:
+        dict: 取消结果信息
+
+    Raises:
+        HTTPException: 当文档不存在或不在处理中时抛出错误
+    """
+    if settings.GLOBAL_MODE == "public":
+        base_query_document = db.query(Document)
+    else:
+        base_query_document = db.query(Document).filter(Document.owner_id == current_user.id)
+    document = (
+        base_query_document.filter(Document.id == int(fileId))
+        .with_entities(Document.id, Document.processing_status)
+        .first()
+    )
+    if not document:
+        raise HTTPException(status_code=404, detail="文档未找到")
+
+    if document.processing_status not in (ProcessingStatus.PENDING, ProcessingStatus.PROCESSING):
+        raise HTTPException(status_code=400, detail="只能取消待处理或处理中的文件")
+
+    if not document_pipeline.cancel_document(document.id):
+        raise HTTPException(status_code=400, detail="文件没有可取消的处理任务")
+    return {"message": "已取消文件处理"}
+
+
 @router.post("/{documentId}/notes", response_model=NoteResponse)
 async def create_note(
     documentId: str,
@@ -19,6 +19,7 @@ from sqlalchemy.orm import Session
 
 from config import Settings, get_settings
 from database import Document, Folder, ProcessingStatus, get_db
+from pipeline.document_pipeline import DocumentPipeline, get_document_pipeline
 from services.delete_service import delete_documents_by_ids
 from models.users import User
 from services.session import get_current_user
@@ -405,6 +406,7 @@ async def batch_delete_folders(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
     settings: Settings = Depends(get_settings),
+    document_pipeline: DocumentPipeline = Depends(get_document_pipeline),
 ):
     """批量删除文件夹。
 
@@ -413,6 +415,7 @@ async def batch_delete_folders(
         db: 数据库会话
         current_user: 当前用户
         settings: 应用配置
+        document_pipeline: 文档处理管道
 
     Returns:
         dict: 删除操作结果
@@ -465,6 +468,8 @@ async def batch_delete_folders(
         base_query_folder.filter(Folder.id.in_(leaf_ids)).delete(synchronize_session=False)
         remaining_ids -= set(leaf_ids)
     db.commit()
+    if document_ids:
+        document_pipeline.notify_worker()
     return {"message": "文件夹已删除"}
 
 
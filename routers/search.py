@@ -12,7 +12,7 @@ from sqlalchemy.orm import Session
 from config import Settings, get_settings
 from database import get_db
 from models.users import User
-from rag.knowledgebase import KnowledgeBase
+from rag.registry import get_knowledge_base
 from services.session import get_current_user
 
 router = APIRouter(prefix="/search", tags=["search"])
@@ -77,22 +77,8 @@ async def search(
             namespace = "public"
         else:
             namespace = str(current_user.email)
-        # 初始化 KnowledgeBase
-        pg_docs_uri = (
-            f"postgresql+asyncpg://"
-            f"{settings.DATABASE_USER}:{settings.DATABASE_PASSWORD}@"
-            f"{settings.DATABASE_HOST}:{settings.DATABASE_PORT}/{settings.RAG_DATABASE_NAME}"
-        )
-        pg_vector_uri = (
-            f"postgresql+asyncpg://"
-            f"{settings.DATABASE_USER}:{settings.DATABASE_PASSWORD}@"
-            f"{settings.DATABASE_HOST}:{settings.DATABASE_PORT}/{settings.RAG_DATABASE_NAME}"
-        )
-        kb = KnowledgeBase(
-            pg_docs_uri=pg_docs_uri,
-            pg_vector_uri=pg_vector_uri,
-            namespace=namespace,
-        )
+        # 获取命名空间对应的共享知识库实例
+        kb = await get_knowledge_base(namespace)
 
         # 调用检索方法
         nodes = await kb.retrieve(
@@ -11,10 +11,13 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
 
+from clients.client_pool import invalidate_api_key
 from clients.openai_client import OpenAIClient
+from clients.usage_tracker import get_usage_tracker
 from config import Settings, get_settings
 from database import ApiKey, get_db
 from models.users import User
+from pipeline.scheduler import queue_stats
 from services.session import get_current_user
 
 logger = logging.getLogger(__name__)
@@ -142,6 +145,7 @@ async def test_ai_settings(
                     user_id=current_user.id,
                 )
                 db.add(api_key_model)
+            previous_key = api_key_model.key
             current_user.ai_api_key = settings.apiKey
             current_user.ai_base_url = settings.baseUrl
             current_user.ai_standard_model = settings.standardModel
@@ -152,6 +156,8 @@ async def test_ai_settings(
             api_key_model.last_used_at = None
             api_key_model.last_error_message = None
             db.commit()
+            invalidate_api_key(previous_key)
+            invalidate_api_key(settings.apiKey)
             db.refresh(current_user)  # 刷新用户信息
             return {"status": "success", "message": "连接测试成功"}
     except Exception as e:
@@ -239,3 +245,56 @@ async def update_ai_settings(
         "standardModel": current_user.ai_standard_model,
         "advancedModel": current_user.ai_advanced_model,
     }
+
+
+@router.get("/ai/usage")
+async def get_ai_usage(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """获取API密钥使用统计（仅管理员）.
+
+    返回数据库中的累计统计，以及当前进程启动以来的统计和尚未写入数据库的统计数量.
+    """
+    if not current_user.is_superuser:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="没有权限查看使用统计",
+        )
+    tracker = get_usage_tracker()
+    process_usage = tracker.snapshot()
+    return {
+        "pending": tracker.pending_count(),
+        "keys": [
+            {
+                "id": api_key.id,
+                "name": api_key.name,
+                "userId": api_key.user_id,
+                "counter": api_key.counter,
+                "errorCounter": api_key.error_counter,
+                "promptTokens": api_key.prompt_tokens,
+                "completionTokens": api_key.completion_tokens,
+                "lastUsedAt": api_key.last_used_at,
+                "lastErrorMessage": api_key.last_error_message,
+                "process": process_usage.get(api_key.id),
+            }
+            for api_key in db.query(ApiKey).order_by(ApiKey.id).all()
+        ],
+    }
+
+
+@router.get("/pipeline/queue")
+async def get_pipeline_queue(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """获取文档处理任务队列的统计（仅管理员）.
+
+    返回各优先级和各用户的排队任务数、所有工作器正在处理的任务数和最长排队时间.
+    """
+    if not current_user.is_superuser:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="没有权限查看任务队列",
+        )
+    return queue_stats(db)
@@ -7,6 +7,8 @@ from database import (
     Document,
     DocumentReadRecord,
     Note,
+    PageAsset,
+    ProcessingJob,
     ProcessingRecord,
     QuizHistory,
     conversation_documents,
@@ -18,6 +20,8 @@ def delete_documents_by_ids(db: Session, document_ids: Iterable[int]) -> int:
 
     删除顺序：
     - ProcessingRecord
+    - ProcessingJob
+    - PageAsset
     - DocumentReadRecord
     - Note
     - QuizHistory
@@ -37,6 +41,8 @@ def delete_documents_by_ids(db: Session, document_ids: Iterable[int]) -> int:
 
     # 依赖表先删
     db.query(ProcessingRecord).filter(ProcessingRecord.document_id.in_(ids)).delete(synchronize_session=False)
+    db.query(ProcessingJob).filter(ProcessingJob.document_id.in_(ids)).delete(synchronize_session=False)
+    db.query(PageAsset).filter(PageAsset.document_id.in_(ids)).delete(synchronize_session=False)
     db.query(DocumentReadRecord).filter(DocumentReadRecord.document_id.in_(ids)).delete(synchronize_session=False)
     db.query(Note).filter(Note.document_id.in_(ids)).delete(synchronize_session=False)
     db.query(QuizHistory).filter(QuizHistory.document_id.in_(ids)).delete(synchronize_session=False)
@@ -0,0 +1,87 @@
+"""文本向量缓存服务模块。
+
+以 (嵌入模型, 向量维度, 规范化文本的 SHA-256) 为键缓存向量，所有命名空间共享：同一篇文档上传到多个用户的知识库、
+重新处理或批量重建索引时，内容相同的文本块只调用一次嵌入模型。规范化只统一 Unicode 形式和空白字符。
+读写按批进行，使用独立的短会话，调用方无需传入数据库会话。
+"""
+
+import hashlib
+import logging
+import re
+import unicodedata
+from array import array
+from typing import Dict, Iterable, List
+
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from config import get_settings
+from database import EmbeddingCache, get_db
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+QUERY_BATCH_SIZE = 500  # 每条查询语句读取或写入的向量数
+
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """规范化文本：统一为 NFC 形式，合并连续空白并去除首尾空白."""
+    return _WHITESPACE_PATTERN.sub(" ", unicodedata.normalize("NFC", text)).strip()
+
+
+def cache_key(model: str, dimensions: int, text: str) -> str:
+    """计算文本向量的缓存键."""
+    text_hash = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+    return hashlib.sha256(f"{model}\0{dimensions}\0{text_hash}".encode("utf-8")).hexdigest()
+
+
+def _batches(items: List, size: int) -> Iterable[List]:
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
+def get_many(cache_keys: List[str]) -> Dict[str, List[float]]:
+    """批量读取缓存的向量，返回命中的缓存键到向量的映射；缓存已禁用时返回空字典."""
+    if not settings.EMBEDDING_CACHE_ENABLED or not cache_keys:
+        return {}
+    found: Dict[str, List[float]] = {}
+    db = next(get_db())
+    try:
+        for batch in _batches(list(set(cache_keys)), QUERY_BATCH_SIZE):
+            rows = (
+                db.query(EmbeddingCache.cache_key, EmbeddingCache.embedding)
+                .filter(EmbeddingCache.cache_key.in_(batch))
+                .all()
+            )
+            for row in rows:
+                found[row.cache_key] = array("f", row.embedding).tolist()
+        return found
+    except Exception as e:
+        logger.warning(f"读取向量缓存失败: {str(e)}")
+        return found
+    finally:
+        db.close()
+
+
+def put_many(embeddings: Dict[str, List[float]]) -> None:
+    """批量写入向量，已存在相同键时保留原有向量。写入失败只记录日志，不影响处理流程."""
+    if not settings.EMBEDDING_CACHE_ENABLED or not embeddings:
+        return
+    db = next(get_db())
+    try:
+        insert = pg_insert if db.bind.dialect.name == "postgresql" else sqlite_insert
+        for batch in _batches(list(embeddings.items()), QUERY_BATCH_SIZE):
+            db.execute(
+                insert(EmbeddingCache)
+                .values([{"cache_key": key, "embedding": array("f", vector).tobytes()} for key, vector in batch])
+                .on_conflict_do_nothing(index_elements=["cache_key"])
+            )
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.warning(f"写入向量缓存失败: {str(e)}")
+    finally:
+        db.close()
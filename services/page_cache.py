@@ -0,0 +1,70 @@
+"""页面级处理结果缓存服务模块。
+
+以页面内容的 SHA-256 为键缓存文本提取和翻译结果。同一页面图片（相同渲染参数下 pdfium 的输出是确定的）
+在同一模型和提示词版本下只识别一次，同一段文本在同一模型、提示词版本和目标语言下只翻译一次。
+缓存读写使用独立的短会话，调用方无需传入数据库会话。
+"""
+
+import hashlib
+import logging
+from typing import Optional
+
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from config import get_settings
+from database import PageCache, get_db
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+
+def _digest(*parts) -> str:
+    sha256_hash = hashlib.sha256()
+    for part in parts:
+        sha256_hash.update(part if isinstance(part, bytes) else str(part).encode("utf-8"))
+        sha256_hash.update(b"\0")
+    return sha256_hash.hexdigest()
+
+
+def ocr_cache_key(image_data: bytes, model: str, prompt_version: str) -> str:
+    """计算文本提取结果的缓存键."""
+    return _digest(hashlib.sha256(image_data).hexdigest(), model, prompt_version)
+
+
+def translation_cache_key(text: str, target_language: str, model: str, prompt_version: str) -> str:
+    """计算翻译结果的缓存键."""
+    return _digest(hashlib.sha256(text.encode("utf-8")).hexdigest(), target_language, model, prompt_version)
+
+
+def get(kind: str, cache_key: str) -> Optional[str]:
+    """读取缓存的处理结果，未命中或缓存已禁用时返回None."""
+    if not settings.PAGE_CACHE_ENABLED:
+        return None
+    db = next(get_db())
+    try:
+        row = db.query(PageCache.content).filter(PageCache.kind == kind, PageCache.cache_key == cache_key).first()
+        return row.content if row else None
+    finally:
+        db.close()
+
+
+def put(kind: str, cache_key: str, content: str) -> None:
+    """写入处理结果，已存在相同键时保留原有结果。写入失败只记录日志，不影响处理流程."""
+    if not settings.PAGE_CACHE_ENABLED or not content:
+        return
+    db = next(get_db())
+    try:
+        insert = pg_insert if db.bind.dialect.name == "postgresql" else sqlite_insert
+        db.execute(
+            insert(PageCache)
+            .values(kind=kind, cache_key=cache_key, content=content)
+            .on_conflict_do_nothing(index_elements=["kind", "cache_key"])
+        )
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.warning(f"写入页面缓存失败: {str(e)}")
+    finally:
+        db.close()
@@ -0,0 +1,73 @@
+"""页面资源存储服务模块。
+
+按文档和页码读写渲染后的页面图片，图片以原始二进制形式存放在 page_assets 表中， 不再以 hex 字符串的形式写入 content_pages。
+"""
+
+from typing import List, Optional
+
+from sqlalchemy import delete, literal, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Row
+from sqlalchemy.orm import Session
+
+from database import PageAsset
+
+
+def save_page(db: Session, document_id: int, page_index: int, data: bytes, mime_type: str = "image/png") -> None:
+    """保存单个页面图片，同一页已存在时覆盖。
+
+    使用 Core insert 写入，不在会话中保留 ORM 对象，避免整篇文档的图片同时驻留内存。
+    """
+    insert = pg_insert if db.bind.dialect.name == "postgresql" else sqlite_insert
+    statement = insert(PageAsset).values(
+        document_id=document_id,
+        page_index=page_index,
+        mime_type=mime_type,
+        data=data,
+    )
+    db.execute(
+        statement.on_conflict_do_update(
+            index_elements=["document_id", "page_index"],
+            set_={"mime_type": statement.excluded.mime_type, "data": statement.excluded.data},
+        )
+    )
+
+
+def clear_pages(db: Session, document_id: int) -> None:
+    """删除文档的全部页面图片."""
+    db.execute(delete(PageAsset).where(PageAsset.document_id == document_id))
+
+
+def copy_pages(db: Session, source_document_id: int, target_document_id: int) -> None:
+    """把一个文档的全部页面图片复制给另一个文档，在数据库内完成，不经过应用进程."""
+    db.execute(
+        PageAsset.__table__.insert().from_select(
+            ["document_id", "page_index", "mime_type", "data", "created_at"],
+            select(
+                literal(target_document_id),
+                PageAsset.page_index,
+                PageAsset.mime_type,
+                PageAsset.data,
+                PageAsset.created_at,
+            ).where(PageAsset.document_id == source_document_id),
+        )
+    )
+
+
+def list_page_indexes(db: Session, document_id: int) -> List[int]:
+    """按顺序返回文档已存储的页码列表."""
+    rows = (
+        db.query(PageAsset.page_index).filter(PageAsset.document_id == document_id).order_by(PageAsset.page_index).all()
+    )
+    return [row.page_index for row in rows]
+
+
+def load_page(db: Session, document_id: int, page_index: int) -> Optional[Row]:
+    """读取单个页面图片，只加载这一页的二进制数据和MIME类型."""
+    return (
+        db.query(PageAsset)
+        .filter(PageAsset.document_id == document_id, PageAsset.page_index == page_index)
+        .with_entities(PageAsset.data, PageAsset.mime_type)
+        .first()
+    )
@@ -0,0 +1,113 @@
+"""文档处理进度推送服务模块。
+
+流水线通过 Redis 发布/订阅推送逐阶段、逐页的处理进度，每个文档对应一个频道；
+Web 进程按连接订阅多个文档的频道，以 SSE 转发给前端，取代对 processing-status 的轮询。
+每个文档的最新进度同时保存在 Redis 中，新连接建立时先发送最新进度。
+"""
+
+import json
+import logging
+from typing import AsyncIterator, Dict, Iterable, List, Optional
+
+import redis.asyncio as aioredis
+
+from config import get_settings
+from services.session import redis_client
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+CHANNEL_PREFIX = "document_progress:"
+LATEST_KEY_PREFIX = "document_progress_latest:"
+LATEST_EXPIRE_SECONDS = 24 * 60 * 60  # 最新进度的保存时长
+
+
+def channel_name(document_id: int) -> str:
+    """文档进度频道名."""
+    return f"{CHANNEL_PREFIX}{document_id}"
+
+
+def publish_progress(
+    document_id: int,
+    status: str,
+    stage: Optional[str] = None,
+    completed_pages: Optional[int] = None,
+    total_pages: Optional[int] = None,
+    message: Optional[str] = None,
+) -> None:
+    """发布文档处理进度。发布失败只记录日志，不影响处理流程.
+
+    Args:
+        document_id: 文档ID
+        status: 处理状态（ProcessingStatus 的值）
+        stage: 当前阶段（JobStage 的值）
+        completed_pages: 当前阶段已完成的页数
+        total_pages: 总页数
+        message: 进度描述或错误信息
+    """
+    event = {
+        "document_id": str(document_id),
+        "processing_status": status,
+        "stage": stage,
+        "completed_pages": completed_pages,
+        "total_pages": total_pages,
+        "message": message,
+    }
+    payload = json.dumps(event, ensure_ascii=False)
+    try:
+        pipe = redis_client.pipeline()
+        pipe.set(f"{LATEST_KEY_PREFIX}{document_id}", payload, ex=LATEST_EXPIRE_SECONDS)
+        pipe.publish(channel_name(document_id), payload)
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"发布处理进度失败: {str(e)}")
+
+
+def get_latest_progress(document_ids: Iterable[int]) -> Dict[int, dict]:
+    """批量读取文档的最新进度，没有进度记录的文档不包含在结果中."""
+    document_ids = list(document_ids)
+    if not document_ids:
+        return {}
+    payloads = redis_client.mget([f"{LATEST_KEY_PREFIX}{document_id}" for document_id in document_ids])
+    return {
+        document_id: json.loads(payload) for document_id, payload in zip(document_ids, payloads) if payload is not None
+    }
+
+
+async def subscribe_progress(
+    document_ids: List[int], heartbeat_interval: float = 15.0, known: Optional[Dict[int, dict]] = None
+) -> AsyncIterator[Optional[dict]]:
+    """订阅多个文档的进度事件，订阅建立后先产生各文档的最新进度.
+
+    Args:
+        document_ids: 文档ID列表
+        heartbeat_interval: 没有事件时产生心跳（None）的间隔（秒），用于保持连接
+        known: 调用方订阅前已读取并发送的最新进度（get_latest_progress 的结果），订阅建立后只补发与之不同的进度
+
+    Yields:
+        Optional[dict]: 进度事件，超时无事件时为 None
+    """
+    client = aioredis.Redis(
+        host=settings.REDIS_HOST,
+        port=settings.REDIS_PORT,
+        db=settings.REDIS_DB,
+        password=settings.REDIS_PASSWORD,
+        decode_responses=True,
+    )
+    pubsub = client.pubsub()
+    try:
+        await pubsub.subscribe(*(channel_name(document_id) for document_id in document_ids))
+        # 补发订阅建立前发布的最新进度，避免调用方读取初始状态和订阅之间的事件丢失
+        for document_id, event in get_latest_progress(document_ids).items():
+            if known is None or known.get(document_id) != event:
+                yield event
+        while True:
+            message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=heartbeat_interval)
+            if message is None:
+                yield None
+            elif message["type"] == "message":
+                yield json.loads(message["data"])
+    finally:
+        await pubsub.aclose()
+        await client.aclose()
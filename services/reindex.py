@@ -0,0 +1,239 @@
+"""知识库批量重建索引服务模块。
+
+按文档ID分批（keyset 分页）读取已处理完成的文档，只加载写入知识库所需的列，不加载原始文件和缩略图；
+多个文档并发写入知识库，写入速率由令牌桶限流，避免触发嵌入服务限流；每个文档只重新写入内容有变化的条目。
+
+重建进度保存在 ReindexCheckpoint 中：所有ID不超过 last_document_id 的文档都已处理，
+进程中断后再次运行同名任务时从该位置继续。private 模式下每个用户的文档写入各自的命名空间。
+"""
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy.orm import Session, joinedload, load_only
+
+from clients.llm_scheduler import LLMPriority, RateLimiter
+from config import get_settings
+from database import Document, ProcessingStatus, ReindexCheckpoint, SessionLocal
+from models.users import User
+from prepdocs.keywords import extract_keywords
+from rag.registry import get_knowledge_base
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+CHECKPOINT_INTERVAL = 5.0  # 保存重建进度的最小间隔（秒）
+
+
+@dataclass
+class ReindexResult:
+    """一次重建的结果统计."""
+
+    indexed: int = 0
+    failed_document_ids: List[int] = field(default_factory=list)
+    last_document_id: int = 0
+
+
+def _namespace(owner_email: str) -> str:
+    """文档所属的知识库命名空间，与流水线的保存阶段一致."""
+    return "public" if settings.GLOBAL_MODE == "public" else owner_email
+
+
+def _load_batch(after_id: int, batch_size: int, owner_email: Optional[str]) -> List[Document]:
+    """读取ID大于 after_id 的一批已处理完成的文档，只加载写入知识库所需的列."""
+    db = SessionLocal()
+    try:
+        query = (
+            db.query(Document)
+            .options(
+                load_only(
+                    Document.id,
+                    Document.filename,
+                    Document.path,
+                    Document.content_type,
+                    Document.content_pages,
+                    Document.translation_pages,
+                    Document.keywords_pages,
+                    Document.index_entries,
+                ),
+                # 用 llm 方式提取关键词时需要用户的模型配置
+                joinedload(Document.owner),
+            )
+            .filter(
+                Document.id > after_id,
+                Document.is_folder.is_(False),
+                Document.processing_status == ProcessingStatus.COMPLETED,
+            )
+        )
+        if owner_email:
+            query = query.filter(
+                Document.owner_id == db.query(User.id).filter(User.email == owner_email).scalar_subquery()
+            )
+        return query.order_by(Document.id).limit(batch_size).all()
+    finally:
+        db.close()
+
+
+def _save_index_result(document_id: int, keywords_pages: Dict[str, List[str]], entries: Dict[str, str]):
+    """保存文档的逐页关键词和写入知识库的条目，下次重建时只写入有变化的条目."""
+    db = SessionLocal()
+    try:
+        db.query(Document).filter(Document.id == document_id).update(
+            {Document.keywords_pages: keywords_pages, Document.index_entries: entries}, synchronize_session=False
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+def _get_checkpoint(db: Session, name: str, restart: bool) -> ReindexCheckpoint:
+    """获取或创建重建进度，重新开始或上次已完成时从头计数."""
+    checkpoint = db.query(ReindexCheckpoint).filter(ReindexCheckpoint.name == name).first()
+    if checkpoint is None:
+        checkpoint = ReindexCheckpoint(name=name, last_document_id=0, indexed_count=0, failed_document_ids=[])
+        db.add(checkpoint)
+    elif restart or checkpoint.finished_at is not None:
+        checkpoint.last_document_id = 0
+        checkpoint.indexed_count = 0
+        checkpoint.failed_document_ids = []
+        checkpoint.started_at = datetime.now()
+        checkpoint.finished_at = None
+    db.commit()
+    return checkpoint
+
+
+class _Progress:
+    """跟踪并发写入的完成情况，计算可以安全保存的进度位置.
+
+    文档按ID升序分发但完成顺序不定，进度位置是最长的已完成前缀中最大的ID。
+    """
+
+    def __init__(self, last_document_id: int, indexed: int, failed: List[int]):
+        self.last_document_id = last_document_id
+        self.indexed = indexed
+        self.failed = list(failed)
+        self._dispatched: Dict[int, bool] = {}  # 按分发顺序排列的未确认文档ID -> 是否已完成
+
+    def dispatched(self, document_id: int):
+        self._dispatched[document_id] = False
+
+    def done(self, document_id: int, success: bool):
+        if success:
+            self.indexed += 1
+        else:
+            self.failed.append(document_id)
+        self._dispatched[document_id] = True
+        while self._dispatched:
+            first = next(iter(self._dispatched))
+            if not self._dispatched[first]:
+                break
+            del self._dispatched[first]
+            self.last_document_id = first
+
+
+def _save_progress(name: str, progress: _Progress, finished: bool = False):
+    db = SessionLocal()
+    try:
+        checkpoint = db.query(ReindexCheckpoint).filter(ReindexCheckpoint.name == name).first()
+        checkpoint.last_document_id = progress.last_document_id
+        checkpoint.indexed_count = progress.indexed
+        checkpoint.failed_document_ids = list(progress.failed)
+        if finished:
+            checkpoint.finished_at = datetime.now()
+        db.commit()
+    finally:
+        db.close()
+
+
+async def reindex_documents(
+    name: str = "default",
+    concurrency: Optional[int] = None,
+    documents_per_minute: Optional[int] = None,
+    owner_email: Optional[str] = None,
+    restart: bool = False,
+    replace: bool = False,
+) -> ReindexResult:
+    """把已处理完成的文档批量写入知识库，可中断后继续.
+
+    Args:
+        name: 重建任务名称，同名任务共享进度
+        concurrency: 同时写入的文档数，默认为 REINDEX_CONCURRENCY
+        documents_per_minute: 每分钟写入的文档数上限，默认为 REINDEX_DOCUMENTS_PER_MINUTE
+        owner_email: 只重建该用户的文档
+        restart: 是否忽略已保存的进度从头开始
+        replace: 是否重新写入全部条目（包括内容未变化的），更换嵌入模型后需要替换
+
+    Returns:
+        ReindexResult: 本次重建结束时的累计统计
+    """
+    concurrency = max(concurrency or settings.REINDEX_CONCURRENCY, 1)
+    limiter = RateLimiter(documents_per_minute or settings.REINDEX_DOCUMENTS_PER_MINUTE, concurrency, concurrency)
+
+    db = SessionLocal()
+    try:
+        checkpoint = _get_checkpoint(db, name, restart)
+        progress = _Progress(checkpoint.last_document_id, checkpoint.indexed_count, checkpoint.failed_document_ids)
+    finally:
+        db.close()
+    if progress.last_document_id:
+        logger.info(f"从文档 {progress.last_document_id} 之后继续重建索引，已完成 {progress.indexed} 个")
+
+    queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+    saved_at = time.monotonic()
+
+    async def produce():
+        after_id = progress.last_document_id
+        while True:
+            batch = await asyncio.to_thread(_load_batch, after_id, settings.REINDEX_BATCH_SIZE, owner_email)
+            if not batch:
+                break
+            for document in batch:
+                progress.dispatched(document.id)
+                await queue.put(document)
+            after_id = batch[-1].id
+        for _ in range(concurrency):
+            await queue.put(None)
+
+    async def consume():
+        nonlocal saved_at
+        while (document := await queue.get()) is not None:
+            knowledge_base = await get_knowledge_base(_namespace(document.owner.email))
+            acquired_at = await limiter.acquire(LLMPriority.BACKGROUND)
+            try:
+                document.keywords_pages = await extract_keywords(document)
+                entries = await knowledge_base.upload_document(document, replace=replace)
+                await asyncio.to_thread(_save_index_result, document.id, document.keywords_pages, entries)
+                progress.done(document.id, True)
+            except Exception as e:
+                logger.error(f"文档 {document.id}（{document.filename}）写入知识库失败: {str(e)}")
+                progress.done(document.id, False)
+            finally:
+                limiter.release(acquired_at)
+
+            if time.monotonic() - saved_at >= CHECKPOINT_INTERVAL:
+                saved_at = time.monotonic()
+                await asyncio.to_thread(_save_progress, name, progress)
+                logger.info(f"已写入 {progress.indexed} 个文档，失败 {len(progress.failed)} 个")
+
+    tasks = [asyncio.ensure_future(produce())] + [asyncio.ensure_future(consume()) for _ in range(concurrency)]
+    finished = False
+    try:
+        await asyncio.gather(*tasks)
+        finished = True
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await asyncio.to_thread(_save_progress, name, progress, finished)
+
+    logger.info(f"重建索引完成，共写入 {progress.indexed} 个文档，失败 {len(progress.failed)} 个")
+    return ReindexResult(
+        indexed=progress.indexed,
+        failed_document_ids=progress.failed,
+        last_document_id=progress.last_document_id,
+    )
@@ -0,0 +1,150 @@
+"""文件上传服务模块。
+
+把上传文件按块写入临时文件，同时增量计算 SHA-256 并检查大小限制， 在写入数据库之前即可根据哈希值判断是否为重复上传。
+FastAPI 在调用路由函数之前就会把 multipart 请求体完整写入临时文件，超过大小限制的请求由 UploadSizeLimitMiddleware
+在读取请求体时中止。
+"""
+
+import hashlib
+import tempfile
+from dataclasses import dataclass
+from typing import BinaryIO, Iterable, Optional
+
+from fastapi import HTTPException, UploadFile
+from sqlalchemy.orm import Session
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from database import Document, ProcessingStatus
+
+CHUNK_SIZE = 1024 * 1024  # 每次读取 1MB
+MULTIPART_OVERHEAD = 64 * 1024  # 请求体中除文件内容外的表单字段和分隔符所允许的字节数
+
+
+class UploadTooLargeError(Exception):
+    """上传文件超过大小限制."""
+
+
+@dataclass
+class SpooledUpload:
+    """已写入临时文件的上传内容."""
+
+    file: BinaryIO
+    size: int
+    sha256: str
+
+    def read(self) -> bytes:
+        """读取完整内容，仅在写入数据库时调用一次."""
+        self.file.seek(0)
+        return self.file.read()
+
+    def close(self):
+        """删除临时文件."""
+        self.file.close()
+
+
+async def spool_upload(upload: UploadFile, max_size: int) -> SpooledUpload:
+    """按块读取上传文件，写入临时文件并计算 SHA-256.
+
+    Args:
+        upload: 上传的文件
+        max_size: 允许的最大字节数
+
+    Returns:
+        SpooledUpload: 临时文件、大小和哈希值，使用完毕后需调用 close
+
+    Raises:
+        UploadTooLargeError: 文件超过大小限制时抛出
+    """
+    if upload.size is not None and upload.size > max_size:
+        raise UploadTooLargeError()
+
+    sha256_hash = hashlib.sha256()
+    size = 0
+    spool = tempfile.TemporaryFile()
+    try:
+        while chunk := await upload.read(CHUNK_SIZE):
+            size += len(chunk)
+            if size > max_size:
+                raise UploadTooLargeError()
+            sha256_hash.update(chunk)
+            spool.write(chunk)
+    except BaseException:
+        spool.close()
+        raise
+    return SpooledUpload(file=spool, size=size, sha256=sha256_hash.hexdigest())
+
+
+class UploadSizeLimitMiddleware:
+    """在读取请求体时检查上传接口大小限制的 ASGI 中间件.
+
+    只检查 paths 中的上传接口，其他接口的请求原样传递。声明的 Content-Length 超过上限时直接返回 413，不读取请求体；分块传输等未声明长度的请求在已接收的字节数
+    超过上限时中止读取并返回 413。上限为单个上传文件的大小限制加上表单的其他内容。
+    """
+
+    def __init__(self, app: ASGIApp, max_size_mb: int, paths: Iterable[str]):
+        """初始化中间件.
+
+        Args:
+            app: 下游 ASGI 应用
+            max_size_mb: 单个上传文件的大小上限（MB）
+            paths: 需要检查的上传接口路径，相对于应用的挂载路径
+        """
+        self.app = app
+        self.paths = frozenset(paths)
+        self.max_size = max_size_mb * 1024 * 1024 + MULTIPART_OVERHEAD
+        self.detail = f"文件大小超过限制（{max_size_mb}MB）"
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or self._route_path(scope) not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        content_length = Headers(scope=scope).get("content-length")
+        if content_length and content_length.isdigit() and int(content_length) > self.max_size:
+            await JSONResponse({"detail": self.detail}, status_code=413)(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_size:
+                    # 请求体解析中抛出的 HTTPException 会原样转换为响应
+                    raise HTTPException(status_code=413, detail=self.detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+    @staticmethod
+    def _route_path(scope: Scope) -> str:
+        """请求在当前应用内的路径：挂载为子应用时去掉挂载路径."""
+        path = scope["path"]
+        root_path = scope.get("root_path", "")
+        if root_path and path.startswith(root_path):
+            return path[len(root_path) :]
+        return path
+
+
+def find_duplicate(
+    db: Session, owner_id: int, folder_id: Optional[int], filename: str, file_hash: str
+) -> Optional[Document]:
+    """查找同一用户在同一文件夹下文件名和内容都相同且未处理失败的文档，用于重复上传时直接返回已有文档.
+
+    文件名不同时不视为重复上传，新文档的处理结果由流水线从相同内容的已完成文档复用。
+    """
+    return (
+        db.query(Document)
+        .filter(
+            Document.file_hash == file_hash,
+            Document.owner_id == owner_id,
+            Document.folder_id == folder_id if folder_id is not None else Document.folder_id.is_(None),
+            Document.filename == filename,
+            Document.processing_status != ProcessingStatus.FAILED,
+        )
+        .first()
+    )
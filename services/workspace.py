@@ -0,0 +1,157 @@
+"""任务工作区服务模块。
+
+文档处理过程中的临时文件（原始文档、转换后的 PDF、渲染的页面图片）统一放在按任务划分的工作区目录中：
+工作区有磁盘配额，任务成功、失败或被取消时都会删除，进程启动时清理已退出进程遗留的工作区。
+
+内存模式（WORKSPACE_IN_MEMORY）下工作区默认放在 tmpfs（/dev/shm），页面图片由渲染进程直接以二进制数据返回，
+不再写入文件。
+"""
+
+import logging
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from config import get_settings
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+WORKSPACE_PREFIX = "job-"
+ORPHAN_MAX_AGE = 24 * 60 * 60  # 超过该时长（秒）的工作区即使所属进程仍在运行也视为遗留
+
+
+class WorkspaceQuotaExceeded(Exception):
+    """工作区占用的磁盘空间超过配额."""
+
+
+def workspace_root() -> str:
+    """工作区根目录，未配置时内存模式使用 /dev/shm，否则使用系统临时目录."""
+    if settings.WORKSPACE_DIR:
+        return settings.WORKSPACE_DIR
+    base = "/dev/shm" if settings.WORKSPACE_IN_MEMORY and os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(base, "thelab-workspaces")
+
+
+class Workspace:
+    """单个任务的工作区."""
+
+    def __init__(self, path: str, quota_bytes: int, in_memory: bool = False):
+        """初始化工作区.
+
+        Args:
+            path: 工作区目录
+            quota_bytes: 磁盘配额（字节），0 表示不限制
+            in_memory: 是否为内存模式，内存模式下页面图片不写入文件
+        """
+        self.path = path
+        self.quota_bytes = quota_bytes
+        self.in_memory = in_memory
+
+    def file_path(self, name: str) -> str:
+        """工作区内的文件路径，只保留文件名部分，避免路径穿越."""
+        return os.path.join(self.path, os.path.basename(name))
+
+    def write_file(self, name: str, data: bytes) -> str:
+        """写入文件并检查配额，返回文件路径."""
+        path = self.file_path(name)
+        with open(path, "wb") as f:
+            f.write(data)
+        self.check_quota()
+        return path
+
+    def usage(self) -> int:
+        """工作区当前占用的字节数."""
+        total = 0
+        for dirpath, _, filenames in os.walk(self.path):
+            for filename in filenames:
+                try:
+                    total += os.path.getsize(os.path.join(dirpath, filename))
+                except OSError:
+                    pass
+        return total
+
+    def check_quota(self):
+        """检查工作区占用空间.
+
+        Raises:
+            WorkspaceQuotaExceeded: 超过配额时抛出
+        """
+        if not self.quota_bytes:
+            return
+        usage = self.usage()
+        if usage > self.quota_bytes:
+            raise WorkspaceQuotaExceeded(
+                f"临时文件占用 {usage // (1024 * 1024)}MB，超过配额 {self.quota_bytes // (1024 * 1024)}MB"
+            )
+
+    def cleanup(self):
+        """删除工作区目录."""
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+@contextmanager
+def open_workspace(job_id: int) -> Iterator[Workspace]:
+    """为任务创建工作区，退出时（包括出错和取消）删除.
+
+    目录名包含进程号，启动时据此判断工作区是否为已退出进程的遗留。
+    """
+    root = workspace_root()
+    os.makedirs(root, exist_ok=True)
+    path = os.path.join(root, f"{WORKSPACE_PREFIX}{job_id}-{os.getpid()}-{uuid.uuid4().hex[:8]}")
+    os.makedirs(path)
+    workspace = Workspace(path, settings.WORKSPACE_QUOTA_MB * 1024 * 1024, settings.WORKSPACE_IN_MEMORY)
+    try:
+        yield workspace
+    finally:
+        workspace.cleanup()
+
+
+def _owner_pid(name: str) -> Optional[int]:
+    parts = name[len(WORKSPACE_PREFIX) :].split("-")
+    if len(parts) != 3 or not parts[1].isdigit():
+        return None
+    return int(parts[1])
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def sweep_orphaned_workspaces() -> int:
+    """删除已退出进程遗留的工作区，以及超过 ORPHAN_MAX_AGE 的工作区，返回删除的数量."""
+    root = workspace_root()
+    if not os.path.isdir(root):
+        return 0
+
+    removed = 0
+    now = time.time()
+    for entry in os.scandir(root):
+        if not entry.is_dir(follow_symlinks=False) or not entry.name.startswith(WORKSPACE_PREFIX):
+            continue
+        pid = _owner_pid(entry.name)
+        if pid == os.getpid():
+            continue
+        try:
+            age = now - entry.stat(follow_symlinks=False).st_mtime
+        except FileNotFoundError:
+            continue
+        if pid is not None and _pid_alive(pid) and age < ORPHAN_MAX_AGE:
+            continue
+        shutil.rmtree(entry.path, ignore_errors=True)
+        removed += 1
+
+    if removed:
+        logger.info(f"已清理 {removed} 个遗留的任务工作区: {root}")
+    return removed
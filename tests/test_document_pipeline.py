@@ -0,0 +1,112 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import models.users  # noqa: F401  注册 users 表，供 documents 表的外键使用
+from database import Base, Document, JobStage, JobStatus, ProcessingJob, ProcessingRecord, ProcessingStatus
+from pipeline import document_pipeline
+from pipeline.document_pipeline import DocumentPipeline
+from services import page_store
+
+
+@pytest.fixture
+def session_factory(monkeypatch):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    factory = sessionmaker(bind=engine)
+
+    def get_db():
+        db = factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    monkeypatch.setattr(document_pipeline, "get_db", get_db)
+    monkeypatch.setattr(document_pipeline, "publish_progress", lambda *args, **kwargs: None)
+    yield factory
+    engine.dispose()
+
+
+def _document(document_id: int, owner_id: int, **kwargs) -> Document:
+    return Document(
+        id=document_id,
+        filename=f"{document_id}.pdf",
+        content_type="application/pdf",
+        file_data=b"%PDF",
+        file_size=4,
+        file_hash="same-file",
+        owner_id=owner_id,
+        path=f"/{document_id}.pdf",
+        **kwargs,
+    )
+
+
+def _add_source(db, status: ProcessingStatus):
+    db.add_all(
+        [
+            models.users.User(id=1, email="a@example.com", username="a", hashed_password="x"),
+            models.users.User(id=2, email="b@example.com", username="b", hashed_password="x"),
+            _document(
+                1,
+                owner_id=1,
+                processing_status=status,
+                total_pages=2,
+                content_pages={"0": "page zero", "1": "page one"},
+                translation_pages={"0": "第零页", "1": "第一页"},
+                keywords_pages={"0": ["zero"], "1": ["one"]},
+                index_entries={"doc_1_p0_s0": "hash"},
+            ),
+            ProcessingRecord(
+                document_id=1,
+                file_hash="same-file",
+                version=1,
+                processor_version=DocumentPipeline.VERSION,
+                processing_config={},
+            ),
+            _document(2, owner_id=2),
+        ]
+    )
+    db.flush()
+    page_store.save_page(db, 1, 1, b"image")
+    db.commit()
+
+
+def test_same_file_reuses_completed_results_and_still_indexes(session_factory):
+    """测试相同文件复用已完成文档的页面内容，但仍为新文档排队只执行知识库写入阶段的任务."""
+    db = session_factory()
+    _add_source(db, ProcessingStatus.COMPLETED)
+
+    assert DocumentPipeline(start_worker=False).add_task(2)
+
+    db.expire_all()
+    document = db.query(Document).get(2)
+    assert document.processing_status == ProcessingStatus.PENDING
+    assert document.content_pages == {"0": "page zero", "1": "page one"}
+    assert document.keywords_pages == {"0": ["zero"], "1": ["one"]}
+    assert document.index_entries == {}
+    assert page_store.list_page_indexes(db, 2) == [1]
+
+    job = db.query(ProcessingJob).filter(ProcessingJob.document_id == 2).one()
+    assert job.status == JobStatus.QUEUED
+    assert job.owner_id == 2
+    assert job.completed_stages == [JobStage.RENDER, JobStage.EXTRACT, JobStage.TRANSLATE]
+    assert job.page_checkpoints[JobStage.TRANSLATE] == [0, 1]
+    db.close()
+
+
+def test_same_file_does_not_reuse_unfinished_results(session_factory):
+    """测试来源文档尚未处理完成时不复用其结果，新文档从头处理."""
+    db = session_factory()
+    _add_source(db, ProcessingStatus.PROCESSING)
+
+    assert DocumentPipeline(start_worker=False).add_task(2)
+
+    db.expire_all()
+    document = db.query(Document).get(2)
+    assert document.processing_status == ProcessingStatus.PENDING
+    assert not document.content_pages
+    job = db.query(ProcessingJob).filter(ProcessingJob.document_id == 2).one()
+    assert not job.completed_stages
+    db.close()
@@ -0,0 +1,46 @@
+from prepdocs.keywords import _candidate_phrases, extract_keywords_local
+
+HEADER = "Acme Annual Report"
+
+
+def test_candidate_phrases_split_on_stopwords_and_punctuation():
+    """测试候选短语按停用词和标点切分，过长的片段不作为候选短语."""
+    phrases = list(_candidate_phrases("Vector databases store embeddings, and the retrieval pipeline ranks them."))
+
+    assert phrases == [("retrieval", "pipeline", "ranks")]
+    assert list(_candidate_phrases("see https://example.com/page for details")) == [("see",), ("details",)]
+
+
+def test_candidate_phrases_split_chinese_on_function_words():
+    """测试中文按虚词切分为候选短语."""
+    phrases = list(_candidate_phrases("向量数据库的检索性能和索引结构"))
+
+    assert ("向量数据库",) in phrases
+    assert ("检索性能",) in phrases
+    assert ("索引结构",) in phrases
+
+
+def test_extract_keywords_ranks_page_specific_phrases_above_header():
+    """测试每页都出现的页眉因逆文档频率低，得分低于各页特有的同样长度的短语."""
+    pages = {
+        "0": f"{HEADER}. Revenue grew on cloud services demand.",
+        "1": f"{HEADER}. Operating costs fell after the supply chain restructuring.",
+        "2": f"{HEADER}. Headcount stayed flat in all regions.",
+    }
+
+    assert extract_keywords_local(pages, top_k=1) == {
+        "0": ["cloud services demand"],
+        "1": ["operating costs fell"],
+        "2": ["headcount stayed flat"],
+    }
+    keywords = extract_keywords_local(pages, top_k=5)
+    assert keywords["1"] == ["operating costs fell", "supply chain restructuring", "acme annual report"]
+
+
+def test_extract_keywords_only_for_targets():
+    """测试只为指定页面提取关键词，空白页面没有关键词."""
+    pages = {"0": "Graph neural networks", "1": "Transformer attention layers", "2": "   "}
+    keywords = extract_keywords_local(pages, top_k=3, targets=["1", "2"])
+
+    assert list(keywords) == ["1"]
+    assert keywords["1"] == ["transformer attention layers"]
@@ -0,0 +1,75 @@
+from types import SimpleNamespace
+
+from rag.knowledgebase import build_section_documents, diff_section_entries, split_sections
+
+
+def _document(content_pages, translation_pages=None, keywords_pages=None):
+    return SimpleNamespace(
+        id=7,
+        filename="report.pdf",
+        owner=SimpleNamespace(email="owner@example.com"),
+        path="/report.pdf",
+        content_type="application/pdf",
+        content_pages=content_pages,
+        translation_pages=translation_pages or {},
+        keywords_pages=keywords_pages or {},
+    )
+
+
+def test_split_sections_by_heading():
+    """测试按 Markdown 标题拆分章节，页面开头的内容属于上一页的章节，空白章节被跳过."""
+    text = "continued from previous page\n\n# Introduction\nintro text\n## Background ##\n\n# Empty\n   \n"
+
+    assert list(split_sections(text, "Overview")) == [
+        ("Overview", "continued from previous page"),
+        ("Introduction", "# Introduction\nintro text"),
+        ("Background", "## Background ##"),
+        ("Empty", "# Empty"),
+    ]
+    assert list(split_sections("plain text")) == [(None, "plain text")]
+    assert list(split_sections("  \n")) == []
+
+
+def test_build_section_documents_ids_and_metadata():
+    """测试条目ID由页码、语言和章节序号确定，标题跨页延续，元数据包含定位信息和关键词."""
+    document = _document(
+        {"0": "# Methods\nfirst part", "1": "second part\n# Results\nnumbers"},
+        translation_pages={"0": "# 方法\n第一部分"},
+        keywords_pages={"1": ["results", "numbers"]},
+    )
+    docs = build_section_documents(document)
+
+    assert [doc.id_ for doc in docs] == ["doc_7_p1_en_0", "doc_7_p2_en_0", "doc_7_p2_en_1", "doc_7_p1_cn_0"]
+    assert docs[1].text == "second part"
+    assert docs[1].metadata["heading"] == "Methods"
+    assert docs[1].metadata["page"] == 2
+    assert docs[1].metadata["keywords"] == "results, numbers"
+    assert docs[3].metadata["language"] == "cn"
+    assert "keywords" not in docs[0].metadata
+    assert "owner" in docs[0].excluded_embed_metadata_keys
+
+
+def test_reprocessing_keeps_ids_and_only_rewrites_changed_entries():
+    """测试重新处理后同一位置的条目ID不变，只有内容变化的条目需要删除并重新写入."""
+    before = build_section_documents(_document({"0": "# A\nalpha", "1": "# B\nbeta\n# C\ngamma"}))
+    previous = {doc.id_: doc.hash for doc in before}
+    after = build_section_documents(_document({"0": "# A\nalpha", "1": "# B\nbeta, corrected\n# C\ngamma"}))
+
+    assert [doc.id_ for doc in after] == [doc.id_ for doc in before]
+    stale, changed = diff_section_entries(after, previous)
+    assert stale == ["doc_7_p2_en_0"]
+    assert [doc.id_ for doc in changed] == ["doc_7_p2_en_0"]
+
+    assert diff_section_entries(before, previous) == ([], [])
+
+
+def test_removed_and_added_entries():
+    """测试不再存在的条目只删除，新增的条目只写入."""
+    before = build_section_documents(_document({"0": "# A\nalpha\n# B\nbeta"}))
+    previous = {doc.id_: doc.hash for doc in before}
+    after = build_section_documents(_document({"0": "# A\nalpha", "1": "new page"}))
+
+    stale, changed = diff_section_entries(after, previous)
+    assert stale == ["doc_7_p1_en_1"]
+    assert [doc.id_ for doc in changed] == ["doc_7_p2_en_0"]
+    assert changed[0].metadata["heading"] == "A"
@@ -0,0 +1,56 @@
+import asyncio
+
+from clients.llm_scheduler import LLMScheduler
+
+
+async def _create_stream():
+    async def chunks():
+        for chunk in ("a", "b", "c"):
+            yield chunk
+
+    return chunks()
+
+
+def test_stream_releases_slot_after_reading():
+    """测试流式调用读取结束后释放名额."""
+
+    async def run():
+        scheduler = LLMScheduler()
+        limiter = scheduler.get_limiter("key", "model")
+        stream = await scheduler.stream("key", "model", _create_stream)
+        assert limiter.in_flight == 1
+        assert [chunk async for chunk in stream] == ["a", "b", "c"]
+        assert limiter.in_flight == 0
+
+    asyncio.run(run())
+
+
+def test_stream_releases_slot_when_closed():
+    """测试流式调用读取中途被关闭时释放名额."""
+
+    async def run():
+        scheduler = LLMScheduler()
+        limiter = scheduler.get_limiter("key", "model")
+        stream = await scheduler.stream("key", "model", _create_stream)
+        assert await stream.__anext__() == "a"
+        await stream.aclose()
+        assert limiter.in_flight == 0
+        await stream.aclose()
+        assert limiter.in_flight == 0
+
+    asyncio.run(run())
+
+
+def test_stream_releases_slot_when_never_iterated():
+    """测试流式调用从未被读取就被丢弃时（如客户端在响应开始前断开）释放名额."""
+
+    async def run():
+        scheduler = LLMScheduler()
+        limiter = scheduler.get_limiter("key", "model")
+        stream = await scheduler.stream("key", "model", _create_stream)
+        assert limiter.in_flight == 1
+        del stream
+        await asyncio.sleep(0)
+        assert limiter.in_flight == 0
+
+    asyncio.run(run())
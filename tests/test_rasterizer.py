@@ -0,0 +1,56 @@
+import ctypes
+
+import pypdfium2 as pdfium
+import pypdfium2.raw as pdfium_c
+import pytest
+
+from prepdocs.config import RenderProfile
+from prepdocs.rasterizer import THUMBNAIL_PROFILE, render_scale
+
+ADAPTIVE = RenderProfile(name="test", dpi=150, min_dpi=100, max_dpi=220)
+FIXED = RenderProfile(name="test", dpi=150)
+
+
+@pytest.fixture
+def pdf():
+    document = pdfium.PdfDocument.new()
+    yield document
+    document.close()
+
+
+def _page(pdf: pdfium.PdfDocument, char_count: int, width: float = 612, height: float = 792) -> pdfium.PdfPage:
+    """生成文字层包含 char_count 个字符的页面，每行 100 个字符."""
+    page = pdf.new_page(width, height)
+    for line in range(0, char_count, 100):
+        obj = pdfium_c.FPDFPageObj_NewTextObj(pdf.raw, b"Helvetica", ctypes.c_float(4))
+        text = ("x" * min(100, char_count - line) + "\0").encode("utf-16-le")
+        pdfium_c.FPDFText_SetText(obj, ctypes.cast(ctypes.c_char_p(text), ctypes.POINTER(pdfium_c.FPDF_WCHAR)))
+        pdfium_c.FPDFPageObj_Transform(obj, 1, 0, 0, 1, 10, height - 10 - (line // 100 % 150) * 5)
+        pdfium_c.FPDFPage_InsertObject(page.raw, obj)
+    pdfium_c.FPDFPage_GenerateContent(page.raw)
+    return page
+
+
+def test_render_scale_by_text_density(pdf):
+    """测试按文字密度选择 DPI：密集页面用最高 DPI，稀疏页面用最低 DPI，其余使用基础 DPI."""
+    # Letter 页面约 93.5 平方英寸
+    assert render_scale(_page(pdf, 5000), ADAPTIVE) == 220 / 72
+    assert render_scale(_page(pdf, 500), ADAPTIVE) == 100 / 72
+    assert render_scale(_page(pdf, 2000), ADAPTIVE) == 150 / 72
+
+
+def test_render_scale_scanned_page_uses_base_dpi(pdf):
+    """测试没有文字层的扫描页面无法判断字号，使用基础 DPI 而不是最低 DPI."""
+    assert render_scale(_page(pdf, 0), ADAPTIVE) == 150 / 72
+
+
+def test_render_scale_fixed_profile_ignores_density(pdf):
+    """测试未配置 DPI 范围时不按文字密度调整."""
+    assert render_scale(_page(pdf, 5000), FIXED) == 150 / 72
+    assert render_scale(_page(pdf, 500), FIXED) == 150 / 72
+
+
+def test_render_scale_max_side(pdf):
+    """测试配置了长边像素数时按页面长边缩放，与 DPI 无关."""
+    assert render_scale(_page(pdf, 0, 612, 792), THUMBNAIL_PROFILE) == 512 / 792
+    assert render_scale(_page(pdf, 5000, 842, 595), THUMBNAIL_PROFILE) == 512 / 842
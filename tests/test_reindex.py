@@ -0,0 +1,34 @@
+from services.reindex import _Progress
+
+
+def test_progress_saves_longest_completed_prefix():
+    """测试文档乱序完成时，进度位置只前进到最长的已完成前缀，中间未完成的文档在恢复时不会被跳过."""
+    progress = _Progress(last_document_id=10, indexed=5, failed=[3])
+    for document_id in (11, 12, 13, 14):
+        progress.dispatched(document_id)
+
+    progress.done(13, success=True)
+    assert progress.last_document_id == 10
+    progress.done(11, success=True)
+    assert progress.last_document_id == 11
+    progress.done(14, success=True)
+    assert progress.last_document_id == 11
+
+    progress.done(12, success=False)
+    assert progress.last_document_id == 14
+    assert progress.indexed == 8
+    assert progress.failed == [3, 12]
+
+
+def test_progress_stays_put_until_first_dispatched_document_completes():
+    """测试最早分发的文档未完成时，后续文档全部完成也不保存进度."""
+    progress = _Progress(last_document_id=0, indexed=0, failed=[])
+    for document_id in (5, 9, 20):
+        progress.dispatched(document_id)
+    progress.done(20, success=True)
+    progress.done(9, success=True)
+    assert progress.last_document_id == 0
+
+    progress.dispatched(21)
+    progress.done(5, success=True)
+    assert progress.last_document_id == 20
@@ -0,0 +1,109 @@
+from types import SimpleNamespace
+
+from database import JobStage
+from pipeline.reprocess import KEYWORDS, STAGES, build_stage_stamps, plan_reprocessing
+
+VERSIONS = {
+    JobStage.RENDER: "render-v1",
+    JobStage.EXTRACT: "extract-v1",
+    JobStage.TRANSLATE: "translate-v1",
+    JobStage.INDEX: "index-v1",
+    KEYWORDS: "keywords-v1",
+}
+
+
+def _document(**overrides):
+    values = {
+        "file_hash": "file-1",
+        "total_pages": 3,
+        "content_pages": {"0": "page zero", "1": "page one", "2": "page two"},
+        "translation_pages": {"0": "第零页", "1": "第一页", "2": "第二页"},
+        "keywords_pages": {"0": ["zero"], "1": ["one"], "2": ["two"]},
+    }
+    values.update(overrides)
+    return SimpleNamespace(**values)
+
+
+def _record(document, versions=VERSIONS):
+    return SimpleNamespace(stage_stamps=build_stage_stamps(document, versions))
+
+
+def test_unchanged_document_is_up_to_date():
+    """测试版本和输入都未变化时无需重新处理."""
+    document = _document()
+    plan = plan_reprocessing(document, _record(document), [0, 1, 2], VERSIONS)
+
+    assert plan.up_to_date
+    assert not plan.reset_keywords
+
+
+def test_missing_record_or_changed_file_reprocesses_everything():
+    """测试没有处理记录、文件变化或渲染方式变化时从头处理."""
+    document = _document()
+    record = _record(document)
+
+    assert plan_reprocessing(document, None, [0, 1, 2], VERSIONS).full
+    assert plan_reprocessing(_document(file_hash="file-2"), record, [0, 1, 2], VERSIONS).full
+    assert plan_reprocessing(document, record, [0, 1, 2], {**VERSIONS, JobStage.RENDER: "render-v2"}).full
+
+
+def test_extract_version_change_reextracts_pages_with_images():
+    """测试视觉模型变化时只重新识别有页面图片的页面，文字层页面保留文本."""
+    document = _document()
+    plan = plan_reprocessing(document, _record(document), [1], {**VERSIONS, JobStage.EXTRACT: "extract-v2"})
+
+    assert not plan.full
+    assert plan.completed_stages == [JobStage.RENDER]
+    assert plan.page_checkpoints[JobStage.EXTRACT] == [0, 2]
+    assert plan.page_checkpoints[JobStage.TRANSLATE] == [0, 2]
+
+
+def test_missing_text_without_image_reprocesses_everything():
+    """测试既没有文本也没有页面图片的页面只能从头处理."""
+    document = _document()
+    record = _record(document)
+    document.content_pages = {"0": "page zero", "1": "page one"}
+
+    assert plan_reprocessing(document, record, [0, 1], VERSIONS).full
+    assert not plan_reprocessing(document, record, [2], VERSIONS).full
+
+
+def test_translate_version_change_skips_render_and_extract():
+    """测试只修改翻译配置时跳过渲染和文本提取，重新翻译全部页面并重新索引."""
+    document = _document()
+    plan = plan_reprocessing(document, _record(document), [0, 1, 2], {**VERSIONS, JobStage.TRANSLATE: "translate-v2"})
+
+    assert plan.completed_stages == [JobStage.RENDER, JobStage.EXTRACT]
+    assert plan.page_checkpoints[JobStage.EXTRACT] == [0, 1, 2]
+    assert plan.page_checkpoints[JobStage.TRANSLATE] == []
+
+
+def test_changed_page_text_is_retranslated_alone():
+    """测试只有原文变化的页面被重新翻译."""
+    document = _document()
+    record = _record(document)
+    document.content_pages = {**document.content_pages, "1": "page one, corrected"}
+    plan = plan_reprocessing(document, record, [0, 1, 2], VERSIONS)
+
+    assert plan.completed_stages == [JobStage.RENDER, JobStage.EXTRACT]
+    assert plan.page_checkpoints[JobStage.TRANSLATE] == [0, 2]
+
+
+def test_index_version_change_only_reindexes():
+    """测试只更换嵌入模型时只重新索引."""
+    document = _document()
+    plan = plan_reprocessing(document, _record(document), [0, 1, 2], {**VERSIONS, JobStage.INDEX: "index-v2"})
+
+    assert plan.completed_stages == [JobStage.RENDER, JobStage.EXTRACT, JobStage.TRANSLATE]
+    assert set(plan.completed_stages) | {JobStage.INDEX} == set(STAGES)
+    assert not plan.reset_keywords
+
+
+def test_keyword_extractor_change_resets_keywords():
+    """测试关键词提取方式变化时清空已有关键词."""
+    document = _document()
+    versions = {**VERSIONS, JobStage.INDEX: "index-v2", KEYWORDS: "keywords-v2"}
+    plan = plan_reprocessing(document, _record(document), [0, 1, 2], versions)
+
+    assert plan.reset_keywords
+    assert JobStage.INDEX not in plan.completed_stages
@@ -0,0 +1,76 @@
+from datetime import datetime, timedelta
+
+from database import JobPriority
+from pipeline import scheduler
+from pipeline.scheduler import FairQueue, effective_priority
+
+
+def test_effective_priority_ages_with_queue_time(monkeypatch):
+    """测试排队时间每超过一个老化周期优先级提升一级，且不超过最高优先级."""
+    monkeypatch.setattr(scheduler.settings, "PIPELINE_PRIORITY_AGING_SECONDS", 600)
+    now = datetime(2024, 1, 1, 12, 0, 0)
+
+    assert effective_priority(JobPriority.BULK, now - timedelta(seconds=599), now) == JobPriority.BULK
+    assert effective_priority(JobPriority.BULK, now - timedelta(seconds=600), now) == JobPriority.NORMAL
+    assert effective_priority(JobPriority.BULK, now - timedelta(seconds=1200), now) == JobPriority.INTERACTIVE
+    assert effective_priority(JobPriority.BULK, now - timedelta(days=1), now) == JobPriority.INTERACTIVE
+    assert effective_priority(JobPriority.NORMAL, None, now) == JobPriority.NORMAL
+
+
+def test_effective_priority_without_aging(monkeypatch):
+    """测试关闭老化后优先级保持不变."""
+    monkeypatch.setattr(scheduler.settings, "PIPELINE_PRIORITY_AGING_SECONDS", 0)
+    now = datetime(2024, 1, 1, 12, 0, 0)
+
+    assert effective_priority(JobPriority.BULK, now - timedelta(days=1), now) == JobPriority.BULK
+
+
+def test_fair_queue_serves_owner_with_least_cost():
+    """测试公平排队把下一个任务交给累计开销最小的用户."""
+    queue = FairQueue()
+    assert queue.order([2, 1]) == [1, 2]
+
+    queue.charge(1, 10)
+    assert queue.order([1, 2]) == [2, 1]
+
+    queue.charge(2, 1)
+    queue.charge(2, 1)
+    assert queue.order([1, 2]) == [2, 1]
+
+
+def test_fair_queue_bulk_owner_does_not_starve_others():
+    """测试一个用户批量排队时，其他用户的任务仍按开销比例被交替领取."""
+    queue = FairQueue()
+    served = []
+    for _ in range(6):
+        owner = queue.order([1, 2])[0]
+        queue.charge(owner, 1)
+        served.append(owner)
+
+    assert served.count(1) == served.count(2) == 3
+
+
+def test_fair_queue_idle_owner_does_not_bank_credit():
+    """测试空闲后重新排队的用户从当前虚拟时间开始，不能一次占用积累的额度."""
+    queue = FairQueue()
+    for _ in range(5):
+        queue.order([1])
+        queue.charge(1, 1)
+
+    queue.order([1, 2])
+    queue.charge(2, 1)
+    assert queue.finish_times[2] == queue.virtual_time + 1
+    assert queue.order([1, 2]) == [1, 2]
+
+
+def test_fair_queue_forgets_idle_owners():
+    """测试不再排队且没有未结算开销的用户被清理."""
+    queue = FairQueue()
+    queue.order([1, 2])
+    queue.charge(1, 1)
+    queue.charge(2, 1)
+    queue.order([1])
+    queue.charge(1, 1)
+
+    queue.order([1])
+    assert 2 not in queue.finish_times
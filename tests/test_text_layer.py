@@ -0,0 +1,111 @@
+import zlib
+
+import pypdfium2 as pdfium
+
+from prepdocs.text_layer import PageKind, classify_page, extract_page_text, normalize_markdown
+
+HELVETICA = b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"
+# 字形名称无法映射到 Unicode 的字体，模拟缺少 ToUnicode 的子集字体
+UNMAPPED_FONT = (
+    b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica"
+    b" /Encoding << /Type /Encoding /Differences [1 /g1 /g2 /g3 /g4] >> >>"
+)
+TEXT_LINES = [b"(Line %d of a native text page about retrieval systems and embeddings.) Tj" % i for i in range(40)]
+UNMAPPED_LINES = [b"(" + bytes([1, 2, 3, 4]) * 20 + b") Tj" for _ in range(10)]
+
+
+def _build_pdf(content: bytes, resources: bytes, *objects: bytes) -> pdfium.PdfDocument:
+    """生成单页 PDF，页面内容流为 content，附加对象从 5 号开始编号."""
+    objects = (
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources " + resources + b" /Contents 4 0 R >>",
+        b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream",
+        *objects,
+    )
+    data = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, obj in enumerate(objects, start=1):
+        offsets.append(len(data))
+        data += b"%d 0 obj\n" % number + obj + b"\nendobj\n"
+    xref = len(data)
+    data += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    data += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    data += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return pdfium.PdfDocument(bytes(data))
+
+
+def _text_content(*lines: bytes) -> bytes:
+    return b"BT /F1 11 Tf 14 TL 50 740 Td " + b" T* ".join(lines) + b" ET"
+
+
+def _classify(pdf: pdfium.PdfDocument):
+    page = pdf[0]
+    textpage = page.get_textpage()
+    try:
+        return classify_page(page, textpage)
+    finally:
+        textpage.close()
+        page.close()
+
+
+def test_text_page_is_extracted_directly():
+    """测试文字层完整的页面直接提取文本，不交给视觉模型."""
+    pdf = _build_pdf(_text_content(*TEXT_LINES), b"<< /Font << /F1 5 0 R >> >>", HELVETICA)
+
+    classification = _classify(pdf)
+    assert classification.kind == PageKind.TEXT
+    assert classification.image_coverage == 0
+    text = extract_page_text(pdf, 0)
+    assert text.startswith("Line 0 of a native text page")
+    assert "Line 39 of a native text page" in text
+
+
+def test_scanned_page_goes_to_vision():
+    """测试只有整页图片、没有文字层的扫描页交给视觉模型."""
+    image = zlib.compress(bytes(range(256)) * 192)
+    pdf = _build_pdf(
+        b"q 612 0 0 792 0 0 cm /Im1 Do Q",
+        b"<< /XObject << /Im1 5 0 R >> >>",
+        b"<< /Type /XObject /Subtype /Image /Width 128 /Height 128 /ColorSpace /DeviceRGB /BitsPerComponent 8"
+        b" /Filter /FlateDecode /Length %d >>\nstream\n" % len(image) + image + b"\nendstream",
+    )
+
+    classification = _classify(pdf)
+    assert classification.kind == PageKind.VISION
+    assert classification.char_count == 0
+    assert classification.image_coverage == 1.0
+    assert extract_page_text(pdf, 0) is None
+
+
+def test_unmapped_glyph_page_goes_to_vision():
+    """测试文字足够但部分字形无法映射到 Unicode 的页面交给视觉模型，避免提取出乱码."""
+    content = _text_content(*TEXT_LINES[:30], b"/F2 11 Tf", *UNMAPPED_LINES)
+    pdf = _build_pdf(content, b"<< /Font << /F1 5 0 R /F2 6 0 R >> >>", HELVETICA, UNMAPPED_FONT)
+
+    classification = _classify(pdf)
+    assert classification.char_count >= 200
+    assert classification.unmapped_ratio > 0.02
+    assert classification.kind == PageKind.VISION
+    assert extract_page_text(pdf, 0) is None
+
+
+def test_normalize_markdown_merges_wrapped_lines():
+    """测试规整文本时合并折行和断词连字符、去掉页码，并统一项目符号."""
+    text = "\r\n".join(
+        [
+            "12",
+            "Retrieval augmented generation combines a search step with a lan-",
+            "guage model so that answers can cite the source documents.",
+            "• first item",
+            "2) second item.",
+            "中文段落在折行时",
+            "不应插入空格。",
+            "iv",
+        ]
+    )
+
+    assert normalize_markdown(text) == (
+        "Retrieval augmented generation combines a search step with a language model so that answers can cite "
+        "the source documents.\n\n- first item\n\n2) second item.\n\n中文段落在折行时不应插入空格。"
+    )
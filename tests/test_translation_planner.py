@@ -0,0 +1,75 @@
+from prepdocs.translation_planner import MARKER_TOKENS, Batch, Segment, estimate_tokens, plan_batches, split_text
+
+
+def _batch_tokens(batch: Batch) -> int:
+    return sum(estimate_tokens(segment.text) + MARKER_TOKENS for segment in batch.segments)
+
+
+def test_short_pages_share_one_batch():
+    """测试预算以内的短页面合并为一个批次，并保持页码顺序."""
+    pages = [(0, "First page."), (1, "Second page."), (2, "Third page.")]
+    batches = plan_batches(pages, max_tokens=200)
+
+    assert len(batches) == 1
+    assert [segment.page_index for segment in batches[0].segments] == [0, 1, 2]
+
+
+def test_batches_respect_token_budget():
+    """测试批次不超过 token 预算，每个片段只属于一个批次."""
+    pages = [(i, f"Paragraph {i}. " * 20) for i in range(10)]
+    batches = plan_batches(pages, max_tokens=150)
+
+    assert len(batches) > 1
+    assert all(_batch_tokens(batch) <= 150 or len(batch.segments) == 1 for batch in batches)
+    assert [segment.page_index for batch in batches for segment in batch.segments] == list(range(10))
+
+
+def test_long_page_is_split_and_reassembles():
+    """测试超长页面按段落拆分为多个片段，按分隔符拼接后与原文一致."""
+    text = "\n\n".join(f"Paragraph {i} " + "word " * 40 for i in range(6))
+    batches = plan_batches([(0, text)], max_tokens=80)
+    segments = [segment for batch in batches for segment in batch.segments]
+
+    assert len(segments) > 1
+    assert [segment.part for segment in segments] == list(range(len(segments)))
+    assert segments[0].separator == ""
+    assert "".join(segment.separator + segment.text for segment in segments) == text
+
+
+def test_split_text_falls_back_to_sentences_and_characters():
+    """测试没有换行时按句子拆分，连续无标点的文本按字符截断."""
+    sentences = "这是第一句。" * 30
+    parts = split_text(sentences, 40)
+    assert len(parts) > 1
+    assert "".join(separator + part for separator, part in parts) == sentences
+    assert all(estimate_tokens(part) <= 40 for _, part in parts)
+
+    unbroken = "字" * 200
+    parts = split_text(unbroken, 50)
+    assert len(parts) > 1
+    assert "".join(part for _, part in parts) == unbroken
+
+
+def test_context_comes_from_previous_page():
+    """测试批次附带前一页末尾的原文作为上下文，不在本次规划中的前一页通过 context_for 取得."""
+    pages = [(3, "alpha " * 30), (4, "beta " * 30)]
+    batches = plan_batches(pages, max_tokens=60, overlap_chars=20, context_for={2: "previous page tail"}.get)
+
+    assert len(batches) == 2
+    assert batches[0].context == "previous page tail"
+    assert set(batches[1].context.split()) == {"alpha"}
+    assert len(batches[1].context) <= 20
+
+
+def test_parse_response_maps_segments_by_marker():
+    """测试按分隔标记把译文映射回片段，标记缺失或乱序时返回 None."""
+    batch = Batch(segments=[Segment(page_index=0, text="one"), Segment(page_index=1, text="two")], context="ctx")
+    message = batch.build_message()
+    assert message.index("<<<CONTEXT>>>") < message.index("<<<SEGMENT 1>>>") < message.index("<<<SEGMENT 2>>>")
+
+    assert batch.parse_response("<<<SEGMENT 1>>>\n一\n<<<SEGMENT 2>>>\n二\n") == ["一", "二"]
+    assert batch.parse_response("<<<SEGMENT 2>>>\n二\n<<<SEGMENT 1>>>\n一") is None
+    assert batch.parse_response("一 二") is None
+
+    single = Batch(segments=[Segment(page_index=0, text="one")])
+    assert single.parse_response("一") == ["一"]
@@ -0,0 +1,105 @@
+import asyncio
+import hashlib
+from io import BytesIO
+
+import pytest
+from fastapi import FastAPI, File, UploadFile
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import models.users  # noqa: F401  注册 users 表，供 documents 表的外键使用
+from database import Base, Document, ProcessingStatus
+from services.upload_service import UploadSizeLimitMiddleware, UploadTooLargeError, find_duplicate, spool_upload
+
+
+def _upload(data: bytes, size=None) -> UploadFile:
+    return UploadFile(file=BytesIO(data), filename="test.pdf", size=size)
+
+
+def test_spool_upload_hashes_and_keeps_content(monkeypatch):
+    """测试按块写入临时文件时计算的哈希和大小与完整内容一致."""
+    monkeypatch.setattr("services.upload_service.CHUNK_SIZE", 7)
+    data = b"%PDF-1.7 " + bytes(range(256)) * 10
+
+    spooled = asyncio.run(spool_upload(_upload(data), max_size=len(data)))
+    try:
+        assert spooled.size == len(data)
+        assert spooled.sha256 == hashlib.sha256(data).hexdigest()
+        assert spooled.read() == data
+    finally:
+        spooled.close()
+
+
+def test_spool_upload_rejects_oversized_file():
+    """测试声明的大小或实际读取的大小超过限制时抛出 UploadTooLargeError."""
+    with pytest.raises(UploadTooLargeError):
+        asyncio.run(spool_upload(_upload(b"x", size=100), max_size=10))
+    with pytest.raises(UploadTooLargeError):
+        asyncio.run(spool_upload(_upload(b"x" * 11), max_size=10))
+
+
+def _document(document_id: int, file_hash: str, **kwargs) -> Document:
+    return Document(
+        id=document_id,
+        filename=f"{document_id}.pdf",
+        content_type="application/pdf",
+        file_data=b"",
+        file_size=0,
+        file_hash=file_hash,
+        owner_id=1,
+        path=f"/{document_id}.pdf",
+        **kwargs,
+    )
+
+
+def test_find_duplicate_matches_same_owner_folder_and_filename():
+    """测试只有同一用户、同一文件夹下文件名和内容都相同且未处理失败的文档才视为重复上传."""
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine, tables=[models.users.User.__table__, Document.__table__])
+    db = sessionmaker(bind=engine)()
+    try:
+        db.add_all(
+            [
+                _document(1, "h1"),
+                _document(2, "h2", processing_status=ProcessingStatus.FAILED),
+                _document(3, "h2"),
+            ]
+        )
+        db.commit()
+
+        assert find_duplicate(db, 1, None, "1.pdf", "h1").id == 1
+        assert find_duplicate(db, 1, None, "renamed.pdf", "h1") is None
+        assert find_duplicate(db, 2, None, "1.pdf", "h1") is None
+        assert find_duplicate(db, 1, 5, "1.pdf", "h1") is None
+        assert find_duplicate(db, 1, None, "2.pdf", "h2") is None
+        assert find_duplicate(db, 1, None, "3.pdf", "h2").id == 3
+    finally:
+        db.close()
+        engine.dispose()
+
+
+def test_size_limit_middleware_only_checks_upload_paths():
+    """测试上传接口的请求体超过大小限制时在进入路由之前返回 413，其他接口不受限制."""
+    api_app = FastAPI()
+    api_app.add_middleware(UploadSizeLimitMiddleware, max_size_mb=1, paths=["/upload"])
+
+    @api_app.post("/upload")
+    async def upload(file: UploadFile = File(...)):
+        return {"size": len(await file.read())}
+
+    @api_app.post("/notes")
+    async def notes(file: UploadFile = File(...)):
+        return {"size": len(await file.read())}
+
+    app = FastAPI()
+    app.mount("/api", api_app)
+    client = TestClient(app)
+    small = {"file": ("a.pdf", b"x" * 1024)}
+    large = {"file": ("a.pdf", b"x" * (2 * 1024 * 1024))}
+
+    response = client.post("/api/upload", files=small)
+    assert response.status_code == 200
+    assert response.json() == {"size": 1024}
+    assert client.post("/api/upload", files=large).status_code == 413
+    assert client.post("/api/notes", files=large).status_code == 200
@@ -0,0 +1,91 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import models.users  # noqa: F401  注册 users 表，供任务表的外键使用
+from database import Base, JobPriority, JobStatus, ProcessingJob
+from pipeline import scheduler, worker
+from pipeline.worker import PipelineWorker
+
+
+@pytest.fixture
+def session_factory(monkeypatch):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    factory = sessionmaker(bind=engine)
+
+    def get_db():
+        db = factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    monkeypatch.setattr(worker, "get_db", get_db)
+    monkeypatch.setattr(worker.settings, "PIPELINE_MAX_IN_FLIGHT", 0)
+    yield factory
+    engine.dispose()
+
+
+def _add_jobs(db, *jobs):
+    """添加任务，每个任务为 (任务ID, 用户ID, 优先级, 已排队秒数)."""
+    now = datetime.now()
+    for job_id, owner_id, priority, queued_seconds in jobs:
+        queued_at = now - timedelta(seconds=queued_seconds)
+        db.add(
+            ProcessingJob(
+                id=job_id,
+                document_id=job_id,
+                owner_id=owner_id,
+                priority=priority,
+                status=JobStatus.QUEUED,
+                created_at=queued_at,
+                updated_at=queued_at,
+            )
+        )
+    db.commit()
+
+
+def test_lease_job_takes_aged_job_of_same_owner(session_factory, monkeypatch):
+    """测试同一用户持续提交高优先级任务时，排队足够久的低优先级任务仍会被领取."""
+    monkeypatch.setattr(scheduler.settings, "PIPELINE_PRIORITY_AGING_SECONDS", 600)
+    db = session_factory()
+    _add_jobs(
+        db, (1, 1, JobPriority.INTERACTIVE, 10), (2, 1, JobPriority.BULK, 3600), (3, 1, JobPriority.INTERACTIVE, 5)
+    )
+
+    pipeline_worker = PipelineWorker(pipeline=None)
+    assert pipeline_worker._lease_job() == 2
+    assert pipeline_worker._lease_job() == 1
+    assert pipeline_worker._lease_job() == 3
+    assert pipeline_worker._lease_job() is None
+    db.close()
+
+
+def test_lease_job_prefers_raw_priority_without_aging(session_factory, monkeypatch):
+    """测试关闭老化后按原始优先级领取任务."""
+    monkeypatch.setattr(scheduler.settings, "PIPELINE_PRIORITY_AGING_SECONDS", 0)
+    db = session_factory()
+    _add_jobs(db, (1, 1, JobPriority.BULK, 3600), (2, 1, JobPriority.INTERACTIVE, 5))
+
+    pipeline_worker = PipelineWorker(pipeline=None)
+    assert pipeline_worker._lease_job() == 2
+    assert pipeline_worker._lease_job() == 1
+    db.close()
+
+
+def test_lease_job_respects_in_flight_limit(session_factory, monkeypatch):
+    """测试所有工作器在途任务数达到全局上限时不再领取任务，统计前先获取在途锁."""
+    monkeypatch.setattr(worker.settings, "PIPELINE_MAX_IN_FLIGHT", 1)
+    locked = []
+    monkeypatch.setattr(worker, "lock_in_flight", lambda db: locked.append(db))
+    db = session_factory()
+    _add_jobs(db, (1, 1, JobPriority.NORMAL, 20), (2, 2, JobPriority.NORMAL, 10))
+
+    assert PipelineWorker(pipeline=None)._lease_job() == 1
+    assert PipelineWorker(pipeline=None)._lease_job() is None
+    assert len(locked) == 2
+    db.close()